@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .config import settings
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Entries carry tags so writers can drop exactly the entries that depend on
+    the rows they changed. The cache is per process: other workers see a
+    change once their own copy expires.
+
+    A reader that misses takes :meth:`generation` before querying and passes
+    it to :meth:`set`, which then drops the value if one of its tags was
+    invalidated in between: the read may predate that write.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._tags: dict[str, set] = {}
+        # Generation of each tag's latest invalidation; reads older than
+        # _floor are refused outright once this is trimmed or cleared.
+        self._generation = self._floor = 0
+        self._invalidated: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value, _ = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, tags=(), generation: int | None = None):
+        if self.maxsize <= 0:
+            return
+        tags = frozenset(tags)
+        with self._lock:
+            if generation is not None and (generation < self._floor or any(self._invalidated.get(tag, 0) > generation for tag in tags)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            if len(self._invalidated) + len(tags) > self.maxsize:
+                self._invalidated.clear()
+                self._floor = self._generation
+            self._invalidated.update(dict.fromkeys(tags, self._generation))
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._invalidated.clear()
+            self._generation += 1
+            self._floor = self._generation
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+
+catalog = TTLCache(settings.catalog_cache_max_entries, settings.catalog_cache_ttl_seconds)
+# Short-lived: claims in other workers only show up once an entry expires.
+slots = TTLCache(settings.catalog_cache_max_entries, settings.slot_availability_ttl_seconds)
+identities = TTLCache(settings.identity_cache_max_entries, settings.identity_cache_ttl_seconds)
+
+
+def product_tag(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+def user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
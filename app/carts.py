@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+from .db import SessionLocal, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+carts = models.Cart.__table__
+
+CHUNK_SIZE = 500
+
+
+class Cart:
+    __slots__ = ("items", "version")
+
+    def __init__(self, items: dict[int, int], version: int):
+        self.items = items
+        self.version = version
+
+
+class CartStore:
+    """Active carts by user id, changed in memory and written behind.
+
+    Mutations mark a cart dirty; :meth:`flush` upserts every dirty cart in
+    one transaction. A cart missing from memory is read back from ``carts``
+    on first use. Clean carts beyond ``maxsize`` are dropped oldest first.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._carts: OrderedDict[int, Cart] = OrderedDict()
+        self._dirty: set[int] = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._carts
+
+    def load(self, db: Session, user_id: int):
+        # Read outside the lock: under the async engine the query yields to
+        # the event loop, where another request may need the lock.
+        row = db.execute(select(carts.c.lines, carts.c.version).where(carts.c.user_id == user_id)).first()
+        cart = Cart({int(k): v for k, v in json.loads(row.lines).items()}, row.version) if row else Cart({}, 0)
+        with self._lock:
+            if user_id not in self._carts:
+                self._carts[user_id] = cart
+                self._evict()
+
+    def snapshot(self, user_id: int) -> tuple[dict[int, int], int]:
+        with self._lock:
+            cart = self._carts[user_id]
+            self._carts.move_to_end(user_id)
+            return dict(cart.items), cart.version
+
+    def add(self, user_id: int, product_id: int, quantity: int) -> int:
+        with self._lock:
+            cart = self._carts[user_id]
+            quantity = min(cart.items.get(product_id, 0) + quantity, settings.cart_max_quantity)
+            self._change(user_id, cart, product_id, quantity)
+            return quantity
+
+    def set_quantity(self, user_id: int, product_id: int, quantity: int):
+        with self._lock:
+            self._change(user_id, self._carts[user_id], product_id, quantity)
+
+    def checked_out(self, user_id: int, ordered: dict[int, int], version: int):
+        """Empty the cart after its ``version`` was ordered and written as empty at ``version + 1``.
+
+        Lines added while the order was being placed stay in the cart.
+        """
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None:
+                return
+            if cart.version == version:
+                cart.items, cart.version = {}, version + 1
+                self._dirty.discard(user_id)
+                return
+            for product_id, quantity in ordered.items():
+                self._change(user_id, cart, product_id, cart.items.get(product_id, 0) - quantity)
+
+    def _change(self, user_id: int, cart: Cart, product_id: int, quantity: int):
+        if quantity > 0:
+            cart.items[product_id] = quantity
+        else:
+            cart.items.pop(product_id, None)
+        cart.version += 1
+        self._dirty.add(user_id)
+        self._carts.move_to_end(user_id)
+
+    def _evict(self):
+        for user_id in list(self._carts):
+            if len(self._carts) <= self.maxsize:
+                break
+            if user_id not in self._dirty:
+                del self._carts[user_id]
+
+    def flush(self, db: Session) -> int:
+        with self._lock:
+            pending = [(user_id, dict(self._carts[user_id].items), self._carts[user_id].version) for user_id in self._dirty]
+        if not pending:
+            return 0
+        write(db, pending)
+        db.commit()
+        with self._lock:
+            for user_id, _, version in pending:
+                cart = self._carts.get(user_id)
+                if cart is not None and cart.version == version:
+                    self._dirty.discard(user_id)
+            self._evict()
+        return len(pending)
+
+
+def write(db: Session, pending: list[tuple[int, dict[int, int], int]]) -> int:
+    """Upsert ``(user_id, items, version)`` rows; a row already at a newer version is kept.
+
+    Returns the number of rows written.
+    """
+    now = datetime.utcnow()
+    written = 0
+    for start in range(0, len(pending), CHUNK_SIZE):
+        insert = dialect_insert(db.get_bind(), carts).values([
+            {"user_id": user_id, "lines": json.dumps(items), "version": version, "updated_at": now}
+            for user_id, items, version in pending[start:start + CHUNK_SIZE]
+        ])
+        written += db.execute(insert.on_conflict_do_update(
+            index_elements=[carts.c.user_id],
+            set_={"lines": insert.excluded.lines, "version": insert.excluded.version, "updated_at": insert.excluded.updated_at},
+            where=carts.c.version < insert.excluded.version,
+        )).rowcount
+    return written
+
+
+store = CartStore(settings.cart_max_entries)
+
+
+def flush():
+    with SessionLocal() as db:
+        return store.flush(db)
+
+
+async def run_flusher():
+    while True:
+        await asyncio.sleep(settings.cart_flush_seconds)
+        try:
+            await run_in_threadpool(flush)
+        except Exception:
+            logger.exception("cart flush failed")
@@ -0,0 +1,201 @@
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+
+import anyio
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import models, schemas, versioning
+from .config import settings
+from .db import Base, SessionLocal, dialect_insert, engine
+
+products = models.Product.__table__
+FIELDS = list(schemas.ProductCreate.model_fields)
+EXPORT_FIELDS = ["id", *FIELDS]
+EXPORT_CHUNK = 1000
+
+
+def read_csv(fileobj):
+    """Yield ``(row_number, values)`` from a binary CSV stream, one line at a time."""
+    reader = csv.DictReader(codecs.iterdecode(fileobj, "utf-8-sig"))
+    for row in reader:
+        yield reader.line_num, {k: (v if v != "" else None) for k, v in row.items() if k is not None}
+
+
+def read_ndjson(fileobj):
+    for number, line in enumerate(fileobj, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as exc:
+                yield number, exc
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+class ReceivedStream(io.RawIOBase):
+    """Binary file over the chunks of an anyio memory stream, read on a worker thread.
+
+    Each read blocks until the event loop sends the next chunk; the sender
+    closing the stream is end of file.
+    """
+
+    def __init__(self, receive):
+        self._receive = receive
+        self._chunk = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            try:
+                self._chunk = anyio.from_thread.run(self._receive.receive)
+            except anyio.EndOfStream:
+                return 0
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def import_products(db: Session, rows, batch_size: int | None = None) -> dict:
+    """Validate rows with ``ProductCreate`` and upsert them by SKU.
+
+    Rows are written with one executemany per ``batch_size`` rows, each batch
+    committed on its own, so memory stays flat however long the feed is. A
+    batch the database rejects is retried row by row, and the rows that still
+    fail are reported like invalid ones.
+    """
+    batch_size = batch_size or settings.import_batch_size
+    report = {"rows": 0, "upserted": 0, "failed": 0, "errors": []}
+    batch = []
+    for number, raw in rows:
+        report["rows"] += 1
+        parsed = _parse_row(raw)
+        if isinstance(parsed, dict):
+            batch.append((number, parsed))
+        else:
+            _fail(report, number, parsed)
+        if len(batch) >= batch_size:
+            _write(db, batch, report)
+            batch = []
+    if batch:
+        _write(db, batch, report)
+    return report
+
+
+def _fail(report: dict, number: int, errors: list):
+    report["failed"] += 1
+    if len(report["errors"]) < settings.import_max_reported_errors:
+        report["errors"].append({"row": number, "errors": errors})
+
+
+def _write(db: Session, batch: list[tuple[int, dict]], report: dict):
+    try:
+        report["upserted"] += _upsert(db, [values for _, values in batch])
+        return
+    except DBAPIError:
+        db.rollback()
+    for number, values in batch:
+        try:
+            report["upserted"] += _upsert(db, [values])
+        except DBAPIError as exc:
+            db.rollback()
+            _fail(report, number, [{"type": "database_error", "msg": str(exc.orig)}])
+
+
+def _parse_row(raw):
+    """Return the row's column values, or a list of validation errors."""
+    if isinstance(raw, Exception):
+        return [{"type": "json_invalid", "msg": str(raw)}]
+    if not isinstance(raw, dict):
+        return [{"type": "model_type", "msg": "Row must be an object"}]
+    try:
+        product = schemas.ProductCreate.model_validate(raw)
+    except ValidationError as exc:
+        return exc.errors(include_url=False, include_context=False, include_input=False)
+    if not product.sku:
+        return [{"type": "missing", "loc": ["sku"], "msg": "sku is required to import a product"}]
+    return product.model_dump()
+
+
+def _upsert(db: Session, batch: list[dict]) -> int:
+    insert = dialect_insert(db.get_bind(), products)
+    db.execute(
+        insert.on_conflict_do_update(
+            index_elements=[products.c.sku],
+            set_={field: insert.excluded[field] for field in FIELDS if field != "sku"},
+        ),
+        batch,
+    )
+    versioning.bump(db, "products")
+    db.commit()
+    return len(batch)
+
+
+def export_products(fmt: str):
+    """Yield the catalog as CSV or NDJSON text, reading it in id-ordered chunks."""
+    columns = [products.c[field] for field in EXPORT_FIELDS]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            rows = db.execute(select(*columns).where(products.c.id > last_id).order_by(products.c.id).limit(EXPORT_CHUNK)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            if fmt == "csv":
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield "".join(json.dumps(dict(row._mapping)) + "\n" for row in rows)
+            # Release the connection between chunks rather than pinning one
+            # read snapshot for the whole export.
+            db.rollback()
+    if fmt == "csv" and buffer.tell():
+        yield buffer.getvalue()
+
+
+def import_file(path: str, fmt: str) -> dict:
+    with open(path, "rb") as fileobj, SessionLocal() as db:
+        return import_products(db, READERS[fmt](fileobj))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.catalog_io", description="Bulk catalog import and export.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="upsert products by sku from a CSV or NDJSON file")
+    importer.add_argument("path")
+    exporter = commands.add_parser("export", help="write the catalog to a file, or stdout with -")
+    exporter.add_argument("path")
+    for command in (importer, exporter):
+        command.add_argument("--format", choices=sorted(READERS), help="defaults to the file extension")
+    args = parser.parse_args()
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    Base.metadata.create_all(bind=engine)
+    if args.command == "import":
+        report = import_file(args.path, fmt)
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        sys.exit(1 if report["failed"] else 0)
+    out = sys.stdout if args.path == "-" else open(args.path, "w", newline="")
+    with out:
+        for chunk in export_products(fmt):
+            out.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from sqlalchemy.orm import Session
+
+from . import cache, models, outbox, promotions, reservations, rollups
+
+
+def place_order(db: Session, user_id: int, items, promo_code: str | None = None, promos: promotions.Index | None = None) -> models.Order:
+    """Reserve stock and add the order, its lines and its ``order.placed`` message to the caller's transaction.
+
+    ``promo_code`` is priced against ``promos`` (from :func:`promotions.index`)
+    and counted against its limits. Raises
+    :class:`reservations.StockReservationError` or
+    :class:`promotions.PromotionError`; the caller must roll back. Call
+    :func:`placed` once the transaction has committed.
+    """
+    products = reservations.reserve_stock(db, items)
+    order = models.Order(user_id=user_id, status=models.OrderStatusEnum.PLACED)
+    db.add(order)
+    lines = []
+    for item in items:
+        product = products[item.product_id]
+        db.add(models.OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=product.price, category_id=product.category_id))
+        lines.append((item.product_id, product.category_id, product.price, item.quantity))
+    subtotal = sum(price * quantity for _, _, price, quantity in lines)
+    discount = 0
+    if promo_code:
+        rule, discount = promos.quote(promo_code, lines, subtotal)
+        promotions.redeem(db, rule, user_id)
+    order.total = subtotal - discount
+    db.flush()
+    day = order.created_at.date()
+    rollups.record(db, [(day, order.id, order.total, product_id, category_id, quantity, price) for product_id, category_id, price, quantity in lines])
+    outbox.enqueue(db, "order.placed", {"order_id": order.id, "user_id": user_id, "total": order.total})
+    return order
+
+
+def placed(order: models.Order):
+    outbox.notify()
+    cache.catalog.invalidate(*(cache.product_tag(item.product_id) for item in order.items))
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -5,5 +7,96 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_minutes: int = 60 * 24 * 7
+    # "async" drives the aiosqlite engine from the event loop; "sync" runs the
+    # blocking engine on the threadpool.
+    database_mode: Literal["sync", "async"] = "async"
+    database_url: str = "sqlite:///./test.db"
+    # Derived from database_url when unset (sqlite -> sqlite+aiosqlite).
+    async_database_url: str | None = None
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+    catalog_cache_max_entries: int = 2048
+    catalog_cache_ttl_seconds: float = 60
+    table_version_ttl_seconds: float = 1
+    revocation_bloom_capacity: int = 100_000
+    revocation_bloom_error_rate: float = 0.001
+    # How often each worker picks up tokens revoked by other workers, and how
+    # often rows for already-expired tokens are deleted.
+    revocation_sync_seconds: float = 5
+    revocation_sweep_seconds: float = 300
+    # Each sync re-reads revocations this far back, for rows committed late.
+    revocation_sync_overlap_seconds: float = 60
+    # Users resolved from access tokens, per worker. Writes in this worker
+    # drop the entry at once; other workers see them within the TTL.
+    identity_cache_max_entries: int = 10_000
+    identity_cache_ttl_seconds: float = 30
+    bcrypt_rounds: int = 12
+    # 0 hashes on the default thread executor instead of a process pool.
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 64
+    import_batch_size: int = 1000
+    # Only the first errors are reported; the rest are counted in "failed".
+    import_max_reported_errors: int = 1000
+    media_root: str = "media"
+    media_max_upload_bytes: int = 5 * 1024 * 1024
+    slot_availability_ttl_seconds: float = 2
+    # Side effects (mail) are queued in outbox_messages with the business
+    # change and delivered by a worker: in-process when enabled, or
+    # `python -m app.outbox`.
+    outbox_worker_enabled: bool = True
+    outbox_batch_size: int = 100
+    outbox_concurrency: int = 8
+    outbox_poll_seconds: float = 1
+    # A claimed message is retried by any worker once its lease runs out.
+    outbox_lease_seconds: float = 60
+    outbox_max_attempts: int = 8
+    outbox_backoff_seconds: float = 2
+    outbox_backoff_max_seconds: float = 600
+    # Sent messages are deleted this long after delivery; dead ones are kept.
+    outbox_retention_days: float = 7
+    # Carts change in memory and are written to `carts` every
+    # cart_flush_seconds, so a crash loses at most that much. Workers do not
+    # see each other's unflushed carts: keep a user on one worker.
+    cart_flush_seconds: float = 2
+    cart_max_entries: int = 100_000
+    cart_max_quantity: int = 99
+    # Orders aggregated per INSERT ... SELECT by `python -m app.rollups rebuild`.
+    rollup_rebuild_batch_orders: int = 50_000
+    # Read by `python -m app.related build`; /products/{id}/related serves
+    # what the last run stored.
+    related_top_k: int = 20
+    related_metric: Literal["cosine", "lift"] = "cosine"
+    # Pairs bought together fewer times are not recommended.
+    related_min_orders: int = 2
+    # Bigger orders (bulk buys) are skipped: they add size² pairs of noise.
+    related_max_basket: int = 50
+    related_batch_orders: int = 50_000
+    # Orders placed this recently wait for the next build, so one committing
+    # late under a lower id than a counted one is not skipped for good.
+    related_settle_seconds: float = 300
+    mail_transport: Literal["console", "memory", "smtp"] = "console"
+    mail_from: str = "no-reply@freshcart.example"
+    smtp_host: str = "localhost"
+    smtp_port: int = 587
+    smtp_username: str | None = None
+    smtp_password: str | None = None
+    smtp_starttls: bool = True
+    smtp_timeout_seconds: float = 10
+    # With several uvicorn workers, each writes its counters here every
+    # metrics_flush_seconds and /metrics sums all of them.
+    metrics_dir: str | None = None
+    metrics_flush_seconds: float = 5
+    # Record statement shapes per request and log likely N+1 patterns.
+    query_diagnostics: bool = False
+    n_plus_one_threshold: int = 5
+    # Log statements slower than this, with their query plan; None disables.
+    slow_query_ms: float | None = None
 
 settings = Settings()
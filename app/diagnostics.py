@@ -0,0 +1,127 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)|\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)*\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def shape(statement: str) -> str:
+    """Collapse literals and ``IN (?, ?, ...)`` lists so statements differing only in values compare equal."""
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(?...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+class QueryLog:
+    """Statement shapes seen while serving one request (or inside :func:`capture`)."""
+
+    def __init__(self):
+        self.total = 0
+        self.shapes: Counter = Counter()
+        self.relationships: dict[str, str] = {}
+
+    def record(self, statement: str, relationship: str | None):
+        key = shape(statement)
+        self.total += 1
+        self.shapes[key] += 1
+        if relationship:
+            self.relationships[key] = relationship
+
+    def repeated(self, threshold: int) -> list[tuple[str, int, str | None]]:
+        """``(shape, count, relationship)`` for every shape run at least ``threshold`` times."""
+        return [(key, count, self.relationships.get(key)) for key, count in self.shapes.most_common() if count >= threshold]
+
+    def describe(self) -> str:
+        return "\n".join(f"{count:>4}x {key}" + (f"  [{self.relationships[key]}]" if key in self.relationships else "") for key, count in self.shapes.most_common())
+
+
+current: ContextVar[QueryLog | None] = ContextVar("query_log", default=None)
+# Logs opened by capture(); they see every statement in the process, which is
+# what a test driving the app through TestClient's portal thread needs.
+_captures: list[QueryLog] = []
+
+
+@contextmanager
+def capture():
+    log = QueryLog()
+    _captures.append(log)
+    try:
+        yield log
+    finally:
+        _captures.remove(log)
+
+
+def _tag_relationship_load(orm_execute_state):
+    if orm_execute_state.is_relationship_load:
+        relationship = str(orm_execute_state.loader_strategy_path.path[-1])
+        orm_execute_state.update_execution_options(diagnostics_relationship=relationship)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("diagnostics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["diagnostics_started"].pop()
+    request_log = current.get()
+    if request_log is not None or _captures:
+        relationship = context.execution_options.get("diagnostics_relationship") if context is not None else None
+        for log in ([request_log] if request_log is not None else []) + _captures:
+            log.record(statement, relationship)
+    if settings.slow_query_ms is not None and elapsed * 1000 >= settings.slow_query_ms and not executemany:
+        logger.warning("slow query (%.1f ms): %s params=%r\n%s", elapsed * 1000, statement, parameters, _explain(conn, statement, parameters))
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return "\n".join("  " + " | ".join(str(value) for value in row) for row in cursor.fetchall())
+        finally:
+            cursor.close()
+    except Exception as exc:
+        return f"  (no plan: {exc})"
+
+
+def instrument(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+event.listen(Session, "do_orm_execute", _tag_relationship_load)
+
+
+class DiagnosticsMiddleware:
+    """Logs N+1 patterns: statement shapes a single request runs ``n_plus_one_threshold`` times or more."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        log = QueryLog()
+        token = current.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current.reset(token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            for key, count, relationship in log.repeated(settings.n_plus_one_threshold):
+                logger.warning("possible N+1 in %s %s: %d x %s%s", scope["method"], route, count, key, f" (loading {relationship})" if relationship else "")
@@ -0,0 +1,45 @@
+import logging
+import smtplib
+from email.message import EmailMessage
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _message(to: str, subject: str, body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = settings.mail_from
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+class ConsoleMailer:
+    def send(self, to: str, subject: str, body: str):
+        logger.info("mail to %s: %s\n%s", to, subject, body)
+
+
+class MemoryMailer:
+    """Keeps sent mail in ``outbox`` so tests can assert on it."""
+
+    def __init__(self):
+        self.outbox: list[EmailMessage] = []
+
+    def send(self, to: str, subject: str, body: str):
+        self.outbox.append(_message(to, subject, body))
+
+
+class SmtpMailer:
+    def send(self, to: str, subject: str, body: str):
+        with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=settings.smtp_timeout_seconds) as smtp:
+            if settings.smtp_starttls:
+                smtp.starttls()
+            if settings.smtp_username:
+                smtp.login(settings.smtp_username, settings.smtp_password or "")
+            smtp.send_message(_message(to, subject, body))
+
+
+TRANSPORTS = {"console": ConsoleMailer, "memory": MemoryMailer, "smtp": SmtpMailer}
+mailer = TRANSPORTS[settings.mail_transport]()
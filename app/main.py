@@ -1,16 +1,51 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import os
+from .config import settings
 from .db import Base, engine
-from .routers import auth, products, orders
+from .routers import auth, products, orders, delivery, cart, promotions, reports
+from . import carts, diagnostics, metrics, migrations, notifications, outbox, search, revocation
+from .media import MediaFiles
+from .hashing import hasher
 
 Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
+search.ensure_index(engine)
 
-app = FastAPI(title="Freshcart Express")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(revocation.warm)
+    sweeper = asyncio.create_task(revocation.run_sweeper())
+    flusher = asyncio.create_task(metrics.run_flusher())
+    cart_flusher = asyncio.create_task(carts.run_flusher())
+    worker = asyncio.create_task(outbox.run_worker()) if settings.outbox_worker_enabled else None
+    yield
+    sweeper.cancel()
+    flusher.cancel()
+    cart_flusher.cancel()
+    await run_in_threadpool(carts.flush)
+    if worker is not None:
+        worker.cancel()
+    metrics.write_snapshot()
+    hasher.shutdown()
+
+
+app = FastAPI(title="Freshcart Express", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+if settings.query_diagnostics:
+    app.add_middleware(diagnostics.DiagnosticsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(products.router)
 app.include_router(orders.router)
+app.include_router(delivery.router)
+app.include_router(cart.router)
+app.include_router(promotions.router)
+app.include_router(reports.router)
+app.include_router(metrics.router)
 
-os.makedirs("media", exist_ok=True)
-app.mount("/media", StaticFiles(directory="media"), name="media")
+os.makedirs(settings.media_root, exist_ok=True)
+app.mount("/media", MediaFiles(directory=settings.media_root), name="media")
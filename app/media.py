@@ -0,0 +1,234 @@
+import hashlib
+import os
+import re
+import tempfile
+from collections.abc import AsyncIterator
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser as StreamingParser, parse_options_header
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+from starlette.datastructures import FormData, Headers
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.requests import Request
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from . import models
+from .config import settings
+
+CHUNK_SIZE = 64 * 1024
+URL_PREFIX = "media/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Room for the multipart boundaries and part headers around an upload.
+MULTIPART_OVERHEAD = 16 * 1024
+
+blobs = models.MediaBlob.__table__
+_MANAGED = re.compile(r"^media/[0-9a-f]{2}/([0-9a-f]{64})(\.[a-z0-9]{1,10})?$")
+_EXTENSION = re.compile(r"\.([A-Za-z0-9]{1,10})$")
+_STORED_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,10})?$")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnknownMedia(Exception):
+    pass
+
+
+class MalformedUpload(Exception):
+    pass
+
+
+async def receive_form(request: Request, max_bytes: int) -> FormData:
+    """Parse the multipart body of ``request``, counting bytes as they arrive.
+
+    Raises :class:`UploadTooLarge` before reading anything when
+    ``Content-Length`` is over ``max_bytes`` (plus framing), and as soon as a
+    body without one grows past it, so an oversized upload is never spooled
+    whole. The caller closes the returned form.
+    """
+    limit = max_bytes + MULTIPART_OVERHEAD
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise UploadTooLarge(max_bytes)
+
+    async def counted():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise UploadTooLarge(max_bytes)
+            yield chunk
+
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise MalformedUpload("expected multipart/form-data")
+    try:
+        return await MultiPartParser(request.headers, counted(), max_files=1, max_fields=10).parse()
+    except MultiPartException as exc:
+        raise MalformedUpload(exc.message)
+
+
+async def stream_field(request: Request, name: str) -> AsyncIterator[bytes]:
+    """Yield the bytes of the multipart part ``name`` as they arrive, without spooling the body.
+
+    Raises :class:`MalformedUpload` if the body is not multipart or has no
+    such part.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise MalformedUpload("expected multipart/form-data")
+    headers, field, value = {}, bytearray(), bytearray()
+    wanted = seen = False
+    pending: list[bytes] = []
+
+    def on_header_end():
+        headers[bytes(field).lower()] = bytes(value)
+        field.clear()
+        value.clear()
+
+    def on_headers_finished():
+        nonlocal wanted, seen
+        _, disposition = parse_options_header(headers.pop(b"content-disposition", b""))
+        headers.clear()
+        wanted = disposition.get(b"name") == name.encode()
+        seen = seen or wanted
+
+    def on_part_data(data, start, end):
+        if wanted:
+            pending.append(bytes(data[start:end]))
+
+    parser = StreamingParser(options[b"boundary"], {
+        "on_header_field": lambda data, start, end: field.extend(data[start:end]),
+        "on_header_value": lambda data, start, end: value.extend(data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for data in pending:
+                yield data
+            pending.clear()
+        parser.finalize()
+    except MultipartParseError as exc:
+        raise MalformedUpload(str(exc))
+    if not seen:
+        raise MalformedUpload(f"{name} is required")
+
+
+def spool(fileobj, max_bytes: int) -> tuple[str, str, int]:
+    """Copy ``fileobj`` into a temp file under the media root in fixed-size chunks.
+
+    Returns ``(sha256, temp_path, size)``. Raises :class:`UploadTooLarge` as
+    soon as more than ``max_bytes`` have been read.
+    """
+    os.makedirs(settings.media_root, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=settings.media_root, prefix=".upload-", delete=False) as tmp:
+        try:
+            while chunk := fileobj.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    return digest.hexdigest(), tmp.name, size
+
+
+def acquire(db: Session, sha256: str, temp_path: str, filename: str | None, size: int, content_type: str | None) -> str:
+    """Take a reference on the blob with ``sha256``, storing ``temp_path`` if it is new.
+
+    Returns the blob's public path (``media/ab/<sha256>.ext``). Must run in
+    the transaction that records the reference. ``temp_path`` is removed if
+    this raises.
+    """
+    try:
+        return _acquire(db, sha256, temp_path, filename, size, content_type)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _acquire(db: Session, sha256: str, temp_path: str, filename: str | None, size: int, content_type: str | None) -> str:
+    path = db.execute(
+        update(blobs).where(blobs.c.sha256 == sha256).values(ref_count=blobs.c.ref_count + 1).returning(blobs.c.path)
+    ).scalar()
+    if path is None:
+        match = _EXTENSION.search(filename or "")
+        path = f"{URL_PREFIX}{sha256[:2]}/{sha256}" + (f".{match.group(1).lower()}" if match else "")
+        db.execute(blobs.insert().values(sha256=sha256, path=path, size=size, content_type=content_type, ref_count=1))
+    destination = _disk_path(path)
+    if os.path.exists(destination):
+        os.unlink(temp_path)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(temp_path, destination)
+    return path
+
+
+def retain(db: Session, path: str | None):
+    """Take another reference on an already stored blob; other values are left alone."""
+    match = _MANAGED.match(path or "")
+    if match:
+        result = db.execute(update(blobs).where(blobs.c.sha256 == match.group(1)).values(ref_count=blobs.c.ref_count + 1))
+        if result.rowcount == 0:
+            raise UnknownMedia(path)
+
+
+def release(db: Session, path: str | None) -> bool:
+    """Drop a reference in the caller's transaction.
+
+    Returns True when nothing points at the blob any more; pass ``path`` to
+    :func:`purge` once that transaction has committed.
+    """
+    match = _MANAGED.match(path or "")
+    if not match:
+        return False
+    remaining = db.execute(
+        update(blobs).where(blobs.c.sha256 == match.group(1)).values(ref_count=blobs.c.ref_count - 1).returning(blobs.c.ref_count)
+    ).scalar()
+    return remaining is not None and remaining <= 0
+
+
+def purge(db: Session, path: str):
+    """Delete a released blob's row and file unless it was referenced again since; the caller commits.
+
+    The file is removed while the ``DELETE`` holds the row's write lock, so a
+    concurrent upload of the same bytes either takes its reference first and
+    keeps the blob, or stores the file again after this commits. A purge that
+    never runs leaves a zero-count row that the next upload reuses.
+    """
+    match = _MANAGED.match(path)
+    if match and db.execute(delete(blobs).where(blobs.c.sha256 == match.group(1), blobs.c.ref_count <= 0)).rowcount:
+        try:
+            os.unlink(_disk_path(path))
+        except FileNotFoundError:
+            pass
+
+
+def _disk_path(path: str) -> str:
+    return os.path.join(settings.media_root, path[len(URL_PREFIX):])
+
+
+class MediaFiles(StaticFiles):
+    """Serves the media root; content-addressed blobs never change, so they are cached forever."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        match = _STORED_NAME.match(os.path.basename(full_path))
+        if match:
+            response.headers["etag"] = f'"{match.group(1)}"'
+            response.headers["cache-control"] = IMMUTABLE
+        else:
+            response.headers["cache-control"] = "no-cache"
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
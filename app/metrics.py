@@ -0,0 +1,212 @@
+import asyncio
+import glob
+import json
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+from . import cache
+from .config import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "<unmatched>"
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class RouteMetrics:
+    __slots__ = ("buckets", "duration_sum", "statuses", "queries", "db_seconds")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.duration_sum = 0.0
+        self.statuses: dict[str, int] = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def observe(self, seconds: float, status: int, stats: RequestStats):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.duration_sum += seconds
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        self.queries += stats.queries
+        self.db_seconds += stats.db_seconds
+
+
+# The stats object is shared by reference, so queries run on the threadpool
+# or inside SQLAlchemy's greenlets still count against the request.
+current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+routes: dict[tuple[str, str], RouteMetrics] = {}
+
+
+class MetricsMiddleware:
+    """Records latency, status and database work per ``(method, route template)``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current.reset(token)
+            route = scope.get("route")
+            key = (scope["method"], getattr(route, "path", None) or UNMATCHED)
+            metrics = routes.get(key)
+            if metrics is None:
+                metrics = routes[key] = RouteMetrics()
+            metrics.observe(elapsed, status, stats)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def snapshot() -> dict:
+    return {
+        "routes": [
+            {"method": method, "route": route, "buckets": m.buckets, "sum": m.duration_sum, "statuses": m.statuses, "queries": m.queries, "db_seconds": m.db_seconds}
+            for (method, route), m in list(routes.items())
+        ],
+        "cache": cache.catalog.stats(),
+    }
+
+
+def write_snapshot():
+    """Publish this worker's counters for the worker that serves ``/metrics``."""
+    if not settings.metrics_dir:
+        return
+    os.makedirs(settings.metrics_dir, exist_ok=True)
+    path = os.path.join(settings.metrics_dir, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+async def run_flusher():
+    while True:
+        await asyncio.sleep(settings.metrics_flush_seconds)
+        write_snapshot()
+
+
+def collect() -> list[dict]:
+    """This worker's live counters plus the last snapshot of every other worker.
+
+    Snapshots of exited workers are kept so counters never go backwards; clear
+    ``metrics_dir`` when the whole server restarts.
+    """
+    snapshots = [snapshot()]
+    if settings.metrics_dir:
+        own = os.path.join(settings.metrics_dir, f"{os.getpid()}.json")
+        for path in glob.glob(os.path.join(settings.metrics_dir, "*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return snapshots
+
+
+def merge(snapshots: list[dict]) -> tuple[dict, dict]:
+    merged: dict[tuple[str, str], RouteMetrics] = {}
+    cache_stats: dict[str, int] = {}
+    for snap in snapshots:
+        for row in snap["routes"]:
+            metrics = merged.setdefault((row["method"], row["route"]), RouteMetrics())
+            metrics.buckets = [a + b for a, b in zip(metrics.buckets, row["buckets"])]
+            metrics.duration_sum += row["sum"]
+            for status, count in row["statuses"].items():
+                metrics.statuses[status] = metrics.statuses.get(status, 0) + count
+            metrics.queries += row["queries"]
+            metrics.db_seconds += row["db_seconds"]
+        for name, value in snap["cache"].items():
+            cache_stats[name] = cache_stats.get(name, 0) + value
+    return merged, cache_stats
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render(snapshots: list[dict]) -> str:
+    merged, cache_stats = merge(snapshots)
+    lines = [
+        "# HELP freshcart_http_requests_total HTTP requests by route template and status.",
+        "# TYPE freshcart_http_requests_total counter",
+    ]
+    for (method, route), m in sorted(merged.items()):
+        for status, count in sorted(m.statuses.items()):
+            lines.append(f"freshcart_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+    lines += [
+        "# HELP freshcart_http_request_duration_seconds Time to send the full response.",
+        "# TYPE freshcart_http_request_duration_seconds histogram",
+    ]
+    for (method, route), m in sorted(merged.items()):
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), m.buckets):
+            cumulative += count
+            lines.append(f"freshcart_http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+        lines.append(f"freshcart_http_request_duration_seconds_sum{_labels(method=method, route=route)} {m.duration_sum}")
+        lines.append(f"freshcart_http_request_duration_seconds_count{_labels(method=method, route=route)} {cumulative}")
+    lines += ["# HELP freshcart_db_queries_total Statements executed while serving the route.", "# TYPE freshcart_db_queries_total counter"]
+    lines += [f"freshcart_db_queries_total{_labels(method=method, route=route)} {m.queries}" for (method, route), m in sorted(merged.items())]
+    lines += ["# HELP freshcart_db_seconds_total Time spent executing those statements.", "# TYPE freshcart_db_seconds_total counter"]
+    lines += [f"freshcart_db_seconds_total{_labels(method=method, route=route)} {m.db_seconds}" for (method, route), m in sorted(merged.items())]
+    for name, value in sorted(cache_stats.items()):
+        kind = "gauge" if name in ("entries", "maxsize") else "counter"
+        metric = f"freshcart_catalog_cache_{name}" + ("_total" if kind == "counter" else "")
+        lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(render(collect()), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,77 @@
+import logging
+
+from sqlalchemy import inspect, literal, select
+from sqlalchemy.schema import CreateColumn
+
+from . import models
+from .db import Base
+
+logger = logging.getLogger(__name__)
+
+# Columns added to tables that existed before them. create_all only creates
+# missing tables, so upgrade() adds these to older databases; existing rows
+# get the column's default.
+ADDED_COLUMNS = [
+    models.User.__table__.c.password_changed_at,
+    models.Product.__table__.c.sku,
+    # Zero until `python -m app.ratings rebuild` folds in existing reviews.
+    models.Product.__table__.c.rating_count,
+    models.Product.__table__.c.rating_sum,
+    models.Product.__table__.c.rating_avg,
+    *(models.PromoCode.__table__.c[name] for name in ("starts_at", "ends_at", "min_subtotal", "product_id", "category_id", "usage_limit", "used_count", "per_user_limit")),
+    models.OrderItem.__table__.c.category_id,
+    # Rows revoked before this stay until swept by hand; they are never reused.
+    models.BlacklistedToken.__table__.c.expires_at,
+]
+
+_items, _products = models.OrderItem.__table__, models.Product.__table__
+
+# Run once, in the same transaction, when their column is added.
+BACKFILLS = {
+    # Best guess for old lines: the product's category today.
+    _items.c.category_id: _items.update().values(
+        category_id=select(_products.c.category_id).where(_products.c.id == _items.c.product_id).scalar_subquery()
+    ),
+}
+
+
+def _retire_old_slots(conn):
+    """Replace the one-row-per-booking ``delivery_slots`` with the capacity windows.
+
+    The old rows have no zone or window to map them to, so they are copied
+    to ``delivery_slots_legacy`` and orders lose their slot.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table("delivery_slots") or "zone" in {c["name"] for c in inspector.get_columns("delivery_slots")}:
+        return
+    conn.exec_driver_sql("CREATE TABLE delivery_slots_legacy AS SELECT * FROM delivery_slots")
+    conn.execute(models.Order.__table__.update().where(models.Order.__table__.c.delivery_slot_id.is_not(None)).values(delivery_slot_id=None))
+    conn.exec_driver_sql("DROP TABLE delivery_slots")
+    models.DeliverySlot.__table__.create(conn)
+    logger.warning("moved old delivery_slots rows to delivery_slots_legacy")
+
+
+def upgrade(engine):
+    """Add every :data:`ADDED_COLUMNS` column its table lacks, then any missing index; safe to run on every start."""
+    with engine.begin() as conn:
+        _retire_old_slots(conn)
+        inspector = inspect(conn)
+        for column in ADDED_COLUMNS:
+            table = column.table.name
+            if not inspector.has_table(table) or column.name in {c["name"] for c in inspector.get_columns(table)}:
+                continue
+            ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+            if column.default is not None and column.default.is_scalar:
+                ddl += " DEFAULT " + str(literal(column.default.arg).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+            if column in BACKFILLS:
+                conn.execute(BACKFILLS[column])
+            logger.warning("added column %s.%s", table, column.name)
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if {c.name for c in index.columns} <= present:
+                    index.create(conn, checkfirst=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, DateTime, Enum as SqlEnum, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Date, DateTime, Enum as SqlEnum, Text, Index
 import enum
 from sqlalchemy.orm import relationship
 
@@ -9,12 +9,15 @@ class OrderStatusEnum(enum.Enum):
     PLACED = "placed"
     SHIPPED = "shipped"
     DELIVERED = "delivered"
+    CANCELLED = "cancelled"
 
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    # Tokens issued before this are rejected.
+    password_changed_at = Column(DateTime, nullable=True)
     profile_image = Column(String, nullable=True)
     reset_code = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
@@ -27,16 +30,27 @@ class User(Base):
 class Product(Base):
     __tablename__ = 'products'
     id = Column(Integer, primary_key=True, index=True)
+    sku = Column(String, unique=True, index=True, nullable=True)
     name = Column(String, index=True)
     description = Column(String)
     price = Column(Float)
     stock = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0, nullable=False)
+    rating_sum = Column(Integer, default=0, nullable=False)
+    # Kept alongside count/sum so sort_by=rating can walk a plain index.
+    rating_avg = Column(Float, default=0, nullable=False)
 
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=True)
     category = relationship('Category', back_populates='products')
     variants = relationship('ProductVariant', back_populates='product')
     reviews = relationship('Review', back_populates='product')
 
+    __table_args__ = (
+        Index('ix_products_name_id', 'name', 'id'),
+        Index('ix_products_price_id', 'price', 'id'),
+        Index('ix_products_rating_avg_id', 'rating_avg', 'id'),
+    )
+
 class Order(Base):
     __tablename__ = 'orders'
     id = Column(Integer, primary_key=True, index=True)
@@ -49,15 +63,22 @@ class Order(Base):
 
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
-    delivery_slot = relationship('DeliverySlot', uselist=False, back_populates='order')
+    delivery_slot = relationship('DeliverySlot', uselist=False, foreign_keys=[delivery_slot_id])
+
+    __table_args__ = (
+        Index('ix_orders_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
 
 class OrderItem(Base):
     __tablename__ = 'order_items'
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey('orders.id'))
+    order_id = Column(Integer, ForeignKey('orders.id'), index=True)
     product_id = Column(Integer, ForeignKey('products.id'))
     quantity = Column(Integer)
     price = Column(Float)
+    # The product's category when the order was placed; rollups count the
+    # line there even if the product moves later.
+    category_id = Column(Integer, nullable=True)
 
     order = relationship("Order", back_populates="items")
 
@@ -85,7 +106,7 @@ class Review(Base):
     __tablename__ = 'reviews'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    product_id = Column(Integer, ForeignKey('products.id'))
+    product_id = Column(Integer, ForeignKey('products.id'), index=True)
     rating = Column(Integer)
     comment = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -94,12 +115,45 @@ class Review(Base):
     user = relationship('User', back_populates='reviews')
 
 
+class ProductRatingCount(Base):
+    __tablename__ = 'product_rating_counts'
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    rating = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+
 class PromoCode(Base):
     __tablename__ = 'promocodes'
     id = Column(Integer, primary_key=True)
     code = Column(String, unique=True)
     discount_percent = Column(Integer, default=0)
     active = Column(Boolean, default=True)
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+    min_subtotal = Column(Float, default=0, nullable=False)
+    # At most one scope; neither means the whole basket.
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=True)
+    category_id = Column(Integer, ForeignKey('categories.id'), nullable=True)
+    usage_limit = Column(Integer, nullable=True)
+    used_count = Column(Integer, default=0, nullable=False)
+    per_user_limit = Column(Integer, nullable=True)
+
+
+class PromoRedemption(Base):
+    __tablename__ = 'promo_redemptions'
+    promo_code_id = Column(Integer, ForeignKey('promocodes.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+
+class Cart(Base):
+    __tablename__ = 'carts'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    # {"product_id": quantity}
+    lines = Column(Text, nullable=False, default='{}')
+    # Bumped on every change; a flush never overwrites a newer row.
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 
 class BlacklistedToken(Base):
@@ -107,13 +161,127 @@ class BlacklistedToken(Base):
     id = Column(Integer, primary_key=True)
     jti = Column(String, unique=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+
+class MediaBlob(Base):
+    __tablename__ = 'media_blobs'
+    sha256 = Column(String, primary_key=True)
+    path = Column(String, unique=True)
+    size = Column(Integer)
+    content_type = Column(String, nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OutboxMessage(Base):
+    __tablename__ = 'outbox_messages'
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    # pending -> sent, or dead once max attempts are used up.
+    status = Column(String, default='pending', nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index('ix_outbox_messages_status_available_at', 'status', 'available_at'),
+    )
+
+
+# Sales rollups by order date. Cancelled and returned orders are subtracted
+# from the day they were placed; revenue is before promo discounts except
+# net_revenue, which sums order totals.
+class SalesDaily(Base):
+    __tablename__ = 'sales_daily'
+    day = Column(Date, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+    net_revenue = Column(Float, default=0, nullable=False)
+
+
+class SalesDailyProduct(Base):
+    __tablename__ = 'sales_daily_products'
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+    __table_args__ = (
+        Index('ix_sales_daily_products_product_id_day', 'product_id', 'day'),
+    )
+
+
+# Whole months of sales_daily_products, so year-long reports read 12 rows per product.
+class SalesMonthlyProduct(Base):
+    __tablename__ = 'sales_monthly_products'
+    # First day of the month.
+    month = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+
+class SalesDailyCategory(Base):
+    __tablename__ = 'sales_daily_categories'
+    day = Column(Date, primary_key=True)
+    # 0 for products without a category.
+    category_id = Column(Integer, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+
+class ProductPair(Base):
+    """Orders containing both products, stored in both directions; the
+    diagonal (``product_id == other_id``) counts orders containing the product."""
+    __tablename__ = 'product_pairs'
+    product_id = Column(Integer, primary_key=True)
+    other_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, default=0, nullable=False)
+
+
+class RelatedProduct(Base):
+    __tablename__ = 'related_products'
+    product_id = Column(Integer, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    related_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    orders = Column(Integer, nullable=False)
+
+
+class RelatedProductsBuild(Base):
+    __tablename__ = 'related_products_builds'
+    id = Column(Integer, primary_key=True)
+    # Every order up to this id was counted into product_pairs.
+    last_order_id = Column(Integer, nullable=False)
+    order_count = Column(Integer, nullable=False)
+    built_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TableVersion(Base):
+    __tablename__ = 'table_versions'
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
 
 
 class DeliverySlot(Base):
     __tablename__ = 'delivery_slots'
     id = Column(Integer, primary_key=True)
-    slot_time = Column(String)
-    available = Column(Boolean, default=True)
+    zone = Column(String, nullable=False)
+    starts_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime, nullable=False)
+    capacity = Column(Integer, nullable=False)
+    booked = Column(Integer, default=0, nullable=False)
 
-    order_id = Column(Integer, ForeignKey('orders.id'))
-    order = relationship('Order', back_populates='delivery_slot')
+    __table_args__ = (
+        # Unique so regenerating a week leaves existing windows alone; also
+        # serves the availability range scan.
+        Index('ix_delivery_slots_zone_starts_at', 'zone', 'starts_at', unique=True),
+    )
@@ -0,0 +1,36 @@
+from . import models
+from .db import SessionLocal
+from .mail import mailer
+from .outbox import handler
+
+
+def _email(user_id: int) -> str | None:
+    with SessionLocal() as db:
+        user = db.get(models.User, user_id)
+        return user.email if user else None
+
+
+@handler("auth.password_reset")
+def send_reset_code(payload: dict):
+    # The code is read at delivery so it never sits in the outbox; a code
+    # already used is not sent.
+    with SessionLocal() as db:
+        user = db.get(models.User, payload["user_id"])
+        email, code = (user.email, user.reset_code) if user else (None, None)
+    if code:
+        mailer.send(email, "Your Freshcart reset code", f"Use {code} to reset your password.")
+
+
+@handler("order.placed")
+def send_order_confirmation(payload: dict):
+    email = _email(payload["user_id"])
+    if email:
+        mailer.send(email, f"Order #{payload['order_id']} confirmed", f"Thanks for your order. Total: {payload['total']:.2f}")
+
+
+@handler("order.status_changed")
+def send_status_update(payload: dict):
+    email = _email(payload["user_id"])
+    if email:
+        tracking = f" Tracking number: {payload['tracking_number']}." if payload.get("tracking_number") else ""
+        mailer.send(email, f"Order #{payload['order_id']} is {payload['status']}", f"Your order is now {payload['status']}.{tracking}")
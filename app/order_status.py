@@ -0,0 +1,89 @@
+from collections import Counter
+
+from sqlalchemy import case, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import models, outbox, rollups
+
+Status = models.OrderStatusEnum
+orders = models.Order.__table__
+slots = models.DeliverySlot.__table__
+
+CHUNK_SIZE = 500
+
+# Returns are recorded as cancellations of delivered orders.
+ALLOWED = {
+    Status.PLACED: {Status.SHIPPED, Status.CANCELLED},
+    Status.SHIPPED: {Status.DELIVERED},
+    Status.DELIVERED: {Status.CANCELLED},
+    Status.CANCELLED: set(),
+}
+SOURCES = {target: {source for source, targets in ALLOWED.items() if target in targets} for target in Status}
+
+
+def apply(db: Session, changes, sources: dict | None = None) -> list[dict]:
+    """Move many orders to new statuses in the caller's transaction.
+
+    ``changes`` are objects with ``order_id``, ``status`` and an optional
+    ``tracking_number``. Each chunk is read once and written with one guarded
+    ``UPDATE ... CASE``, so an order that changed concurrently is reported as
+    a conflict instead of being overwritten. ``sources`` narrows the statuses
+    a target may be reached from (``{CANCELLED: {PLACED}}`` for cancellations).
+    Returns one outcome per change, in order.
+    """
+    outcomes, seen = [], set()
+    for start in range(0, len(changes), CHUNK_SIZE):
+        outcomes += _apply_chunk(db, changes[start:start + CHUNK_SIZE], sources or {}, seen)
+    return outcomes
+
+
+def _apply_chunk(db: Session, changes, sources: dict, seen: set) -> list[dict]:
+    current = {
+        row.id: row
+        for row in db.execute(select(orders.c.id, orders.c.user_id, orders.c.status, orders.c.delivery_slot_id).where(orders.c.id.in_([c.order_id for c in changes])))
+    }
+    outcomes, legal = [], {}
+    for change in changes:
+        row = current.get(change.order_id)
+        if change.order_id in seen:
+            outcome = {"order_id": change.order_id, "outcome": "duplicate", "status": None}
+        elif row is None:
+            outcome = {"order_id": change.order_id, "outcome": "not_found", "status": None}
+        elif row.status == change.status and not change.tracking_number:
+            outcome = {"order_id": change.order_id, "outcome": "unchanged", "status": row.status}
+        elif row.status != change.status and row.status not in sources.get(change.status, SOURCES[change.status]):
+            outcome = {"order_id": change.order_id, "outcome": "invalid_transition", "status": row.status}
+        else:
+            outcome = {"order_id": change.order_id, "outcome": "updated", "status": change.status}
+            legal[change.order_id] = change
+        seen.add(change.order_id)
+        outcomes.append(outcome)
+    if not legal:
+        return outcomes
+
+    status_type = orders.c.status.type
+    expected = case({order_id: literal(current[order_id].status, status_type) for order_id in legal}, value=orders.c.id)
+    values = {"status": case({order_id: literal(change.status, status_type) for order_id, change in legal.items()}, value=orders.c.id)}
+    tracking = {order_id: change.tracking_number for order_id, change in legal.items() if change.tracking_number}
+    if tracking:
+        values["tracking_number"] = case(tracking, value=orders.c.id, else_=orders.c.tracking_number)
+    updated = set(db.execute(update(orders).where(orders.c.id.in_(legal), orders.c.status == expected).values(values).returning(orders.c.id)).scalars())
+
+    cancelled = [order_id for order_id in updated if legal[order_id].status == Status.CANCELLED and current[order_id].status != Status.CANCELLED]
+    if cancelled:
+        rollups.record(db, rollups.order_lines(db, cancelled), sign=-1)
+    # Cancelled orders give their delivery window back. Their slots are read
+    # again after the status update: a slot move may have committed since.
+    freed = db.execute(select(orders.c.id, orders.c.delivery_slot_id).where(orders.c.id.in_(cancelled), orders.c.delivery_slot_id.is_not(None))).all() if cancelled else []
+    if freed:
+        released = Counter(slot_id for _, slot_id in freed)
+        db.execute(update(orders).where(orders.c.id.in_([order_id for order_id, _ in freed])).values(delivery_slot_id=None))
+        db.execute(update(slots).where(slots.c.id.in_(released)).values(booked=slots.c.booked - case(released, value=slots.c.id)))
+    outbox.enqueue_many(db, "order.status_changed", [
+        {"order_id": order_id, "user_id": current[order_id].user_id, "status": legal[order_id].status.value, "tracking_number": legal[order_id].tracking_number}
+        for order_id in updated
+    ])
+    for outcome in outcomes:
+        if outcome["outcome"] == "updated" and outcome["order_id"] not in updated:
+            outcome.update(outcome="conflict", status=None)
+    return outcomes
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+from .db import Base, SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+messages = models.OutboxMessage.__table__
+PURGE_INTERVAL_SECONDS = 3600
+handlers: dict = {}
+_wakeup: asyncio.Event | None = None
+
+
+def handler(topic: str):
+    """Register a blocking ``fn(payload)`` that delivers messages of ``topic``; raising means retry."""
+    def register(fn):
+        handlers[topic] = fn
+        return fn
+    return register
+
+
+def enqueue(db, topic: str, payload: dict):
+    """Queue a message in the caller's transaction; it is only delivered if that transaction commits."""
+    db.add(models.OutboxMessage(topic=topic, payload=json.dumps(payload)))
+
+
+def enqueue_many(db: Session, topic: str, payloads: list[dict]):
+    if payloads:
+        now = datetime.utcnow()
+        db.execute(messages.insert(), [{"topic": topic, "payload": json.dumps(p), "available_at": now, "created_at": now} for p in payloads])
+
+
+def notify():
+    """Wake the in-process worker after a commit that queued messages."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def claim(db: Session, limit: int) -> list:
+    """Lease up to ``limit`` due messages so no other worker picks them up until the lease expires."""
+    now = datetime.utcnow()
+    due = select(messages.c.id).where(messages.c.status == "pending", messages.c.available_at <= now).order_by(messages.c.available_at, messages.c.id).limit(limit)
+    rows = db.execute(
+        update(messages)
+        .where(messages.c.id.in_(due.scalar_subquery()), messages.c.available_at <= now)
+        .values(available_at=now + timedelta(seconds=settings.outbox_lease_seconds), attempts=messages.c.attempts + 1)
+        .returning(messages.c.id, messages.c.topic, messages.c.payload, messages.c.attempts)
+    ).all()
+    db.commit()
+    return rows
+
+
+def backoff(attempts: int) -> float:
+    delay = min(settings.outbox_backoff_max_seconds, settings.outbox_backoff_seconds * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+def record(db: Session, sent: list[int], failed: list[tuple]):
+    now = datetime.utcnow()
+    if sent:
+        db.execute(update(messages).where(messages.c.id.in_(sent)).values(status="sent", sent_at=now, last_error=None))
+    for row, error in failed:
+        values = {"last_error": error[:2000]}
+        if row.attempts >= settings.outbox_max_attempts or row.topic not in handlers:
+            values["status"] = "dead"
+        else:
+            values["available_at"] = now + timedelta(seconds=backoff(row.attempts))
+        db.execute(update(messages).where(messages.c.id == row.id).values(values))
+    db.commit()
+
+
+def purge(db: Session, before: datetime) -> int:
+    """Delete messages sent before ``before``; returns how many."""
+    deleted = db.execute(messages.delete().where(messages.c.status == "sent", messages.c.sent_at < before)).rowcount
+    db.commit()
+    return deleted
+
+
+def _claim_batch() -> list:
+    with SessionLocal() as db:
+        return claim(db, settings.outbox_batch_size)
+
+
+def _record_batch(sent, failed):
+    with SessionLocal() as db:
+        record(db, sent, failed)
+
+
+def _purge_sent() -> int:
+    with SessionLocal() as db:
+        return purge(db, datetime.utcnow() - timedelta(days=settings.outbox_retention_days))
+
+
+async def drain_once() -> int:
+    """Deliver one batch of due messages with at most ``outbox_concurrency`` in flight; returns the batch size."""
+    rows = await run_in_threadpool(_claim_batch)
+    if not rows:
+        return 0
+    limit = asyncio.Semaphore(settings.outbox_concurrency)
+    sent, failed = [], []
+
+    async def deliver(row):
+        async with limit:
+            try:
+                fn = handlers[row.topic]
+                await run_in_threadpool(fn, json.loads(row.payload))
+                sent.append(row.id)
+            except Exception as exc:
+                logger.warning("outbox message %d (%s) failed on attempt %d: %r", row.id, row.topic, row.attempts, exc)
+                failed.append((row, repr(exc)))
+
+    await asyncio.gather(*(deliver(row) for row in rows))
+    await run_in_threadpool(_record_batch, sent, failed)
+    return len(rows)
+
+
+async def run_worker():
+    global _wakeup
+    _wakeup = asyncio.Event()
+    purged_at = None
+    while True:
+        try:
+            if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL_SECONDS:
+                purged_at = time.monotonic()
+                await run_in_threadpool(_purge_sent)
+            drained = await drain_once()
+        except Exception:
+            logger.exception("outbox drain failed")
+            drained = 0
+        if drained < settings.outbox_batch_size:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), settings.outbox_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.outbox", description="Deliver queued outbox messages.")
+    parser.add_argument("--once", action="store_true", help="drain every due message, delete old sent ones and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    from . import notifications  # noqa: F401  registers the handlers
+    Base.metadata.create_all(bind=engine)
+
+    async def drain_all():
+        while await drain_once():
+            pass
+        await run_in_threadpool(_purge_sent)
+
+    asyncio.run(drain_all() if args.once else run_worker())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [_coerce(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(stmt, columns, cursor: str | None, limit: int, descending: bool = False):
+    """Order ``stmt`` by ``columns`` and restrict it to one page after ``cursor``.
+
+    Works for both legacy ``Query`` objects and ``select()`` statements. The
+    last column must be unique so the ordering is total. One extra row is
+    fetched so :func:`page` can tell whether another page follows.
+    """
+    if cursor is not None:
+        key, after = tuple_(*columns), tuple_(*decode_cursor(cursor, columns))
+        stmt = stmt.filter(key < after if descending else key > after)
+    order = [c.desc() for c in columns] if descending else list(columns)
+    return stmt.order_by(*order).limit(limit + 1)
+
+
+def page(rows, columns, limit: int, values=None):
+    """Split the rows fetched by a :func:`keyset` statement into ``(rows, next_cursor)``.
+
+    ``values`` extracts the cursor values from a row when they are not plain
+    attributes named after ``columns``.
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = values(rows[-1]) if values else [getattr(rows[-1], c.key) for c in columns]
+    return rows, encode_cursor(*last)
+
+
+def _coerce(column, value):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if value is not None and python_type in (int, float) and not isinstance(value, (int, float)):
+        raise ValueError(value)
+    return value
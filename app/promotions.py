@@ -0,0 +1,105 @@
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .db import dialect_insert
+
+promos = models.PromoCode.__table__
+redemptions = models.PromoRedemption.__table__
+
+TABLE = "promocodes"
+
+
+class PromotionError(Exception):
+    def __init__(self, code: str, reason: str):
+        super().__init__(code, reason)
+        self.code = code
+        self.reason = reason
+
+
+class Rule:
+    """One active promo code, compiled from its row."""
+
+    __slots__ = ("id", "code", "discount_percent", "starts_at", "ends_at", "min_subtotal", "product_id", "category_id", "per_user_limit")
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, getattr(row, name))
+
+    def discount(self, lines, subtotal: float, now: datetime) -> float:
+        """Discount on ``lines`` of ``(product_id, category_id, price, quantity)``; raises :class:`PromotionError`."""
+        if self.starts_at is not None and now < self.starts_at:
+            raise PromotionError(self.code, "not_started")
+        if self.ends_at is not None and now >= self.ends_at:
+            raise PromotionError(self.code, "expired")
+        if subtotal < self.min_subtotal:
+            raise PromotionError(self.code, "below_minimum")
+        eligible = sum(
+            price * quantity
+            for product_id, category_id, price, quantity in lines
+            if (self.product_id is None or product_id == self.product_id) and (self.category_id is None or category_id == self.category_id)
+        )
+        if not eligible:
+            raise PromotionError(self.code, "not_applicable")
+        return round(eligible * self.discount_percent / 100, 2)
+
+
+class Index:
+    """Active rules by code, valid for one ``promocodes`` table version."""
+
+    def __init__(self, version: int, rules: list[Rule]):
+        self.version = version
+        self.by_code = {rule.code: rule for rule in rules}
+
+    def quote(self, code: str, lines, subtotal: float, now: datetime | None = None) -> tuple[Rule, float]:
+        rule = self.by_code.get(code)
+        if rule is None:
+            raise PromotionError(code, "unknown")
+        return rule, rule.discount(lines, subtotal, now or datetime.utcnow())
+
+
+_index = Index(-1, [])
+
+
+def _compile(db: Session) -> list[Rule]:
+    columns = [promos.c[name] for name in Rule.__slots__]
+    return [Rule(row) for row in db.execute(select(*columns).where(promos.c.active == True))]
+
+
+async def index(db) -> Index:
+    """The compiled rules, rebuilt only when the ``promocodes`` version moved."""
+    global _index
+    version = (await versioning.current(db)).get(TABLE, 0)
+    if _index.version != version:
+        _index = Index(version, await db.run_sync(_compile))
+    return _index
+
+
+def redeem(db: Session, rule: Rule, user_id: int):
+    """Count one use of ``rule`` by ``user_id`` in the caller's transaction.
+
+    Both counters are guarded in the statement that increments them, so
+    concurrent checkouts cannot exceed a limit. Raises
+    :class:`PromotionError`; the caller must roll back.
+    """
+    claimed = db.execute(
+        update(promos)
+        .where(promos.c.id == rule.id, promos.c.active == True, promos.c.usage_limit.is_(None) | (promos.c.used_count < promos.c.usage_limit))
+        .values(used_count=promos.c.used_count + 1)
+        .returning(promos.c.id)
+    ).first()
+    if claimed is None:
+        raise PromotionError(rule.code, "exhausted")
+    if rule.per_user_limit is not None:
+        insert = dialect_insert(db.get_bind(), redemptions).values(promo_code_id=rule.id, user_id=user_id, count=1)
+        counted = db.execute(
+            insert.on_conflict_do_update(
+                index_elements=[redemptions.c.promo_code_id, redemptions.c.user_id],
+                set_={"count": redemptions.c.count + 1},
+                where=redemptions.c.count < rule.per_user_limit,
+            ).returning(redemptions.c.count)
+        ).first()
+        if counted is None or counted[0] > rule.per_user_limit:
+            raise PromotionError(rule.code, "user_limit_reached")
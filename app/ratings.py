@@ -0,0 +1,82 @@
+import argparse
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .db import Base, SessionLocal, dialect_insert, engine
+
+products = models.Product.__table__
+counts = models.ProductRatingCount.__table__
+reviews = models.Review.__table__
+
+STARS = range(1, 6)
+
+
+def record_review(db: Session, product_id: int, rating: int):
+    """Fold one new review into the product's aggregates in the caller's transaction."""
+    db.execute(
+        update(products)
+        .where(products.c.id == product_id)
+        .values(
+            rating_count=products.c.rating_count + 1,
+            rating_sum=products.c.rating_sum + rating,
+            rating_avg=(products.c.rating_sum + rating) * 1.0 / (products.c.rating_count + 1),
+        )
+    )
+    insert = dialect_insert(db.get_bind(), counts).values(product_id=product_id, rating=rating, count=1)
+    db.execute(insert.on_conflict_do_update(index_elements=[counts.c.product_id, counts.c.rating], set_={"count": counts.c.count + 1}))
+
+
+def summary(db: Session, product_id: int) -> dict | None:
+    product = db.execute(select(products.c.rating_count, products.c.rating_avg).where(products.c.id == product_id)).first()
+    if product is None:
+        return None
+    histogram = dict.fromkeys(STARS, 0)
+    histogram.update(db.execute(select(counts.c.rating, counts.c.count).where(counts.c.product_id == product_id)).all())
+    return {"product_id": product_id, "count": product.rating_count, "average": product.rating_avg, "histogram": histogram}
+
+
+def forget(db: Session, product_id: int):
+    """Drop a deleted product's histogram in the caller's transaction."""
+    db.execute(counts.delete().where(counts.c.product_id == product_id))
+
+
+def rebuild(db: Session):
+    """Recompute every product's aggregates and histogram from ``reviews``."""
+    totals = (
+        select(reviews.c.product_id, func.count().label("n"), func.sum(reviews.c.rating).label("total"))
+        .where(reviews.c.product_id.is_not(None), reviews.c.rating.in_(STARS))
+        .group_by(reviews.c.product_id)
+        .subquery()
+    )
+    db.execute(update(products).values(rating_count=0, rating_sum=0, rating_avg=0))
+    db.execute(
+        update(products)
+        .where(products.c.id == totals.c.product_id)
+        .values(rating_count=totals.c.n, rating_sum=totals.c.total, rating_avg=totals.c.total * 1.0 / totals.c.n)
+    )
+    db.execute(counts.delete())
+    db.execute(
+        counts.insert().from_select(
+            ["product_id", "rating", "count"],
+            select(reviews.c.product_id, reviews.c.rating, func.count())
+            .where(reviews.c.product_id.is_not(None), reviews.c.rating.in_(STARS))
+            .group_by(reviews.c.product_id, reviews.c.rating),
+        )
+    )
+    versioning.bump(db, "products")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.ratings", description="Maintain denormalized product ratings.")
+    parser.add_argument("command", choices=["rebuild"], help="recompute aggregates and histograms from the reviews table")
+    parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        rebuild(db)
+        db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .config import settings
+from .db import Base, SessionLocal, dialect_insert, engine
+
+orders = models.Order.__table__
+items = models.OrderItem.__table__
+products = models.Product.__table__
+pairs = models.ProductPair.__table__
+related = models.RelatedProduct.__table__
+builds = models.RelatedProductsBuild.__table__
+
+TABLE = "related_products"
+CHUNK_SIZE = 500
+_LOW = (1 << 32) - 1
+
+
+def co_occurrence(order_ids, product_ids, max_basket: int):
+    """Sparse co-occurrence matrix of the baskets given as parallel id arrays.
+
+    Returns ``(a, b, n, baskets)``: every ordered pair of products bought
+    together, diagonal included, with the number of baskets containing both,
+    and the number of baskets counted. Baskets of more than ``max_basket``
+    distinct products are skipped.
+    """
+    lines = np.unique((np.asarray(order_ids, np.int64) << 32) | np.asarray(product_ids, np.int64))
+    if not lines.size:
+        empty = np.empty(0, np.int64)
+        return empty, empty, empty, 0
+    basket, product = lines >> 32, lines & _LOW
+    sizes = np.diff(np.flatnonzero(np.r_[True, basket[1:] != basket[:-1], True]))
+    product = product[np.repeat(sizes <= max_basket, sizes)]
+    sizes = sizes[sizes <= max_basket]
+    # Line i of a basket of size s starting at line f pairs with lines f..f+s-1.
+    per_line = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(product.size), per_line)
+    offset = np.arange(left.size) - np.repeat(np.cumsum(per_line) - per_line, per_line)
+    right = np.repeat(np.repeat(np.cumsum(sizes) - sizes, sizes), per_line) + offset
+    keys, counts = np.unique((product[left] << 32) | product[right], return_counts=True)
+    return keys >> 32, keys & _LOW, counts, sizes.size
+
+
+def top_k(a, b, n, n_a, n_b, order_count: int, k: int, metric: str):
+    """Score pairs and keep each product's ``k`` best as ``(a, rank, b, score, n)``, best first."""
+    if metric == "lift":
+        score = n * order_count / (n_a * n_b)
+    else:
+        score = n / np.sqrt(n_a * n_b)
+    order = np.lexsort((b, -score, a))
+    a, b, n, score = a[order], b[order], n[order], score[order]
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]) if a.size else np.empty(0, np.int64)
+    rank = np.arange(a.size) - np.repeat(starts, np.diff(np.r_[starts, a.size]))
+    keep = rank < k
+    return a[keep], rank[keep], b[keep], score[keep], n[keep]
+
+
+def build(db: Session, full: bool = False, batch_size: int | None = None) -> tuple[int, int]:
+    """Count orders placed since the last build and re-rank the products they affect, in the caller's transaction.
+
+    Orders younger than ``related_settle_seconds`` are left to the next
+    build. New orders are read ``batch_size`` ids at a time and their pair counts
+    added to ``product_pairs``; every product paired with a product in them
+    then gets its top-K rewritten in ``related_products``. ``full`` starts
+    over from the first order, which also drops orders cancelled since they
+    were counted. Returns the number of orders counted and products ranked.
+    """
+    batch_size = batch_size or settings.related_batch_orders
+    if full:
+        for table in (pairs, related, builds):
+            db.execute(table.delete())
+    previous = db.execute(select(builds.c.last_order_id, builds.c.order_count).order_by(builds.c.id.desc()).limit(1)).first()
+    since, order_count = previous or (0, 0)
+    # Ids are handed out before commit, so a just-placed order may still be in
+    # flight below a committed higher id; stop short of the recent ones.
+    settled = datetime.utcnow() - timedelta(seconds=settings.related_settle_seconds)
+    last = max(db.scalar(select(func.max(orders.c.id)).where(orders.c.created_at <= settled)) or 0, since)
+    counted, touched = 0, []
+    for low in range(since, last, batch_size):
+        rows = db.execute(
+            select(items.c.order_id, items.c.product_id)
+            .join(orders, orders.c.id == items.c.order_id)
+            .where(orders.c.id > low, orders.c.id <= min(low + batch_size, last), orders.c.status != models.OrderStatusEnum.CANCELLED, items.c.product_id.is_not(None))
+        ).all()
+        lines = np.array(rows, np.int64).reshape(-1, 2)
+        a, b, n, baskets = co_occurrence(lines[:, 0], lines[:, 1], settings.related_max_basket)
+        _add_pairs(db, a, b, n)
+        counted += baskets
+        touched.append(np.unique(a))
+    order_count += counted
+    affected = _neighbours(db, np.unique(np.concatenate(touched)) if touched else [])
+    rank(db, affected, order_count)
+    db.execute(builds.insert().values(last_order_id=last, order_count=order_count))
+    versioning.bump(db, TABLE)
+    return counted, len(affected)
+
+
+def _add_pairs(db: Session, a, b, n):
+    rows = [{"product_id": x, "other_id": y, "orders": z} for x, y, z in zip(a.tolist(), b.tolist(), n.tolist())]
+    if not rows:
+        return
+    insert = dialect_insert(db.get_bind(), pairs)
+    db.execute(
+        insert.on_conflict_do_update(index_elements=[pairs.c.product_id, pairs.c.other_id], set_={"orders": pairs.c.orders + insert.excluded.orders}),
+        rows,
+    )
+
+
+def _neighbours(db: Session, product_ids) -> list[int]:
+    """``product_ids`` and every product bought with one of them: their scores depend on the others' order counts."""
+    found = set()
+    product_ids = [int(p) for p in product_ids]
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        found.update(db.scalars(select(pairs.c.other_id).where(pairs.c.product_id.in_(product_ids[start:start + CHUNK_SIZE]))))
+    return sorted(found)
+
+
+def rank(db: Session, product_ids: list[int], order_count: int):
+    """Rewrite the top-K of ``product_ids`` from ``product_pairs``.
+
+    With lift, products left alone keep scores computed against an older
+    ``order_count``; that scales all of a product's scores alike, so their
+    order still holds.
+    """
+    diagonal = db.execute(select(pairs.c.product_id, pairs.c.orders).where(pairs.c.product_id == pairs.c.other_id).order_by(pairs.c.product_id)).all()
+    ids, totals = np.array(diagonal, np.int64).reshape(-1, 2).T
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start:start + CHUNK_SIZE]
+        rows = db.execute(
+            select(pairs.c.product_id, pairs.c.other_id, pairs.c.orders)
+            .where(pairs.c.product_id.in_(chunk), pairs.c.other_id != pairs.c.product_id, pairs.c.orders >= settings.related_min_orders)
+        ).all()
+        a, b, n = np.array(rows, np.int64).reshape(-1, 3).T
+        n_a, n_b = totals[np.searchsorted(ids, a)], totals[np.searchsorted(ids, b)]
+        ranked = top_k(a, b, n, n_a, n_b, order_count, settings.related_top_k, settings.related_metric)
+        db.execute(related.delete().where(related.c.product_id.in_(chunk)))
+        values = [
+            {"product_id": x, "rank": r, "related_id": y, "score": s, "orders": z}
+            for x, r, y, s, z in zip(*(column.tolist() for column in ranked))
+        ]
+        if values:
+            db.execute(related.insert(), values)
+
+
+def neighbours(db: Session, product_id: int, limit: int) -> list | None:
+    """The stored recommendations for ``product_id``: one range read of the ``related_products`` key.
+
+    ``None`` if the product does not exist.
+    """
+    rows = db.execute(
+        select(products.c.id, products.c.name, products.c.price, products.c.stock, products.c.category_id, products.c.rating_avg, related.c.score, related.c.orders)
+        .join(products, products.c.id == related.c.related_id)
+        .where(related.c.product_id == product_id)
+        .order_by(related.c.rank)
+        .limit(limit)
+    ).all()
+    if not rows and db.get(models.Product, product_id) is None:
+        return None
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.related", description="Maintain the frequently-bought-together recommendations.")
+    parser.add_argument("command", choices=["build"], help="count orders placed since the last build and re-rank the products they affect")
+    parser.add_argument("--full", action="store_true", help="start over from the first order")
+    parser.add_argument("--batch-size", type=int, help=f"orders read per query (default {settings.related_batch_orders})")
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        counted, ranked = build(db, args.full, args.batch_size)
+        db.commit()
+    print(f"counted {counted} orders, ranked {ranked} products")
+
+
+if __name__ == "__main__":
+    main()
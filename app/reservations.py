@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+
+products = models.Product.__table__
+
+
+class StockReservationError(Exception):
+    def __init__(self, failures: list[dict]):
+        super().__init__(failures)
+        self.failures = failures
+
+
+def reserve_stock(db: Session, items) -> dict:
+    """Decrement stock for every line item in ``items`` or for none of them.
+
+    Products are loaded in one query and decremented with one guarded
+    ``UPDATE ... WHERE stock >= qty``, so concurrent checkouts cannot oversell.
+    Returns the product row (``price``, ``category_id``) per id. On failure raises
+    :class:`StockReservationError` listing every failed line; the caller must
+    roll back the transaction to undo any partial decrement.
+    """
+    quantities: dict[int, int] = defaultdict(int)
+    for item in items:
+        quantities[item.product_id] += item.quantity
+
+    failures = [
+        {"product_id": product_id, "requested": qty, "reason": "invalid_quantity"}
+        for product_id, qty in quantities.items()
+        if qty <= 0
+    ]
+    rows = {row.id: row for row in db.execute(select(products.c.id, products.c.price, products.c.stock, products.c.category_id).where(products.c.id.in_(quantities)))}
+    for product_id, qty in quantities.items():
+        row = rows.get(product_id)
+        if row is None:
+            failures.append({"product_id": product_id, "requested": qty, "reason": "not_found"})
+        elif qty > 0 and row.stock < qty:
+            failures.append({"product_id": product_id, "requested": qty, "available": row.stock, "reason": "insufficient_stock"})
+    if failures:
+        raise StockReservationError(failures)
+
+    requested = case(quantities, value=products.c.id)
+    reserved = set(
+        db.execute(
+            update(products)
+            .where(products.c.id.in_(quantities), products.c.stock >= requested)
+            .values(stock=products.c.stock - requested)
+            .returning(products.c.id)
+        ).scalars()
+    )
+    if len(reserved) < len(quantities):
+        # Another checkout took the stock between our read and the update.
+        lost = [product_id for product_id in quantities if product_id not in reserved]
+        current = dict(db.execute(select(products.c.id, products.c.stock).where(products.c.id.in_(lost))).all())
+        raise StockReservationError([
+            {"product_id": product_id, "requested": quantities[product_id], "available": current.get(product_id, 0), "reason": "insufficient_stock"}
+            for product_id in lost
+        ])
+    # Stock is part of every catalog page, so each order moves the products
+    # version: catalog ETags change and cached pages are rebuilt after every
+    # checkout. Not bumping would serve stale stock under a still-valid ETag.
+    versioning.bump(db, "products")
+    return rows
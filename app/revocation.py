@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, or_, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationList:
+    """In-memory view of ``blacklisted_tokens``.
+
+    A bloom filter answers the common "not revoked" case; its rare positives
+    are confirmed against the exact ``jti -> expires_at`` map. Neither touches
+    the database. Revocations made by other workers arrive through
+    :meth:`sync`.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._expiry: dict[str, datetime | None] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        # Newest created_at seen. Syncs re-read an overlap before it: ids and
+        # timestamps are not committed in order, and SQLite reuses the ids
+        # of deleted rows.
+        self._since: datetime | None = None
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._bloom and jti in self._expiry
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def add(self, jti: str, expires_at: datetime | None):
+        with self._lock:
+            self._expiry[jti] = expires_at
+            self._bloom.add(jti)
+            if len(self._expiry) > self.capacity:
+                self._rebuild()
+
+    # Rows are read before taking the lock: under the async engine the query
+    # yields to the event loop, where another request may reach this lock.
+    def load(self, db: Session):
+        rows = self._fetch(db, None, datetime.utcnow())
+        with self._lock:
+            self._apply(rows)
+            self._rebuild()
+            self.loaded = True
+
+    def sync(self, db: Session):
+        since = self._since and self._since - timedelta(seconds=settings.revocation_sync_overlap_seconds)
+        rows = self._fetch(db, since, datetime.utcnow())
+        with self._lock:
+            self._apply(rows)
+            if len(self._expiry) > self.capacity:
+                self._rebuild()
+
+    def prune(self, now: datetime):
+        with self._lock:
+            self._expiry = {jti: exp for jti, exp in self._expiry.items() if exp is None or exp > now}
+            self._rebuild()
+
+    def _fetch(self, db: Session, since: datetime | None, now: datetime) -> list:
+        token = models.BlacklistedToken
+        query = select(token.jti, token.created_at, token.expires_at).where(or_(token.expires_at.is_(None), token.expires_at > now))
+        if since is not None:
+            query = query.where(token.created_at > since)
+        return db.execute(query).all()
+
+    def _apply(self, rows):
+        for row in rows:
+            self._expiry[row.jti] = row.expires_at
+            self._bloom.add(row.jti)
+            if row.created_at is not None and (self._since is None or row.created_at > self._since):
+                self._since = row.created_at
+
+    def _rebuild(self):
+        self.capacity = max(self.capacity, 2 * len(self._expiry))
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        for jti in self._expiry:
+            self._bloom.add(jti)
+
+
+revoked = RevocationList(settings.revocation_bloom_capacity, settings.revocation_bloom_error_rate)
+
+
+@event.listens_for(Session, "after_commit")
+def _add_committed(session: Session):
+    for jti, expires_at in session.info.pop("revoked_tokens", ()):
+        revoked.add(jti, expires_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_revocations(session: Session):
+    session.info.pop("revoked_tokens", None)
+
+
+def sweep(db: Session, now: datetime | None = None) -> int:
+    """Delete rows whose tokens have expired anyway and drop them from memory."""
+    now = now or datetime.utcnow()
+    token = models.BlacklistedToken
+    # Rows written before expires_at existed are kept for one refresh lifetime.
+    legacy_cutoff = now - timedelta(minutes=settings.refresh_token_expire_minutes)
+    result = db.execute(
+        delete(token).where(
+            or_(token.expires_at < now, (token.expires_at.is_(None)) & (token.created_at < legacy_cutoff))
+        )
+    )
+    db.commit()
+    revoked.prune(now)
+    return result.rowcount
+
+
+def warm():
+    with SessionLocal() as db:
+        revoked.load(db)
+
+
+def _tick(sweep_due: bool):
+    with SessionLocal() as db:
+        revoked.sync(db)
+        if sweep_due:
+            removed = sweep(db)
+            if removed:
+                logger.info("pruned %d expired revoked tokens", removed)
+
+
+async def run_sweeper():
+    last_sweep = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.revocation_sync_seconds)
+        sweep_due = time.monotonic() - last_sweep >= settings.revocation_sweep_seconds
+        try:
+            await run_in_threadpool(_tick, sweep_due)
+        except Exception:
+            logger.exception("revoked token sweep failed")
+        if sweep_due:
+            last_sweep = time.monotonic()
@@ -0,0 +1,125 @@
+import argparse
+
+from sqlalchemy import Date, exists, func, literal, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .db import Base, SessionLocal, dialect_insert, engine
+
+orders = models.Order.__table__
+items = models.OrderItem.__table__
+daily = models.SalesDaily.__table__
+by_product = models.SalesDailyProduct.__table__
+by_category = models.SalesDailyCategory.__table__
+monthly_by_product = models.SalesMonthlyProduct.__table__
+
+CHUNK_SIZE = 500
+
+
+def order_lines(db: Session, order_ids) -> list[tuple]:
+    """``(day, order_id, total, product_id, category_id, quantity, price)`` for every line of ``order_ids``."""
+    rows = db.execute(
+        select(orders.c.created_at, orders.c.id, orders.c.total, items.c.product_id, items.c.category_id, items.c.quantity, items.c.price)
+        .join(items, items.c.order_id == orders.c.id)
+        .where(orders.c.id.in_(order_ids))
+    )
+    return [(row.created_at.date(), *row[1:]) for row in rows]
+
+
+def record(db: Session, lines, sign: int = 1):
+    """Add (``sign=1``) or subtract (``sign=-1``) whole orders' ``lines`` from the rollups in the caller's transaction.
+
+    ``lines`` are shaped like :func:`order_lines`; placing an order adds it and
+    cancelling or returning it subtracts it from the day it was placed.
+    """
+    totals: dict[tuple, list] = {}
+    net, seen = {}, set()
+    for day, order_id, total, product_id, category_id, quantity, price in lines:
+        keys = ((daily, day), (by_product, day, product_id), (monthly_by_product, day.replace(day=1), product_id), (by_category, day, category_id or 0))
+        for key in keys:
+            entry = totals.setdefault(key, [set(), 0, 0.0])
+            entry[0].add(order_id)
+            entry[1] += quantity
+            entry[2] += quantity * price
+        if order_id not in seen:
+            seen.add(order_id)
+            net[day] = net.get(day, 0.0) + (total or 0)
+    rows = {daily: [], by_product: [], monthly_by_product: [], by_category: []}
+    for (table, *key), (order_ids, units, revenue) in totals.items():
+        row = dict(zip([c.name for c in table.primary_key], key), order_count=sign * len(order_ids), units=sign * units, revenue=sign * revenue)
+        if table is daily:
+            row["net_revenue"] = sign * net[key[0]]
+        rows[table].append(row)
+    for table, values in rows.items():
+        for start in range(0, len(values), CHUNK_SIZE):
+            _accumulate(db, dialect_insert(db.get_bind(), table).values(values[start:start + CHUNK_SIZE]))
+
+
+def _accumulate(db: Session, insert):
+    table = insert.table
+    measures = [c.name for c in table.columns if not c.primary_key]
+    db.execute(insert.on_conflict_do_update(
+        index_elements=list(table.primary_key),
+        set_={name: table.c[name] + insert.excluded[name] for name in measures},
+    ))
+
+
+def rebuild(db: Session, batch_size: int | None = None) -> int:
+    """Recompute every rollup from ``orders`` in the caller's transaction.
+
+    Orders are aggregated ``batch_size`` ids at a time, each batch with one
+    ``INSERT ... SELECT ... GROUP BY`` per table, so the data never passes
+    through Python; monthly rows are then summed from the daily ones.
+    Returns the number of batches.
+    """
+    batch_size = batch_size or settings.rollup_rebuild_batch_orders
+    for table in (daily, by_product, monthly_by_product, by_category):
+        db.execute(table.delete())
+    last = db.scalar(select(func.max(orders.c.id))) or 0
+    day = func.date(orders.c.created_at)
+    zero = literal(0)
+    category = func.coalesce(items.c.category_id, 0)
+    lines = orders.join(items, items.c.order_id == orders.c.id)
+    units, revenue = func.coalesce(func.sum(items.c.quantity), 0), func.coalesce(func.sum(items.c.quantity * items.c.price), 0)
+    order_count = func.count(func.distinct(orders.c.id))
+    has_lines = exists().where(items.c.order_id == orders.c.id)
+    batches = 0
+    for low in range(0, last, batch_size):
+        # The WHERE clause is required before ON CONFLICT when upserting from a SELECT.
+        live = (orders.c.id > low) & (orders.c.id <= low + batch_size) & (orders.c.status != models.OrderStatusEnum.CANCELLED)
+        statements = [
+            (daily, ["day", "order_count", "units", "revenue", "net_revenue"], select(day, func.count(), zero, zero, func.coalesce(func.sum(orders.c.total), 0)).where(live, has_lines).group_by(day)),
+            (daily, ["day", "order_count", "units", "revenue", "net_revenue"], select(day, zero, units, revenue, zero).select_from(lines).where(live).group_by(day)),
+            (by_product, ["day", "product_id", "order_count", "units", "revenue"], select(day, items.c.product_id, order_count, units, revenue).select_from(lines).where(live).group_by(day, items.c.product_id)),
+            (by_category, ["day", "category_id", "order_count", "units", "revenue"], select(day, category, order_count, units, revenue).select_from(lines).where(live).group_by(day, category)),
+        ]
+        for table, columns, query in statements:
+            _accumulate(db, dialect_insert(db.get_bind(), table).from_select(columns, query))
+        batches += 1
+    month = _month_start(db, by_product.c.day)
+    monthly = select(month, by_product.c.product_id, func.sum(by_product.c.order_count), func.sum(by_product.c.units), func.sum(by_product.c.revenue))
+    db.execute(monthly_by_product.insert().from_select(["month", "product_id", "order_count", "units", "revenue"], monthly.group_by(month, by_product.c.product_id)))
+    return batches
+
+
+def _month_start(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("month", column).cast(Date)
+    return func.date(column, "start of month")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.rollups", description="Maintain the daily sales rollups.")
+    parser.add_argument("command", choices=["rebuild"], help="recompute every rollup from the orders table")
+    parser.add_argument("--batch-size", type=int, help=f"orders per INSERT ... SELECT (default {settings.rollup_rebuild_batch_orders})")
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        batches = rebuild(db, args.batch_size)
+        db.commit()
+    print(f"rebuilt sales rollups in {batches} batches")
+
+
+if __name__ == "__main__":
+    main()
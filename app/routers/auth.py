@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import EmailStr
 
-from .. import models, schemas, utils
-from ..db import get_db
+from starlette.concurrency import run_in_threadpool
+
+from .. import models, schemas, utils, media, outbox, cache
+from ..hashing import hasher
+from ..db import get_session
+from ..security import Identity, get_current_user
 from ..config import settings
 import os
 import uuid
@@ -14,29 +20,33 @@ from typing import Optional
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await db.scalar(select(models.User).where(models.User.email == email))
     if not user:
         return False
-    if not utils.verify_password(password, user.hashed_password):
+    valid, new_hash = await hasher.verify(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 @router.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_session)):
+    db_user = await db.scalar(select(models.User).where(models.User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = utils.get_password_hash(user.password)
+    hashed_password = await hasher.hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/token", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_session)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
@@ -46,82 +56,145 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "refresh_token": refresh_token}
 
 @router.post("/refresh", response_model=schemas.Token)
-def refresh_token(token: schemas.TokenData, db: Session = Depends(get_db)):
+async def refresh_token(token: schemas.TokenData, db: AsyncSession = Depends(get_session)):
     from jose import JWTError, jwt
     try:
         payload = jwt.decode(token.token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         jti: str = payload.get("jti")
-        if email is None:
+        if email is None or payload.get("type") != "refresh":
             raise HTTPException(status_code=401, detail="Invalid token")
-        if utils.is_token_blacklisted(db, jti):
+        if await db.run_sync(utils.is_token_blacklisted, jti):
             raise HTTPException(status_code=401, detail="Token revoked")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = await db.scalar(select(models.User).where(models.User.email == email))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    if utils.issued_before_password_change(payload, user.password_changed_at):
+        raise HTTPException(status_code=401, detail="Token revoked")
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     refresh_token_expires = timedelta(minutes=settings.refresh_token_expire_minutes)
     access_token = utils.create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
     new_refresh_token = utils.create_refresh_token(data={"sub": user.email}, expires_delta=refresh_token_expires)
-    db.add(models.BlacklistedToken(jti=jti))
-    db.commit()
+    if not await db.run_sync(utils.revoke_token, jti, payload.get("exp")):
+        # A concurrent refresh with the same token committed first.
+        await db.rollback()
+        raise HTTPException(status_code=401, detail="Token revoked")
+    await db.commit()
     return {"access_token": access_token, "refresh_token": new_refresh_token}
 
 
 @router.post("/forgot-password")
-def forgot_password(email: EmailStr, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def forgot_password(email: EmailStr, db: AsyncSession = Depends(get_session)):
+    user = await db.scalar(select(models.User).where(models.User.email == email))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     code = str(uuid.uuid4()).split("-")[0]
     user.reset_code = code
-    db.commit()
-    # Here we would send email via SMTP
+    outbox.enqueue(db, "auth.password_reset", {"user_id": user.id})
+    await db.commit()
+    outbox.notify()
     return {"detail": "OTP sent"}
 
 
 @router.post("/reset-password")
-def reset_password(email: EmailStr, code: str, new_password: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email, models.User.reset_code == code).first()
+async def reset_password(email: EmailStr, code: str, new_password: str, db: AsyncSession = Depends(get_session)):
+    user = await db.scalar(select(models.User).where(models.User.email == email, models.User.reset_code == code))
     if not user:
         raise HTTPException(status_code=400, detail="Invalid code")
-    user.hashed_password = utils.get_password_hash(new_password)
+    user.hashed_password = await hasher.hash(new_password)
     user.reset_code = None
-    db.commit()
+    user.password_changed_at = datetime.utcnow()
+    await db.commit()
+    cache.identities.invalidate(cache.user_tag(user.id))
     return {"detail": "password updated"}
 
 
 @router.post("/logout")
-def logout(token: schemas.TokenData, db: Session = Depends(get_db)):
-    db_token = models.BlacklistedToken(jti=token.token)
-    db.add(db_token)
-    db.commit()
+async def logout(token: schemas.TokenData, db: AsyncSession = Depends(get_session)):
+    from jose import ExpiredSignatureError, JWTError, jwt
+    try:
+        payload = jwt.decode(token.token, settings.secret_key, algorithms=[settings.algorithm])
+    except ExpiredSignatureError:
+        return {"detail": "logged out"}
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    await db.run_sync(utils.revoke_token, payload.get("jti"), payload.get("exp"))
+    await db.commit()
     return {"detail": "logged out"}
 
 
+@router.get("/me", response_model=schemas.User)
+async def read_me(current_user: Identity = Depends(get_current_user)):
+    return current_user
+
+
 @router.put("/profile", response_model=schemas.User)
-def update_profile(profile: schemas.User, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == profile.id).first()
+async def update_profile(profile: schemas.User, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    if profile.id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not your profile")
+    user = await db.get(models.User, current_user.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user.profile_image = profile.profile_image
-    db.commit()
-    db.refresh(user)
+    previous, released = user.profile_image, False
+    if profile.profile_image != previous:
+        try:
+            await db.run_sync(media.retain, profile.profile_image)
+        except media.UnknownMedia:
+            raise HTTPException(status_code=400, detail="Unknown media")
+        released = await db.run_sync(media.release, previous)
+        user.profile_image = profile.profile_image
+    await db.commit()
+    cache.identities.invalidate(cache.user_tag(user.id))
+    if released:
+        await _purge(db, previous)
     return user
 
 
-@router.post("/profile/image", response_model=schemas.User)
-def upload_image(user_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def _purge(db: AsyncSession, path: str):
+    # Only after the release committed: a failed commit must not leave a row
+    # pointing at a deleted file.
+    await db.run_sync(media.purge, path)
+    await db.commit()
+
+
+# The body is parsed in the handler so its size is checked as it arrives.
+_IMAGE_UPLOAD = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
+
+
+@router.post("/profile/image", response_model=schemas.User, openapi_extra=_IMAGE_UPLOAD)
+async def upload_image(request: Request, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    # Authentication may have read through this session: end that transaction
+    # and hand its connection back before a slow client trickles the file in.
+    await db.rollback()
+    try:
+        form = await media.receive_form(request, settings.media_max_upload_bytes)
+    except media.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Image too large")
+    except media.MalformedUpload as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=422, detail="file is required")
+        sha256, temp_path, size = await run_in_threadpool(media.spool, file.file, settings.media_max_upload_bytes)
+    except media.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Image too large")
+    finally:
+        await form.close()
+    user = await db.get(models.User, current_user.id)
     if not user:
+        os.unlink(temp_path)
         raise HTTPException(status_code=404, detail="User not found")
-    os.makedirs("media", exist_ok=True)
-    file_path = f"media/{uuid.uuid4().hex}_{file.filename}"
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
-    user.profile_image = file_path
-    db.commit()
-    db.refresh(user)
+    previous = user.profile_image
+    path = await db.run_sync(media.acquire, sha256, temp_path, file.filename, size, file.content_type)
+    released = await db.run_sync(media.release, previous)
+    user.profile_image = path
+    await db.commit()
+    cache.identities.invalidate(cache.user_tag(user.id))
+    if released:
+        await _purge(db, previous)
     return user
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
+from .. import models, schemas, carts, checkout, promotions, reservations
+from ..config import settings
+from ..db import get_session
+from ..security import Identity, get_current_user
+
+router = APIRouter(prefix="/cart", tags=["cart"])
+
+products = models.Product.__table__
+
+
+async def _load(db: AsyncSession, user_id: int):
+    if user_id not in carts.store:
+        await db.run_sync(carts.store.load, user_id)
+
+
+def _priced(db: Session, items: dict[int, int], promo_code: Optional[str], promos: Optional[promotions.Index]) -> dict:
+    rows = {row.id: row for row in db.execute(select(products.c.id, products.c.name, products.c.price, products.c.category_id).where(products.c.id.in_(items)))}
+    # Lines whose product was deleted are left out; checkout reports them.
+    lines = [
+        {"product_id": product_id, "name": rows[product_id].name, "quantity": quantity, "price": rows[product_id].price, "line_total": rows[product_id].price * quantity}
+        for product_id, quantity in items.items()
+        if product_id in rows
+    ]
+    subtotal = sum(line["line_total"] for line in lines)
+    view = {"items": lines, "subtotal": subtotal, "promo_code": promo_code, "discount": 0, "total": subtotal}
+    if promo_code:
+        # Usage limits are only checked when the order is placed.
+        try:
+            basket = [(line["product_id"], rows[line["product_id"]].category_id, line["price"], line["quantity"]) for line in lines]
+            _, view["discount"] = promos.quote(promo_code, basket, subtotal)
+        except promotions.PromotionError as exc:
+            view["promo_rejected"] = exc.reason
+        view["total"] = subtotal - view["discount"]
+    return view
+
+
+async def _view(db: AsyncSession, user_id: int, promo_code: Optional[str] = None) -> dict:
+    items, _ = carts.store.snapshot(user_id)
+    promos = await promotions.index(db) if promo_code else None
+    return await db.run_sync(_priced, items, promo_code, promos)
+
+
+async def _require_product(db: AsyncSession, product_id: int):
+    if await db.scalar(select(products.c.id).where(products.c.id == product_id)) is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+
+@router.get("/", response_model=schemas.Cart)
+async def view_cart(promo_code: Optional[str] = None, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    await _load(db, current_user.id)
+    return await _view(db, current_user.id, promo_code)
+
+
+@router.post("/items", response_model=schemas.Cart)
+async def add_item(item: schemas.CartItem, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    await _require_product(db, item.product_id)
+    await _load(db, current_user.id)
+    carts.store.add(current_user.id, item.product_id, item.quantity)
+    return await _view(db, current_user.id)
+
+
+@router.put("/items/{product_id}", response_model=schemas.Cart)
+async def update_item(product_id: int, quantity: int = Query(ge=0, le=settings.cart_max_quantity), current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    if quantity:
+        await _require_product(db, product_id)
+    await _load(db, current_user.id)
+    carts.store.set_quantity(current_user.id, product_id, quantity)
+    return await _view(db, current_user.id)
+
+
+@router.delete("/items/{product_id}", response_model=schemas.Cart)
+async def remove_item(product_id: int, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    await _load(db, current_user.id)
+    carts.store.set_quantity(current_user.id, product_id, 0)
+    return await _view(db, current_user.id)
+
+
+@router.post("/checkout", response_model=schemas.Order)
+async def checkout_cart(promo_code: Optional[str] = None, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    await _load(db, current_user.id)
+    items, version = carts.store.snapshot(current_user.id)
+    if not items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    lines = [schemas.OrderItem(product_id=product_id, quantity=quantity) for product_id, quantity in items.items()]
+    promos = await promotions.index(db) if promo_code else None
+    # Writing the emptied cart first claims this version: a concurrent
+    # checkout of it finds the row already at version + 1 and writes nothing.
+    # The claim commits with the order, so a restart cannot bring the cart back.
+    if not await db.run_sync(carts.write, [(current_user.id, {}, version + 1)]):
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Cart is already being checked out")
+    try:
+        order = await db.run_sync(checkout.place_order, current_user.id, lines, promo_code, promos)
+    except reservations.StockReservationError as exc:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=exc.failures)
+    except promotions.PromotionError as exc:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={"promo_code": exc.code, "reason": exc.reason})
+    await db.commit()
+    carts.store.checked_out(current_user.id, items, version)
+    checkout.placed(order)
+    return order
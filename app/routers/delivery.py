@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Query, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import schemas, slots, cache
+from ..db import get_session
+from ..security import get_current_admin
+
+router = APIRouter(prefix="/delivery", tags=["delivery"])
+
+_availability = TypeAdapter(List[schemas.SlotAvailability])
+
+
+@router.post("/slots/generate", dependencies=[Depends(get_current_admin)])
+async def generate_slots(spec: schemas.SlotGenerate, db: AsyncSession = Depends(get_session)):
+    created = await db.run_sync(slots.generate, spec.zone, spec.start_date, spec.days, spec.first_hour, spec.last_hour, spec.window_minutes, spec.capacity)
+    await db.commit()
+    cache.slots.invalidate(slots.zone_tag(spec.zone))
+    return {"created": created}
+
+
+@router.get("/slots", response_model=List[schemas.SlotAvailability])
+async def slot_availability(zone: str, start: Optional[datetime] = None, days: int = Query(7, ge=1, le=31), db: AsyncSession = Depends(get_session)):
+    # Rounded to the minute so shoppers loading the picker together share one cache entry.
+    start = (start or datetime.utcnow()).replace(second=0, microsecond=0)
+    key = (zone, start, days)
+    body = cache.slots.get(key)
+    if body is None:
+        generation = cache.slots.generation()
+        rows = await db.run_sync(slots.availability, zone, start, start + timedelta(days=days))
+        body = _availability.dump_json(_availability.validate_python(rows))
+        cache.slots.set(key, body, tags=[slots.zone_tag(zone)], generation=generation)
+    return Response(content=body, media_type="application/json")
@@ -1,84 +1,117 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..db import get_db
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from .. import models, schemas, pagination, order_status, outbox, reservations, checkout, promotions, cache, slots
+from ..db import get_session
+from ..security import Identity, get_current_admin, get_current_user
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
 @router.post("/", response_model=schemas.Order)
-def create_order(order_items: List[schemas.OrderItem], user_id: int, promo_code: str | None = None, db: Session = Depends(get_db)):
-    order = models.Order(user_id=user_id, status=models.OrderStatusEnum.PLACED)
-    db.add(order)
-    total = 0
-    for item in order_items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if not product or product.stock < item.quantity:
-            raise HTTPException(status_code=400, detail="Invalid product or not enough stock")
-        product.stock -= item.quantity
-        oi = models.OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=product.price)
-        db.add(oi)
-        total += product.price * item.quantity
-    if promo_code:
-        promo = db.query(models.PromoCode).filter(models.PromoCode.code == promo_code, models.PromoCode.active == True).first()
-        if promo:
-            total = total * (100 - promo.discount_percent) / 100
-    order.total = total
-    db.commit()
-    db.refresh(order)
+async def create_order(order_items: List[schemas.OrderItem], promo_code: str | None = None, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    promos = await promotions.index(db) if promo_code else None
+    try:
+        order = await db.run_sync(checkout.place_order, current_user.id, order_items, promo_code, promos)
+    except reservations.StockReservationError as exc:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=exc.failures)
+    except promotions.PromotionError as exc:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={"promo_code": exc.code, "reason": exc.reason})
+    await db.commit()
+    checkout.placed(order)
     return order
 
-@router.get("/{order_id}", response_model=schemas.Order)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
+@router.get("/", response_model=List[schemas.Order])
+async def list_orders(response: Response, status: Optional[models.OrderStatusEnum] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    stmt = select(models.Order).where(models.Order.user_id == current_user.id).options(selectinload(models.Order.items))
+    if status is not None:
+        stmt = stmt.where(models.Order.status == status)
+    if created_from is not None:
+        stmt = stmt.where(models.Order.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(models.Order.created_at < created_to)
+    columns = (models.Order.created_at, models.Order.id)
+    orders, next_cursor = pagination.page((await db.scalars(pagination.keyset(stmt, columns, cursor, limit, descending=True))).all(), columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
+
+async def _own_order(db: AsyncSession, order_id: int, current_user: Identity, options=()) -> models.Order:
+    """The order if the caller placed it (or is an admin); 404 otherwise, so ids of other users' orders are not revealed."""
+    order = await db.get(models.Order, order_id, options=options)
+    if not order or (order.user_id != current_user.id and not current_user.is_admin):
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
-@router.put("/{order_id}/status")
-def update_status(order_id: int, status: models.OrderStatusEnum, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    order.status = status
-    db.commit()
+@router.get("/{order_id}", response_model=schemas.Order)
+async def get_order(order_id: int, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    return await _own_order(db, order_id, current_user, [selectinload(models.Order.items)])
+
+_REJECTED = {"not_found": 404, "invalid_transition": 409, "conflict": 409}
+
+
+async def _transition(db: AsyncSession, order_id: int, status: models.OrderStatusEnum, tracking_number: Optional[str] = None, sources: dict | None = None):
+    change = schemas.StatusChange(order_id=order_id, status=status, tracking_number=tracking_number)
+    outcome, = await db.run_sync(order_status.apply, [change], sources)
+    if outcome["outcome"] in _REJECTED:
+        await db.rollback()
+        detail = "Order not found" if outcome["outcome"] == "not_found" else f"Order cannot move to {status.value}"
+        raise HTTPException(status_code=_REJECTED[outcome["outcome"]], detail=detail)
+    await db.commit()
+    outbox.notify()
+
+
+@router.post("/status", response_model=List[schemas.StatusChangeResult], dependencies=[Depends(get_current_admin)])
+async def update_statuses(changes: List[schemas.StatusChange], db: AsyncSession = Depends(get_session)):
+    outcomes = await db.run_sync(order_status.apply, changes)
+    await db.commit()
+    outbox.notify()
+    return outcomes
+
+
+@router.put("/{order_id}/status", dependencies=[Depends(get_current_admin)])
+async def update_status(order_id: int, status: models.OrderStatusEnum, tracking_number: Optional[str] = None, db: AsyncSession = Depends(get_session)):
+    await _transition(db, order_id, status, tracking_number)
     return {"detail": "status updated"}
 
 @router.post("/{order_id}/cancel")
-def cancel_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    order.status = models.OrderStatusEnum.CANCELLED
-    db.commit()
+async def cancel_order(order_id: int, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    await _own_order(db, order_id, current_user)
+    await _transition(db, order_id, models.OrderStatusEnum.CANCELLED, sources={models.OrderStatusEnum.CANCELLED: {models.OrderStatusEnum.PLACED}})
     return {"detail": "order cancelled"}
 
 
 @router.post("/{order_id}/return")
-def return_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    order.status = models.OrderStatusEnum.CANCELLED
-    db.commit()
+async def return_order(order_id: int, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    await _own_order(db, order_id, current_user)
+    await _transition(db, order_id, models.OrderStatusEnum.CANCELLED, sources={models.OrderStatusEnum.CANCELLED: {models.OrderStatusEnum.DELIVERED}})
     return {"detail": "order returned"}
 
 
 @router.get("/{order_id}/tracking")
-def track_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+async def track_order(order_id: int, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    order = await _own_order(db, order_id, current_user)
     return {"status": order.status, "tracking_number": order.tracking_number}
 
 
 @router.post("/{order_id}/slot")
-def assign_slot(order_id: int, slot_id: int, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    slot = db.query(models.DeliverySlot).filter(models.DeliverySlot.id == slot_id, models.DeliverySlot.available == True).first()
-    if not order or not slot:
-        raise HTTPException(status_code=404, detail="Order or slot not found")
-    slot.available = False
-    order.delivery_slot = slot
-    db.commit()
+async def assign_slot(order_id: int, slot_id: int, current_user: Identity = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    order = await _own_order(db, order_id, current_user)
+    try:
+        zone = await db.run_sync(slots.claim, order.id, order.delivery_slot_id, slot_id)
+    except slots.SlotUnavailable:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Slot is full, past or does not exist")
+    except slots.SlotConflict:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="The order's slot changed; try again")
+    except slots.OrderClosed:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Only placed orders can be given a slot")
+    await db.commit()
+    cache.slots.invalidate(slots.zone_tag(zone))
     return {"detail": "slot assigned"}
@@ -1,78 +1,273 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from sqlalchemy.orm import Session
+import asyncio
+import io
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
-from .. import models, schemas
-from ..db import get_db
+from .. import models, schemas, pagination, search, cache, ratings, related, catalog_io, media, serialization, versioning
+from ..cache import product_tag
+from ..db import SessionLocal, get_session
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+# Upload chunks queued between the request and the importer thread.
+IMPORT_BUFFERED_CHUNKS = 16
+
+_categories = TypeAdapter(List[schemas.Category])
+_product = TypeAdapter(schemas.Product)
+
+
+def _json(body: bytes, headers: dict | None = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.post("/categories", response_model=schemas.Category)
-def create_category(category: schemas.Category, db: Session = Depends(get_db)):
+async def create_category(category: schemas.Category, db: AsyncSession = Depends(get_session)):
     db_cat = models.Category(name=category.name)
     db.add(db_cat)
-    db.commit()
-    db.refresh(db_cat)
+    await db.run_sync(versioning.bump, "categories")
+    await db.commit()
+    cache.catalog.invalidate("categories")
     return db_cat
 
 
 @router.get("/categories", response_model=List[schemas.Category])
-def list_categories(db: Session = Depends(get_db)):
-    return db.query(models.Category).all()
+async def list_categories(request: Request, db: AsyncSession = Depends(get_session)):
+    etag = await versioning.etag(db, "categories")
+    if not_modified := versioning.not_modified(request, etag):
+        return not_modified
+    key = ("categories", etag)
+    body = cache.catalog.get(key)
+    if body is None:
+        generation = cache.catalog.generation()
+        categories = (await db.scalars(select(models.Category))).all()
+        body = _categories.dump_json(_categories.validate_python(categories, from_attributes=True))
+        cache.catalog.set(key, body, tags=["categories"], generation=generation)
+    return _json(body, versioning.cache_headers(etag))
 
-@router.get("/", response_model=List[schemas.Product])
-def list_products(q: Optional[str] = Query(None), category_id: Optional[int] = None, sort_by: str = Query("name"), db: Session = Depends(get_db)):
-    query = db.query(models.Product)
+
+@router.get("/cache-stats")
+async def cache_stats():
+    return cache.catalog.stats()
+
+_SUMMARY_CHILDREN = (("variants", serialization.variants, serialization.VARIANT_FIELDS),)
+_PRODUCT_CHILDREN = (*_SUMMARY_CHILDREN, ("reviews", serialization.reviews, serialization.REVIEW_FIELDS))
+
+
+def _product_page(db: Session, q: Optional[str], category_id: Optional[int], sort_by: Optional[str], limit: int, cursor: Optional[str], names: list[str]):
+    """Return one page of products as plain column rows plus the next cursor."""
+    query = db.query(*(models.Product.__table__.c[name] for name in names))
+    ranked = None
     if q:
-        query = query.filter(models.Product.name.ilike(f"%{q}%"))
+        if search.supported(db.get_bind()):
+            match = search.match_expression(db, q)
+            if match is None:
+                return [], None
+            ranked = search.ranked_matches(match)
+            query = query.join(ranked, ranked.c.id == models.Product.id)
+        else:
+            query = query.filter(search.fallback_filter(q))
     if category_id:
         query = query.filter(models.Product.category_id == category_id)
+    if sort_by is None:
+        sort_by = "relevance" if ranked is not None else "name"
+    if sort_by == "relevance" and ranked is not None:
+        columns = (ranked.c.score, models.Product.id)
+        rows = pagination.keyset(query.add_columns(ranked.c.score), columns, cursor, limit).all()
+        return pagination.page(rows, columns, limit, values=lambda row: (row.score, row.id))
+    if sort_by == "rating":
+        columns = (models.Product.rating_avg, models.Product.id)
+        return pagination.page(pagination.keyset(query, columns, cursor, limit, descending=True).all(), columns, limit)
     if sort_by == "price":
-        query = query.order_by(models.Product.price)
+        columns = (models.Product.price, models.Product.id)
     else:
-        query = query.order_by(models.Product.name)
-    return query.all()
+        columns = (models.Product.name, models.Product.id)
+    return pagination.page(pagination.keyset(query, columns, cursor, limit).all(), columns, limit)
+
+
+def _product_records(db: Session, names: list[str], children, *args) -> tuple[list[dict], Optional[str]]:
+    rows, next_cursor = _product_page(db, *args, names)
+    products = serialization.records(rows, names)
+    for key, table, fields in children:
+        serialization.attach(db, products, key, table, fields)
+    return products, next_cursor
+
+
+async def _cached_page(request: Request, db: AsyncSession, names: list[str], children, tables, q, category_id, sort_by, limit, cursor) -> Response:
+    etag = await versioning.etag(db, *tables)
+    if not_modified := versioning.not_modified(request, etag):
+        return not_modified
+    # Keyed by the ETag: another worker's write moves the version before this
+    # worker's copy expires, and the old body must not be served under it.
+    key = (tuple(names), q, category_id, sort_by, limit, cursor, etag)
+    cached = cache.catalog.get(key)
+    if cached is None:
+        generation = cache.catalog.generation()
+        products, next_cursor = await db.run_sync(_product_records, names, children, q, category_id, sort_by, limit, cursor)
+        cached = (to_json(products), next_cursor)
+        cache.catalog.set(key, cached, tags=["products", *(product_tag(p["id"]) for p in products)], generation=generation)
+    body, next_cursor = cached
+    headers = versioning.cache_headers(etag)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return _json(body, headers)
+
+
+@router.get("/", response_model=List[schemas.Product])
+async def list_products(request: Request, q: Optional[str] = Query(None), category_id: Optional[int] = None, sort_by: Optional[str] = Query(None, pattern="^(name|price|rating|relevance)$"), limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None, db: AsyncSession = Depends(get_session)):
+    return await _cached_page(request, db, serialization.PRODUCT_FIELDS, _PRODUCT_CHILDREN, ("products", "reviews"), q, category_id, sort_by, limit, cursor)
+
+
+@router.get("/summary", response_model=List[schemas.ProductSummary])
+async def list_product_summaries(request: Request, q: Optional[str] = Query(None), category_id: Optional[int] = None, sort_by: Optional[str] = Query(None, pattern="^(name|price|rating|relevance)$"), limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None, db: AsyncSession = Depends(get_session)):
+    return await _cached_page(request, db, serialization.SUMMARY_FIELDS, _SUMMARY_CHILDREN, ("products",), q, category_id, sort_by, limit, cursor)
 
 @router.post("/", response_model=schemas.Product)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    db_product = models.Product(**product.dict())
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_session)):
+    db_product = models.Product(**product.model_dump())
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.run_sync(versioning.bump, "products")
+    await db.commit()
+    cache.catalog.invalidate("products")
+    await db.refresh(db_product, ["variants", "reviews"])
     return db_product
 
+def _import_upload(fileobj, fmt: str) -> dict:
+    with SessionLocal() as db:
+        return catalog_io.import_products(db, catalog_io.READERS[fmt](io.BufferedReader(fileobj)))
+
+
+# The body is parsed in the handler so rows are imported as it arrives.
+_FEED_UPLOAD = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
+
+
+@router.post("/import", response_model=schemas.ImportReport, openapi_extra=_FEED_UPLOAD)
+async def import_products(request: Request, format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    """Upsert the uploaded feed while it is still arriving.
+
+    The ``file`` part is handed to the importer chunk by chunk, so each batch
+    is validated and committed as soon as its rows are in. A body that breaks
+    off keeps the batches committed before it and returns 400.
+    """
+    send, receive = anyio.create_memory_object_stream(IMPORT_BUFFERED_CHUNKS)
+
+    async def forward():
+        async with send:
+            async for chunk in media.stream_field(request, "file"):
+                await send.send(chunk)
+
+    forwarding = asyncio.ensure_future(forward())
+    try:
+        with receive:
+            report = await run_in_threadpool(_import_upload, catalog_io.ReceivedStream(receive), format)
+    except BaseException:
+        forwarding.cancel()
+        raise
+    finally:
+        cache.catalog.clear()
+    try:
+        await forwarding
+    except media.MalformedUpload as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return report
+
+
+@router.get("/export")
+async def export_products(format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="products.{format}"'}
+    return StreamingResponse(catalog_io.export_products(format), media_type=media_type, headers=headers)
+
+@router.get("/{product_id}", response_model=schemas.Product)
+async def get_product(product_id: int, request: Request, db: AsyncSession = Depends(get_session)):
+    etag = await versioning.etag(db, "products", "reviews")
+    if not_modified := versioning.not_modified(request, etag):
+        return not_modified
+    key = ("product", product_id, etag)
+    body = cache.catalog.get(key)
+    if body is None:
+        generation = cache.catalog.generation()
+        db_product = await db.get(models.Product, product_id, options=[selectinload(models.Product.variants), selectinload(models.Product.reviews)])
+        if not db_product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body = _product.dump_json(_product.validate_python(db_product, from_attributes=True))
+        cache.catalog.set(key, body, tags=[product_tag(product_id)], generation=generation)
+    return _json(body, versioning.cache_headers(etag))
+
 @router.put("/{product_id}", response_model=schemas.Product)
-def update_product(product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
+async def update_product(product_id: int, product: schemas.ProductCreate, db: AsyncSession = Depends(get_session)):
+    db_product = await db.get(models.Product, product_id, options=[selectinload(models.Product.variants), selectinload(models.Product.reviews)])
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
-    for key, value in product.dict().items():
+    for key, value in product.model_dump().items():
         setattr(db_product, key, value)
-    db.commit()
-    db.refresh(db_product)
+    await db.run_sync(versioning.bump, "products")
+    await db.commit()
+    cache.catalog.invalidate("products", product_tag(product_id))
     return db_product
 
 @router.delete("/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_session)):
+    db_product = await db.get(models.Product, product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
-    db.delete(db_product)
-    db.commit()
+    await db.run_sync(ratings.forget, product_id)
+    await db.delete(db_product)
+    await db.run_sync(versioning.bump, "products")
+    await db.commit()
+    cache.catalog.invalidate(product_tag(product_id))
     return {"detail": "deleted"}
 
 
 @router.post("/{product_id}/reviews", response_model=schemas.Review)
-def add_review(product_id: int, review: schemas.Review, db: Session = Depends(get_db)):
-    if not db.query(models.Product).filter(models.Product.id == product_id).first():
+async def add_review(product_id: int, review: schemas.ReviewCreate, db: AsyncSession = Depends(get_session)):
+    if not await db.get(models.Product, product_id):
         raise HTTPException(status_code=404, detail="Product not found")
-    db_review = models.Review(**review.dict())
+    db_review = models.Review(product_id=product_id, **review.model_dump())
     db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
+    await db.run_sync(ratings.record_review, product_id, review.rating)
+    await db.run_sync(versioning.bump, "products", "reviews")
+    await db.commit()
+    cache.catalog.invalidate("products", product_tag(product_id))
     return db_review
 
 
+@router.get("/{product_id}/rating-summary", response_model=schemas.RatingSummary)
+async def rating_summary(product_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_session)):
+    etag = await versioning.etag(db, "products")
+    if not_modified := versioning.not_modified(request, etag):
+        return not_modified
+    result = await db.run_sync(ratings.summary, product_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    response.headers.update(versioning.cache_headers(etag))
+    return result
+
+
+@router.get("/{product_id}/related", response_model=List[schemas.RelatedProduct])
+async def related_products(product_id: int, request: Request, response: Response, limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_session)):
+    etag = await versioning.etag(db, "products", related.TABLE)
+    if not_modified := versioning.not_modified(request, etag):
+        return not_modified
+    rows = await db.run_sync(related.neighbours, product_id, limit)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    response.headers.update(versioning.cache_headers(etag))
+    return rows
+
+
 @router.get("/{product_id}/reviews", response_model=List[schemas.Review])
-def list_reviews(product_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Review).filter(models.Review.product_id == product_id).all()
+async def list_reviews(product_id: int, request: Request, db: AsyncSession = Depends(get_session)):
+    etag = await versioning.etag(db, "reviews")
+    if not_modified := versioning.not_modified(request, etag):
+        return not_modified
+    return StreamingResponse(serialization.stream_reviews(product_id), media_type="application/json", headers=versioning.cache_headers(etag))
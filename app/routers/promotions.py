@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from .. import models, schemas, promotions, versioning
+from ..db import get_session
+from ..security import get_current_admin
+
+router = APIRouter(prefix="/promotions", tags=["promotions"], dependencies=[Depends(get_current_admin)])
+
+
+def _validate(promo: schemas.PromoCodeCreate):
+    if promo.product_id is not None and promo.category_id is not None:
+        raise HTTPException(status_code=422, detail="Scope a promotion to a product or a category, not both")
+    if promo.starts_at and promo.ends_at and promo.ends_at <= promo.starts_at:
+        raise HTTPException(status_code=422, detail="ends_at must be after starts_at")
+
+
+@router.get("/", response_model=List[schemas.PromoCode])
+async def list_promotions(db: AsyncSession = Depends(get_session)):
+    return (await db.scalars(select(models.PromoCode).order_by(models.PromoCode.id))).all()
+
+
+@router.post("/", response_model=schemas.PromoCode)
+async def create_promotion(promo: schemas.PromoCodeCreate, db: AsyncSession = Depends(get_session)):
+    _validate(promo)
+    if await db.scalar(select(models.PromoCode.id).where(models.PromoCode.code == promo.code)):
+        raise HTTPException(status_code=400, detail="Code already exists")
+    db_promo = models.PromoCode(**promo.model_dump(), used_count=0)
+    db.add(db_promo)
+    await db.run_sync(versioning.bump, promotions.TABLE)
+    await db.commit()
+    return db_promo
+
+
+@router.put("/{promo_id}", response_model=schemas.PromoCode)
+async def update_promotion(promo_id: int, promo: schemas.PromoCodeCreate, db: AsyncSession = Depends(get_session)):
+    _validate(promo)
+    db_promo = await db.get(models.PromoCode, promo_id)
+    if not db_promo:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+    for key, value in promo.model_dump().items():
+        setattr(db_promo, key, value)
+    await db.run_sync(versioning.bump, promotions.TABLE)
+    await db.commit()
+    return db_promo
@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import models, schemas
+from ..db import get_session
+from ..security import get_current_admin
+
+router = APIRouter(prefix="/reports", tags=["reports"], dependencies=[Depends(get_current_admin)])
+
+daily = models.SalesDaily.__table__
+by_product = models.SalesDailyProduct.__table__
+by_category = models.SalesDailyCategory.__table__
+monthly_by_product = models.SalesMonthlyProduct.__table__
+
+
+def _window(start: Optional[date], end: Optional[date]) -> tuple[date, date]:
+    """Inclusive day range, defaulting to the last 30 days."""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=422, detail="start must not be after end")
+    return start, end
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _product_rows(start: date, end: date):
+    """Per-product rows covering ``start..end``: whole months from the monthly rollup, the ends from the daily one."""
+    columns = lambda table: (table.c.product_id, table.c.order_count, table.c.units, table.c.revenue)
+    first = start if start.day == 1 else _next_month(start)
+    after = _next_month(end) if (end + timedelta(days=1)).day == 1 else end.replace(day=1)
+    if first >= after:
+        return select(*columns(by_product)).where(by_product.c.day.between(start, end)).subquery()
+    return union_all(
+        select(*columns(monthly_by_product)).where(monthly_by_product.c.month >= first, monthly_by_product.c.month < after),
+        select(*columns(by_product)).where(by_product.c.day >= start, by_product.c.day < first),
+        select(*columns(by_product)).where(by_product.c.day >= after, by_product.c.day <= end),
+    ).subquery()
+
+
+def _totals(table, key):
+    return select(key, func.sum(table.c.order_count).label("order_count"), func.sum(table.c.units).label("units"), func.sum(table.c.revenue).label("revenue"))
+
+
+@router.get("/sales/daily", response_model=List[schemas.SalesDay])
+async def sales_by_day(start: Optional[date] = None, end: Optional[date] = None, db: AsyncSession = Depends(get_session)):
+    start, end = _window(start, end)
+    rows = await db.execute(select(daily).where(daily.c.day.between(start, end)).order_by(daily.c.day))
+    return rows.mappings().all()
+
+
+@router.get("/sales/products", response_model=List[schemas.ProductSales])
+async def top_products(start: Optional[date] = None, end: Optional[date] = None, limit: int = Query(20, ge=1, le=500), db: AsyncSession = Depends(get_session)):
+    start, end = _window(start, end)
+    sales = _product_rows(start, end)
+    stmt = _totals(sales, sales.c.product_id).group_by(sales.c.product_id)
+    rows = await db.execute(stmt.order_by(func.sum(sales.c.revenue).desc(), sales.c.product_id).limit(limit))
+    return rows.mappings().all()
+
+
+@router.get("/sales/products/{product_id}", response_model=List[schemas.SalesDay])
+async def product_sales_by_day(product_id: int, start: Optional[date] = None, end: Optional[date] = None, db: AsyncSession = Depends(get_session)):
+    start, end = _window(start, end)
+    stmt = select(by_product.c.day, by_product.c.order_count, by_product.c.units, by_product.c.revenue).where(by_product.c.product_id == product_id, by_product.c.day.between(start, end))
+    return (await db.execute(stmt.order_by(by_product.c.day))).mappings().all()
+
+
+@router.get("/sales/categories", response_model=List[schemas.CategorySales])
+async def sales_by_category(start: Optional[date] = None, end: Optional[date] = None, db: AsyncSession = Depends(get_session)):
+    start, end = _window(start, end)
+    stmt = _totals(by_category, by_category.c.category_id).where(by_category.c.day.between(start, end)).group_by(by_category.c.category_id)
+    return (await db.execute(stmt.order_by(func.sum(by_category.c.revenue).desc(), by_category.c.category_id))).mappings().all()
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
-from typing import List, Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
+from typing import Dict, List, Optional
+from datetime import date, datetime
+from .models import OrderStatusEnum
 
 class Token(BaseModel):
     access_token: str
@@ -25,6 +26,7 @@ class User(UserBase):
     model_config = ConfigDict(from_attributes=True)
 
 class ProductBase(BaseModel):
+    sku: Optional[str] = None
     name: str
     description: Optional[str] = None
     price: float
@@ -36,26 +38,127 @@ class ProductCreate(ProductBase):
 
 class Product(ProductBase):
     id: int
+    rating_count: int = 0
+    rating_avg: float = 0
     variants: List["ProductVariant"] = []
     reviews: List["Review"] = []
 
     model_config = ConfigDict(from_attributes=True)
 
+class ProductSummary(BaseModel):
+    id: int
+    sku: Optional[str] = None
+    name: str
+    price: float
+    stock: int
+    category_id: Optional[int] = None
+    rating_count: int = 0
+    rating_avg: float = 0
+    variants: List["ProductVariant"] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
+class RatingSummary(BaseModel):
+    product_id: int
+    count: int
+    average: float
+    histogram: Dict[int, int]
+
+class RelatedProduct(BaseModel):
+    id: int
+    name: str
+    price: float
+    stock: int
+    category_id: Optional[int] = None
+    rating_avg: float = 0
+    score: float
+    # Orders containing both products.
+    orders: int
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[dict]
+
+class ImportReport(BaseModel):
+    rows: int
+    upserted: int
+    failed: int
+    errors: List[ImportRowError]
+
 class OrderItem(BaseModel):
     product_id: int
     quantity: int
 
+class OrderLine(OrderItem):
+    price: Optional[float] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
 class Order(BaseModel):
     id: int
     user_id: int
     status: str
     created_at: datetime
     total: float
-    items: List[OrderItem] = []
+    items: List[OrderLine] = []
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class CartItem(BaseModel):
+    product_id: int
+    quantity: int = Field(1, ge=1)
+
+class CartLine(BaseModel):
+    product_id: int
+    name: str
+    quantity: int
+    price: float
+    line_total: float
+
+class Cart(BaseModel):
+    items: List[CartLine]
+    subtotal: float
+    promo_code: Optional[str] = None
+    # Why promo_code does not apply, e.g. "expired" or "below_minimum".
+    promo_rejected: Optional[str] = None
+    discount: float = 0
+    total: float
+
+
+class SalesDay(BaseModel):
+    day: date
+    order_count: int
+    units: int
+    revenue: float
+    # Only on /reports/sales/daily: order totals after promo discounts.
+    net_revenue: Optional[float] = None
+
+class ProductSales(BaseModel):
+    product_id: int
+    order_count: int
+    units: int
+    revenue: float
+
+class CategorySales(BaseModel):
+    # 0 for products without a category.
+    category_id: int
+    order_count: int
+    units: int
+    revenue: float
+
+
+class StatusChange(BaseModel):
+    order_id: int
+    status: OrderStatusEnum
+    tracking_number: Optional[str] = None
+
+class StatusChangeResult(BaseModel):
+    order_id: int
+    outcome: str
+    status: Optional[OrderStatusEnum] = None
+
+
 class Category(BaseModel):
     id: int
     name: str
@@ -83,21 +186,59 @@ class Review(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
-class PromoCode(BaseModel):
-    id: int
+class ReviewCreate(BaseModel):
+    user_id: int
+    rating: int = Field(ge=1, le=5)
+    comment: Optional[str] = None
+
+
+class PromoCodeCreate(BaseModel):
     code: str
-    discount_percent: int
-    active: bool
+    discount_percent: int = Field(ge=1, le=100)
+    active: bool = True
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    min_subtotal: float = Field(0, ge=0)
+    product_id: Optional[int] = None
+    category_id: Optional[int] = None
+    usage_limit: Optional[int] = Field(None, ge=0)
+    per_user_limit: Optional[int] = Field(None, ge=1)
+
+class PromoCode(PromoCodeCreate):
+    id: int
+    used_count: int
 
     model_config = ConfigDict(from_attributes=True)
 
 
 class DeliverySlot(BaseModel):
     id: int
-    slot_time: str
-    available: bool
+    zone: str
+    starts_at: datetime
+    ends_at: datetime
+    capacity: int
+    booked: int
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class SlotAvailability(BaseModel):
+    id: int
+    starts_at: datetime
+    ends_at: datetime
+    capacity: int
+    remaining: int
+
+
+class SlotGenerate(BaseModel):
+    zone: str
+    start_date: date
+    days: int = Field(7, ge=1, le=31)
+    first_hour: int = Field(8, ge=0, le=23)
+    last_hour: int = Field(20, ge=1, le=24)
+    window_minutes: int = Field(60, ge=15, le=24 * 60)
+    capacity: int = Field(ge=1)
+
+
 Product.model_rebuild()
+ProductSummary.model_rebuild()
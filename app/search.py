@@ -0,0 +1,129 @@
+import re
+
+from sqlalchemy import column, func, literal_column, or_, select, table, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Name matches count ten times as much as description matches in bm25().
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_TERMS = 8
+FUZZY_MIN_LENGTH = 4
+FUZZY_MAX_CANDIDATES = 5
+# Vocabulary terms scored per prefix range, at most.
+FUZZY_SCAN_LIMIT = 200
+
+_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts_vocab USING fts5vocab(products_fts, 'row')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+)
+
+_TOKEN = re.compile(r"\w+")
+_TERM_END = "\U0010ffff"
+
+products_fts = table("products_fts", column("rowid"))
+_fts = literal_column("products_fts")
+
+
+def supported(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_index(engine):
+    """Create the FTS5 index and its sync triggers, back-filling it on first run."""
+    if not supported(engine):
+        return
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").first()
+        for ddl in _DDL:
+            conn.exec_driver_sql(ddl)
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def rebuild_index(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def ranked_matches(match: str):
+    """Subquery of ``(id, score)`` for products matching ``match``; lower scores rank higher."""
+    score = func.bm25(_fts, NAME_WEIGHT, DESCRIPTION_WEIGHT)
+    return (
+        select(products_fts.c.rowid.label("id"), score.label("score"))
+        .where(_fts.op("MATCH")(match))
+        .subquery("ranked")
+    )
+
+
+def fallback_filter(q: str):
+    pattern = f"%{q}%"
+    return or_(models.Product.name.ilike(pattern), models.Product.description.ilike(pattern))
+
+
+def match_expression(db: Session, q: str) -> str | None:
+    """Translate free text into an FTS5 query.
+
+    Every term is prefix matched. A term that prefixes nothing in the index is
+    widened with indexed terms within a small edit distance, so "bananna"
+    still finds "banana".
+    """
+    terms = [t.lower() for t in _TOKEN.findall(q)][:MAX_TERMS]
+    clauses = []
+    for term in terms:
+        alternatives = [f'"{term}"*']
+        if len(term) >= FUZZY_MIN_LENGTH and not _has_prefix(db, term):
+            alternatives += [f'"{t}"' for t in _close_terms(db, term)]
+        clauses.append(alternatives[0] if len(alternatives) == 1 else "(" + " OR ".join(alternatives) + ")")
+    return " AND ".join(clauses) or None
+
+
+def _has_prefix(db: Session, term: str) -> bool:
+    row = db.execute(
+        text("SELECT 1 FROM products_fts_vocab WHERE term >= :lo AND term < :hi LIMIT 1"),
+        {"lo": term, "hi": term + _TERM_END},
+    ).first()
+    return row is not None
+
+
+def _close_terms(db: Session, term: str) -> list[str]:
+    max_distance = 1 if len(term) <= 5 else 2
+    # Only terms sharing a two-letter prefix with the query, or with it after
+    # dropping its second letter or swapping its first two, are scored: typos
+    # past the second letter are tolerated, and each range is one short seek.
+    prefixes = dict.fromkeys([term[:2], term[0] + term[2], term[1] + term[0]])
+    scored = set()
+    for prefix in prefixes:
+        rows = db.execute(
+            text(
+                "SELECT term FROM products_fts_vocab WHERE term >= :lo AND term < :hi "
+                "AND length(term) BETWEEN :short AND :long LIMIT :limit"
+            ),
+            {"lo": prefix, "hi": prefix + _TERM_END, "short": len(term) - max_distance, "long": len(term) + max_distance, "limit": FUZZY_SCAN_LIMIT},
+        )
+        for (candidate,) in rows:
+            distance = _edit_distance(term, candidate, max_distance)
+            if distance <= max_distance:
+                scored.add((distance, candidate))
+    return [candidate for _, candidate in sorted(scored)[:FUZZY_MAX_CANDIDATES]]
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
@@ -0,0 +1,63 @@
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import cache, models, revocation, utils
+from .config import settings
+from .db import get_session
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+users = models.User.__table__
+
+
+class Identity:
+    """The columns protected routes need about the caller; cached by email."""
+
+    __slots__ = ("id", "email", "is_active", "is_admin", "profile_image", "password_changed_at")
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, getattr(row, name))
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)) -> Identity:
+    """Verify the bearer access token and resolve its user.
+
+    Revocation is answered from :data:`revocation.revoked` and the user from
+    :data:`cache.identities`, so a warm request does no database work.
+    """
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        raise _unauthorized("Invalid token")
+    email, jti = payload.get("sub"), payload.get("jti")
+    if email is None or payload.get("type") != "access":
+        raise _unauthorized("Invalid token")
+    revoked = jti in revocation.revoked if revocation.revoked.loaded else await db.run_sync(utils.is_token_blacklisted, jti)
+    if revoked:
+        raise _unauthorized("Token revoked")
+    identity = cache.identities.get(email)
+    if identity is None:
+        generation = cache.identities.generation()
+        row = (await db.execute(select(*(users.c[name] for name in Identity.__slots__)).where(users.c.email == email))).first()
+        if row is None:
+            raise _unauthorized("User not found")
+        identity = Identity(row)
+        cache.identities.set(email, identity, tags=[cache.user_tag(identity.id)], generation=generation)
+    if utils.issued_before_password_change(payload, identity.password_changed_at):
+        raise _unauthorized("Token revoked")
+    if not identity.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
+    return identity
+
+
+async def get_current_admin(current_user: Identity = Depends(get_current_user)) -> Identity:
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admins only")
+    return current_user
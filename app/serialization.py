@@ -0,0 +1,61 @@
+from collections import defaultdict
+
+from pydantic_core import to_json
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .db import SessionLocal
+
+STREAM_CHUNK = 1000
+IN_CHUNK = 500
+
+products = models.Product.__table__
+variants = models.ProductVariant.__table__
+reviews = models.Review.__table__
+
+
+def fields(schema, table) -> list[str]:
+    """The schema's fields that are plain columns of ``table``, in schema order."""
+    return [name for name in schema.model_fields if name in table.c]
+
+
+PRODUCT_FIELDS = fields(schemas.Product, products)
+SUMMARY_FIELDS = fields(schemas.ProductSummary, products)
+VARIANT_FIELDS = fields(schemas.ProductVariant, variants)
+REVIEW_FIELDS = fields(schemas.Review, reviews)
+
+
+def records(rows, names: list[str]) -> list[dict]:
+    return [dict(zip(names, row)) for row in rows]
+
+
+def attach(db: Session, parents: list[dict], key: str, table, names: list[str]):
+    """Load ``table`` rows for the parents in a few batched queries and nest them under ``key``."""
+    children = defaultdict(list)
+    ids = [parent["id"] for parent in parents]
+    columns = [table.c.product_id, *(table.c[n] for n in names)]
+    for start in range(0, len(ids), IN_CHUNK):
+        for row in db.execute(select(*columns).where(table.c.product_id.in_(ids[start:start + IN_CHUNK])).order_by(table.c.id)):
+            children[row[0]].append(dict(zip(names, row[1:])))
+    for parent in parents:
+        parent[key] = children[parent["id"]]
+
+
+def stream_reviews(product_id: int):
+    """Yield the product's reviews as one JSON array, read and encoded in id-ordered chunks."""
+    columns = [reviews.c[name] for name in REVIEW_FIELDS]
+    last_id = 0
+    yield b"["
+    with SessionLocal() as db:
+        while True:
+            rows = db.execute(
+                select(*columns).where(reviews.c.product_id == product_id, reviews.c.id > last_id).order_by(reviews.c.id).limit(STREAM_CHUNK)
+            ).all()
+            if not rows:
+                break
+            chunk = to_json(records(rows, REVIEW_FIELDS))[1:-1]
+            yield (b"," + chunk) if last_id else chunk
+            last_id = rows[-1].id
+            db.rollback()
+    yield b"]"
@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .db import dialect_insert
+
+slots = models.DeliverySlot.__table__
+orders = models.Order.__table__
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+class SlotConflict(Exception):
+    """The order's slot changed since it was read."""
+
+
+class OrderClosed(Exception):
+    """Only placed orders can book a slot; cancelling releases it for good."""
+
+
+def zone_tag(zone: str) -> str:
+    return f"zone:{zone}"
+
+
+def generate(db: Session, zone: str, start_date: date, days: int, first_hour: int, last_hour: int, window_minutes: int, capacity: int) -> int:
+    """Insert the zone's windows for ``days`` days in one statement; existing windows are kept."""
+    window = timedelta(minutes=window_minutes)
+    rows = []
+    for day in range(days):
+        midnight = datetime.combine(start_date + timedelta(days=day), datetime.min.time())
+        starts_at, closes_at = midnight + timedelta(hours=first_hour), midnight + timedelta(hours=last_hour)
+        while starts_at + window <= closes_at:
+            rows.append({"zone": zone, "starts_at": starts_at, "ends_at": starts_at + window, "capacity": capacity, "booked": 0})
+            starts_at += window
+    if not rows:
+        return 0
+    insert = dialect_insert(db.get_bind(), slots)
+    return db.execute(insert.on_conflict_do_nothing(index_elements=[slots.c.zone, slots.c.starts_at]), rows).rowcount
+
+
+def claim(db: Session, order_id: int, previous_slot_id: int | None, slot_id: int) -> str:
+    """Move the order from ``previous_slot_id``, its slot when read, to ``slot_id``.
+
+    The order moves with ``UPDATE ... WHERE delivery_slot_id IS previous AND
+    status = 'placed'``, so of two concurrent moves only one releases the old
+    slot; the other raises :class:`SlotConflict`, or :class:`OrderClosed` if
+    the order is no longer placed. The booking is one conditional
+    ``UPDATE ... WHERE booked < capacity``, so concurrent claims can never
+    overbook a window; a full slot raises :class:`SlotUnavailable`. The
+    caller must roll back on either. Returns the slot's zone.
+    """
+    if previous_slot_id == slot_id:
+        return db.execute(select(slots.c.zone).where(slots.c.id == slot_id)).scalar()
+    moved = db.execute(
+        update(orders)
+        .where(orders.c.id == order_id, orders.c.delivery_slot_id.is_not_distinct_from(previous_slot_id), orders.c.status == models.OrderStatusEnum.PLACED)
+        .values(delivery_slot_id=slot_id)
+    ).rowcount
+    if not moved:
+        if db.execute(select(orders.c.status).where(orders.c.id == order_id)).scalar() != models.OrderStatusEnum.PLACED:
+            raise OrderClosed(order_id)
+        raise SlotConflict(order_id)
+    zone = db.execute(
+        update(slots)
+        .where(slots.c.id == slot_id, slots.c.booked < slots.c.capacity, slots.c.starts_at > datetime.utcnow())
+        .values(booked=slots.c.booked + 1)
+        .returning(slots.c.zone)
+    ).scalar()
+    if zone is None:
+        raise SlotUnavailable(slot_id)
+    if previous_slot_id is not None:
+        release(db, previous_slot_id)
+    return zone
+
+
+def release(db: Session, slot_id: int) -> str | None:
+    return db.execute(
+        update(slots).where(slots.c.id == slot_id, slots.c.booked > 0).values(booked=slots.c.booked - 1).returning(slots.c.zone)
+    ).scalar()
+
+
+def availability(db: Session, zone: str, start: datetime, end: datetime) -> list[dict]:
+    """Remaining capacity of the zone's windows starting in ``[start, end)``, read off the (zone, starts_at) index."""
+    rows = db.execute(
+        select(slots.c.id, slots.c.starts_at, slots.c.ends_at, slots.c.capacity, (slots.c.capacity - slots.c.booked).label("remaining"))
+        .where(slots.c.zone == zone, slots.c.starts_at >= start, slots.c.starts_at < end)
+        .order_by(slots.c.starts_at)
+    )
+    return [dict(row._mapping) for row in rows]
@@ -1,12 +1,13 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from jose import jwt
-from passlib.context import CryptContext
 from .config import settings
+from .hashing import crypt_context
 from sqlalchemy.orm import Session
-from . import models
+from . import models, revocation
+from .db import dialect_insert
 import uuid
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = crypt_context(settings.bcrypt_rounds)
 
 
 def verify_password(plain_password, hashed_password):
@@ -24,7 +25,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
-    to_encode.update({"exp": expire, "jti": jti})
+    to_encode.update({"exp": expire, "jti": jti, "iat": timestamp(datetime.utcnow()), "type": "access"})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
@@ -36,10 +37,35 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.refresh_token_expire_minutes)
-    to_encode.update({"exp": expire, "jti": jti})
+    to_encode.update({"exp": expire, "jti": jti, "iat": timestamp(datetime.utcnow()), "type": "refresh"})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 
+def timestamp(moment: datetime) -> float:
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def issued_before_password_change(payload: dict, password_changed_at: datetime | None) -> bool:
+    return password_changed_at is not None and payload.get("iat", 0) < timestamp(password_changed_at)
+
+
 def is_token_blacklisted(db: Session, jti: str) -> bool:
-    return db.query(models.BlacklistedToken).filter(models.BlacklistedToken.jti == jti).first() is not None
+    if not revocation.revoked.loaded:
+        revocation.revoked.load(db)
+    return jti in revocation.revoked
+
+
+def revoke_token(db: Session, jti: str, exp: int | None) -> bool:
+    """Revoke ``jti`` in the caller's transaction; False if it already was.
+
+    The unique ``jti`` makes this the single-use check for refresh tokens,
+    across workers too. :data:`revocation.revoked` learns of it on commit.
+    """
+    expires_at = datetime.utcfromtimestamp(exp) if exp is not None else None
+    tokens = models.BlacklistedToken.__table__
+    insert = dialect_insert(db.get_bind(), tokens).values(jti=jti, created_at=datetime.utcnow(), expires_at=expires_at)
+    if not db.execute(insert.on_conflict_do_nothing(index_elements=[tokens.c.jti])).rowcount:
+        return False
+    db.info.setdefault("revoked_tokens", []).append((jti, expires_at))
+    return True
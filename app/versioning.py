@@ -0,0 +1,63 @@
+import time
+
+from fastapi import Request, Response
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .db import dialect_insert
+
+versions = models.TableVersion.__table__
+
+# Every worker reads all counters in one query and reuses them for
+# table_version_ttl_seconds; its own writes refresh them on commit.
+_snapshot: tuple[float, dict[str, int]] = (0.0, {})
+
+
+def bump(db: Session, *names: str):
+    """Advance the change counters of ``names`` in the caller's transaction."""
+    insert = dialect_insert(db.get_bind(), versions).values([{"name": name, "version": 1} for name in names])
+    db.execute(insert.on_conflict_do_update(index_elements=[versions.c.name], set_={"version": versions.c.version + 1}))
+    db.info["bumped_versions"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_after_bump(session: Session):
+    global _snapshot
+    if session.info.pop("bumped_versions", False):
+        _snapshot = (0.0, {})
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_bump(session: Session):
+    session.info.pop("bumped_versions", None)
+
+
+async def current(db) -> dict[str, int]:
+    global _snapshot
+    expires_at, snapshot = _snapshot
+    if expires_at <= time.monotonic():
+        snapshot = dict((await db.execute(select(versions.c.name, versions.c.version))).all())
+        _snapshot = (time.monotonic() + settings.table_version_ttl_seconds, snapshot)
+    return snapshot
+
+
+async def etag(db, *names: str) -> str:
+    snapshot = await current(db)
+    return 'W/"' + ".".join(f"{name}-{snapshot.get(name, 0)}" for name in names) + '"'
+
+
+def not_modified(request: Request, tag: str) -> Response | None:
+    """Return a 304 when the request's ``If-None-Match`` already names ``tag``."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    candidates = {value.strip().removeprefix("W/") for value in header.split(",")}
+    if "*" in candidates or tag.removeprefix("W/") in candidates:
+        return Response(status_code=304, headers=cache_headers(tag))
+    return None
+
+
+def cache_headers(tag: str) -> dict:
+    return {"ETag": tag, "Cache-Control": "no-cache"}
@@ -0,0 +1,91 @@
+"""Requests per second of a single uvicorn worker in each database mode.
+
+    python benchmarks/bench_db_modes.py --products 2000 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["/products/summary?limit=20", "/products/?limit=20&sort_by=price", "/products/categories"]
+
+
+def start_server(port: int, workdir: str, **env_overrides) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=ROOT, **env_overrides)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/products/categories", timeout=1)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"uvicorn did not start with {env_overrides}")
+
+
+async def seed(client: httpx.AsyncClient, products: int):
+    category = (await client.post("/products/categories", json={"id": 0, "name": "bench"})).json()
+    for i in range(products):
+        await client.post("/products/", json={"name": f"Product {i:06d}", "description": "benchmark item", "price": 1 + i % 97, "stock": 100, "category_id": category["id"]})
+
+
+async def hammer(client: httpx.AsyncClient, concurrency: int, duration: float) -> tuple[int, int]:
+    done = errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(offset: int):
+        nonlocal done, errors
+        i = offset
+        while time.monotonic() < deadline:
+            response = await client.get(ENDPOINTS[i % len(ENDPOINTS)])
+            i += 1
+            done += 1
+            errors += response.status_code != 200
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return done, errors
+
+
+async def run_mode(mode: str, args) -> float:
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(args.port, workdir, DATABASE_MODE=mode)
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60) as client:
+                await seed(client, args.products)
+                await hammer(client, args.concurrency, 1)
+                started = time.monotonic()
+                done, errors = await hammer(client, args.concurrency, args.duration)
+                rps = done / (time.monotonic() - started)
+        finally:
+            proc.terminate()
+            proc.wait()
+    print(f"{mode:>5}: {rps:8.1f} req/s per worker ({done} requests, {errors} errors)")
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    args = parser.parse_args()
+    for mode in args.modes:
+        asyncio.run(run_mode(mode, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Catalog latency on one uvicorn worker while a burst of logins is in flight.
+
+    python benchmarks/bench_login_storm.py --logins 32 --duration 10
+
+Each configuration is measured twice: catalog requests alone, then the same
+requests while ``--logins`` clients log in back to back.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from bench_db_modes import start_server
+
+CREDENTIALS = {"username": "storm@example.com", "password": "correct horse battery staple"}
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/products/categories")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def login_loop(client: httpx.AsyncClient, stop: asyncio.Event, counts: dict):
+    while not stop.is_set():
+        response = await client.post("/auth/token", data=CREDENTIALS)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def measure(client: httpx.AsyncClient, logins: int, duration: float):
+    stop = asyncio.Event()
+    counts: dict[int, int] = {}
+    storm = [asyncio.create_task(login_loop(client, stop, counts)) for _ in range(logins)]
+    prober = asyncio.create_task(probe(client, stop))
+    await asyncio.sleep(duration)
+    stop.set()
+    latencies = await prober
+    await asyncio.gather(*storm)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "logins": counts,
+    }
+
+
+async def run(label: str, env: dict, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(args.port, workdir, BCRYPT_ROUNDS=str(args.rounds), **env)
+        try:
+            limits = httpx.Limits(max_connections=args.logins + 4)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=120) as client:
+                await client.post("/auth/register", json={"email": CREDENTIALS["username"], "password": CREDENTIALS["password"]})
+                quiet = await measure(client, 0, args.duration)
+                storm = await measure(client, args.logins, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait()
+    print(f"{label}: idle p50 {quiet['p50_ms']:.1f} ms p99 {quiet['p99_ms']:.1f} ms | "
+          f"storm p50 {storm['p50_ms']:.1f} ms p99 {storm['p99_ms']:.1f} ms | logins {storm['logins']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2], help="PASSWORD_HASH_WORKERS values to compare")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    for workers in args.workers:
+        asyncio.run(run(f"hash workers={workers}", {"PASSWORD_HASH_WORKERS": str(workers)}, args))
+
+
+if __name__ == "__main__":
+    main()
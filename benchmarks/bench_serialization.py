@@ -0,0 +1,115 @@
+"""Latency and peak memory of the ORM + schema path versus the column-row path.
+
+    python benchmarks/bench_serialization.py --sizes 1000 10000 100000
+
+Each size is encoded twice per path: once timed (best of ``--repeat``) and
+once under tracemalloc to record the peak allocation while building the body.
+The streamed row covers the whole reviews endpoint for the largest size.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOT_PRODUCT = "~hot"
+
+
+def seed(db, models, size: int) -> int:
+    products = models.Product.__table__
+    db.execute(products.insert(), [{"name": f"Product {i:06d}", "description": "benchmark item", "price": 1 + i % 97, "stock": 100} for i in range(size)])
+    db.execute(models.ProductVariant.__table__.insert(), [{"product_id": i + 1, "name": "large", "price": 2.0, "stock": 5} for i in range(size)])
+    now = datetime.utcnow()
+    db.execute(models.Review.__table__.insert(), [{"product_id": i + 1, "user_id": 1, "rating": 1 + i % 5, "comment": "fine", "created_at": now} for i in range(size)])
+    # Sorts after every "Product ..." row, so its reviews only appear in the reviews benchmark.
+    hot = db.execute(products.insert().values(name=HOT_PRODUCT, price=1.0, stock=1)).inserted_primary_key[0]
+    db.execute(models.Review.__table__.insert(), [{"product_id": hot, "user_id": 1, "rating": 5, "comment": "great", "created_at": now} for _ in range(size)])
+    db.commit()
+    return hot
+
+
+def measure(fn, repeat: int) -> tuple[float, int, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        length = fn()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, length
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    sys.path.insert(0, ROOT)
+    from typing import List
+
+    from pydantic import TypeAdapter
+    from pydantic_core import to_json
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    from app import models, schemas, serialization
+    from app.db import Base, SessionLocal, engine
+    from app.routers.products import _PRODUCT_CHILDREN, _product_records
+
+    product_adapter = TypeAdapter(List[schemas.Product])
+    review_adapter = TypeAdapter(List[schemas.Review])
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        hot = seed(db, models, max(args.sizes))
+
+    def orm_products(size):
+        with SessionLocal() as db:
+            rows = (
+                db.query(models.Product)
+                .options(selectinload(models.Product.variants), selectinload(models.Product.reviews))
+                .order_by(models.Product.name, models.Product.id)
+                .limit(size)
+                .all()
+            )
+            return len(product_adapter.dump_json(product_adapter.validate_python(rows, from_attributes=True)))
+
+    def row_products(size):
+        with SessionLocal() as db:
+            products, _ = _product_records(db, serialization.PRODUCT_FIELDS, _PRODUCT_CHILDREN, None, None, "name", size, None)
+            return len(to_json(products))
+
+    def orm_reviews(size):
+        with SessionLocal() as db:
+            rows = db.scalars(select(models.Review).where(models.Review.product_id == hot).order_by(models.Review.id).limit(size)).all()
+            return len(review_adapter.dump_json(review_adapter.validate_python(rows, from_attributes=True)))
+
+    def row_reviews(size):
+        # The endpoint streams every review of the product; cap it at ``size`` the same way.
+        with SessionLocal() as db:
+            columns = [serialization.reviews.c[name] for name in serialization.REVIEW_FIELDS]
+            rows = db.execute(select(*columns).where(serialization.reviews.c.product_id == hot).order_by(serialization.reviews.c.id).limit(size)).all()
+            return len(to_json(serialization.records(rows, serialization.REVIEW_FIELDS)))
+
+    def streamed_reviews(size):
+        return sum(len(chunk) for chunk in serialization.stream_reviews(hot))
+
+    print(f"{'endpoint':<10}{'rows':>8}  {'path':<10}{'seconds':>10}{'peak MiB':>10}{'body KiB':>10}")
+    for size in args.sizes:
+        cases = [("products", "orm", orm_products), ("products", "rows", row_products), ("reviews", "orm", orm_reviews), ("reviews", "rows", row_reviews)]
+        if size == max(args.sizes):
+            cases.append(("reviews", "streamed", streamed_reviews))
+        for endpoint, path, fn in cases:
+            seconds, peak, length = measure(lambda: fn(size), args.repeat)
+            print(f"{endpoint:<10}{size:>8}  {path:<10}{seconds:>10.3f}{peak / 2**20:>10.1f}{length / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Per-endpoint latency, throughput and queries per request for every router.
+
+    python benchmarks/bench_suite.py --products 5000 --requests 500 --concurrency 16
+    python benchmarks/compare_results.py benchmarks/results/base.json benchmarks/results/head.json
+
+The same seeded dataset and request sequence are replayed against the app
+in-process (httpx ASGI transport) and against a local uvicorn worker. Read
+endpoints run first and writes last, so the reads see the seeded data only.
+Queries per request are counted in-process only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from bench_db_modes import ROOT, start_server
+
+PASSWORD = "benchmark-password"
+ADJECTIVES = ["fresh", "organic", "ripe", "crunchy", "sweet", "smoked", "spicy", "frozen"]
+NOUNS = ["apple", "pear", "plum", "banana", "carrot", "cheese", "bread", "salmon", "yogurt", "coffee"]
+
+
+def seed(db, models, args, password_hash: str):
+    """Bulk insert a deterministic dataset sized by the command line."""
+    rng = random.Random(args.seed)
+    now = datetime(2024, 1, 1)
+    db.execute(models.User.__table__.insert(), [{"email": f"bench{i}@example.com", "hashed_password": password_hash} for i in range(args.users)])
+    db.execute(models.Category.__table__.insert(), [{"name": f"category {i}"} for i in range(args.categories)])
+    products = []
+    for i in range(args.products):
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}"
+        products.append({"name": name, "description": f"{name} from the benchmark farm", "price": round(rng.uniform(0.5, 50), 2), "stock": 1_000_000, "category_id": 1 + i % args.categories})
+    db.execute(models.Product.__table__.insert(), products)
+    db.execute(
+        models.ProductVariant.__table__.insert(),
+        [{"product_id": p, "name": f"size {v}", "price": 1.0 + v, "stock": 100} for p in range(1, args.products + 1) for v in range(args.variants)],
+    )
+    db.execute(
+        models.Review.__table__.insert(),
+        [
+            {"product_id": p, "user_id": rng.randint(1, args.users), "rating": rng.randint(1, 5), "comment": "benchmark review", "created_at": now}
+            for p in range(1, args.products + 1)
+            for _ in range(args.reviews)
+        ],
+    )
+    orders, items = [], []
+    for i in range(args.orders):
+        lines = [(rng.randint(1, args.products), rng.randint(1, 3)) for _ in range(rng.randint(1, 4))]
+        orders.append({"user_id": 1 + i % args.users, "status": models.OrderStatusEnum.PLACED, "created_at": now + timedelta(minutes=i), "total": 10.0 * len(lines)})
+        items.extend({"order_id": i + 1, "product_id": p, "quantity": q, "price": 10.0} for p, q in lines)
+    db.execute(models.Order.__table__.insert(), orders)
+    db.execute(models.OrderItem.__table__.insert(), items)
+    db.commit()
+
+
+def endpoints(args, tokens: list[str]):
+    """``(name, share of --requests, build)``; ``build(rng)`` returns the arguments of one request.
+
+    ``tokens[i]`` is a bearer token for seeded user ``i + 1``.
+    """
+    bearer = lambda rng: {"Authorization": f"Bearer {rng.choice(tokens)}"}
+    product = lambda rng: rng.randint(1, args.products)
+
+    def own_order(suffix: str = ""):
+        # Seeded order i belongs to user 1 + (i - 1) % users.
+        def build(rng):
+            order_id = rng.randint(1, args.orders)
+            return "GET", f"/orders/{order_id}{suffix}", {"headers": {"Authorization": f"Bearer {tokens[(order_id - 1) % len(tokens)]}"}}
+        return build
+
+    return [
+        ("categories", 1, lambda rng: ("GET", "/products/categories", {})),
+        ("product_summary", 1, lambda rng: ("GET", "/products/summary", {"params": {"limit": 20, "sort_by": rng.choice(["name", "price", "rating"])}})),
+        ("product_list", 1, lambda rng: ("GET", "/products/", {"params": {"limit": 20, "sort_by": rng.choice(["name", "price", "rating"])}})),
+        ("product_search", 1, lambda rng: ("GET", "/products/summary", {"params": {"q": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}", "limit": 20}})),
+        ("product_detail", 1, lambda rng: ("GET", f"/products/{product(rng)}", {})),
+        ("product_reviews", 1, lambda rng: ("GET", f"/products/{product(rng)}/reviews", {})),
+        ("rating_summary", 1, lambda rng: ("GET", f"/products/{product(rng)}/rating-summary", {})),
+        ("order_detail", 1, own_order()),
+        ("order_tracking", 1, own_order("/tracking")),
+        ("current_user", 1, lambda rng: ("GET", "/auth/me", {"headers": bearer(rng)})),
+        ("login", 0.1, lambda rng: ("POST", "/auth/token", {"data": {"username": f"bench{rng.randrange(args.users)}@example.com", "password": PASSWORD}})),
+        ("cart_add", 1, lambda rng: ("POST", "/cart/items", {"headers": bearer(rng), "json": {"product_id": product(rng)}})),
+        ("order_create", 0.5, lambda rng: ("POST", "/orders/", {"headers": bearer(rng), "json": [{"product_id": product(rng), "quantity": 1}]})),
+    ]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float, queries: int | None) -> dict:
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "queries_per_request": None if queries is None else queries / len(latencies),
+    }
+
+
+async def drive(client: httpx.AsyncClient, calls: list, concurrency: int) -> tuple[list[float], int, float]:
+    latencies, errors = [], 0
+    pending = iter(calls)
+
+    async def worker():
+        nonlocal errors
+        for method, url, kwargs in pending:
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_target(client: httpx.AsyncClient, args, tokens: list[str], query_count=None) -> dict:
+    results = {}
+    for index, (name, share, build) in enumerate(endpoints(args, tokens)):
+        if args.only and name not in args.only:
+            continue
+        rng = random.Random(f"{args.seed}:{index}")
+        count = max(2, int(args.requests * share))
+        await drive(client, [build(rng) for _ in range(max(1, int(args.warmup * share)))], args.concurrency)
+        before = query_count() if query_count else None
+        latencies, errors, elapsed = await drive(client, [build(rng) for _ in range(count)], args.concurrency)
+        queries = query_count() - before if query_count else None
+        results[name] = summarize(latencies, errors, elapsed, queries)
+        row = results[name]
+        qpr = "-" if queries is None else f"{row['queries_per_request']:.1f}"
+        print(f"  {name:<16}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['throughput_rps']:>10.1f}{qpr:>7}{errors:>7}")
+    return results
+
+
+def header(target: str):
+    print(f"{target}:\n  {'endpoint':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>10}{'q/req':>7}{'errors':>7}")
+
+
+def git_revision() -> tuple[str, bool]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--variants", type=int, default=2, help="per product")
+    parser.add_argument("--reviews", type=int, default=5, help="per product")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300, help="per endpoint, scaled down for logins and writes")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--targets", nargs="+", default=["inprocess", "uvicorn"], choices=["inprocess", "uvicorn"])
+    parser.add_argument("--mode", default="async", choices=["sync", "async"], help="DATABASE_MODE of the app")
+    parser.add_argument("--only", nargs="+", help="endpoint names to run")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="defaults to benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="freshcart-bench-")
+    database = os.path.join(workdir, "inprocess.db")
+    os.environ.update(DATABASE_URL=f"sqlite:///{database}", DATABASE_MODE=args.mode, MEDIA_ROOT=os.path.join(workdir, "media"))
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import event
+
+    from app import models, ratings, utils
+    from app.config import settings
+    from app.db import SessionLocal, async_engine, engine
+    from app.hashing import crypt_context, hasher
+    from app.main import app
+
+    print(f"seeding {args.products} products, {args.orders} orders into {workdir}")
+    with SessionLocal() as db:
+        seed(db, models, args, crypt_context(settings.bcrypt_rounds).hash(PASSWORD))
+        ratings.rebuild(db)
+        db.commit()
+    tokens = [utils.create_access_token(data={"sub": f"bench{i}@example.com"}) for i in range(args.users)]
+    # Each target gets its own copy so writes by one never show up in the other.
+    with sqlite3.connect(database) as source, sqlite3.connect(os.path.join(workdir, "uvicorn.db")) as copy:
+        source.backup(copy)
+
+    queries = 0
+
+    def count(*_):
+        nonlocal queries
+        queries += 1
+
+    for bind in (engine, async_engine.sync_engine):
+        event.listen(bind, "before_cursor_execute", count)
+
+    commit, dirty = git_revision()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "port")},
+        "targets": {},
+    }
+
+    async def inprocess():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            return await run_target(client, args, tokens, lambda: queries)
+
+    async def served():
+        proc = start_server(args.port, workdir, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'uvicorn.db')}")
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=120) as client:
+                return await run_target(client, args, tokens)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    for target in args.targets:
+        header(target)
+        report["targets"][target] = asyncio.run(inprocess() if target == "inprocess" else served())
+    hasher.shutdown()
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compare two bench_suite.py result files endpoint by endpoint.
+
+    python benchmarks/compare_results.py base.json head.json --threshold 10
+
+Exits with status 1 when any endpoint's p95 latency grew, or its throughput
+fell, by more than ``--threshold`` percent.
+"""
+import argparse
+import json
+import sys
+
+METRICS = [("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("throughput_rps", True), ("queries_per_request", False)]
+
+
+def change(base, head) -> float | None:
+    if base is None or head is None or base == 0:
+        return None
+    return (head - base) / base * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10, help="percent")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    print(f"base {base['commit']} ({base['created_at']})  head {head['commit']} ({head['created_at']})")
+    if base["config"] != head["config"]:
+        print("warning: the runs used different configurations")
+
+    regressions = []
+    for target, endpoints in head["targets"].items():
+        print(f"{target}:")
+        for name, now in endpoints.items():
+            before = base["targets"].get(target, {}).get(name)
+            if before is None:
+                print(f"  {name:<16} new")
+                continue
+            cells = []
+            for metric, higher_is_better in METRICS:
+                delta = change(before[metric], now[metric])
+                if delta is None:
+                    continue
+                cells.append(f"{metric.split('_')[0]} {now[metric]:.1f} ({delta:+.0f}%)")
+                worse = -delta if higher_is_better else delta
+                if metric in ("p95_ms", "throughput_rps") and worse > args.threshold:
+                    regressions.append(f"{target}/{name} {metric} {delta:+.0f}%")
+            print(f"  {name:<16} " + "  ".join(cells))
+    if regressions:
+        print("regressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+# Configure the app (throwaway database, cheap bcrypt) before any test module imports it.
+_workdir = tempfile.mkdtemp(prefix="freshcart-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/test.db")
+os.environ.setdefault("MEDIA_ROOT", f"{_workdir}/media")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "1")
+os.environ.setdefault("QUERY_DIAGNOSTICS", "true")
+os.environ.setdefault("MAIL_TRANSPORT", "memory")
+
+
+@pytest.fixture
+def query_budget():
+    """``with query_budget(n):`` fails the test if the block runs more than ``n`` statements."""
+    from app import diagnostics
+
+    @contextmanager
+    def budget(limit: int):
+        with diagnostics.capture() as log:
+            yield log
+        assert log.total <= limit, f"{log.total} queries, budget {limit}:\n{log.describe()}"
+
+    return budget
+
+
+@pytest.fixture
+def auth_headers():
+    """``auth_headers(email, admin=False)`` creates the user if needed and returns a bearer header for it."""
+    from app import models, utils
+    from app.db import SessionLocal
+
+    def headers(email: str, admin: bool = False) -> dict:
+        with SessionLocal() as db:
+            if db.query(models.User).filter(models.User.email == email).first() is None:
+                db.add(models.User(email=email, hashed_password="x", is_admin=admin))
+                db.commit()
+        return {"Authorization": f"Bearer {utils.create_access_token(data={'sub': email})}"}
+
+    return headers
@@ -0,0 +1,210 @@
+import asyncio
+import io
+import os
+import time
+from datetime import datetime
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app import models, revocation, utils
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def _user(email):
+    db = SessionLocal()
+    if not db.query(models.User).filter(models.User.email == email).first():
+        db.add(models.User(email=email, hashed_password="x"))
+        db.commit()
+    db.close()
+
+def test_refresh_token_is_single_use():
+    _user("refresh@example.com")
+    token = utils.create_refresh_token(data={"sub": "refresh@example.com"})
+    assert client.post("/auth/refresh", json={"token": token}).status_code == 200
+    res = client.post("/auth/refresh", json={"token": token})
+    assert res.status_code == 401
+    assert res.json()["detail"] == "Token revoked"
+
+def test_access_tokens_cannot_be_refreshed():
+    _user("refresh-access@example.com")
+    token = utils.create_access_token(data={"sub": "refresh-access@example.com"})
+    res = client.post("/auth/refresh", json={"token": token})
+    assert res.status_code == 401
+    assert res.json()["detail"] == "Invalid token"
+
+def test_logout_revokes_by_jti_with_expiry():
+    token = utils.create_refresh_token(data={"sub": "logout@example.com"})
+    assert client.post("/auth/logout", json={"token": token}).status_code == 200
+    db = SessionLocal()
+    row = db.query(models.BlacklistedToken).order_by(models.BlacklistedToken.id.desc()).first()
+    assert len(row.jti) == 32 and row.expires_at > datetime.utcnow()
+    db.close()
+    _user("logout@example.com")
+    assert client.post("/auth/refresh", json={"token": token}).status_code == 401
+
+def test_sweep_prunes_expired_revocations():
+    db = SessionLocal()
+    utils.revoke_token(db, "expired-jti", int(time.time()) - 60)
+    db.commit()
+    assert "expired-jti" in revocation.revoked
+    assert revocation.sweep(db) >= 1
+    assert "expired-jti" not in revocation.revoked
+    assert db.query(models.BlacklistedToken).filter(models.BlacklistedToken.jti == "expired-jti").first() is None
+    db.close()
+
+def test_register_login_and_rehash_on_cost_change():
+    from app.hashing import hasher
+    assert client.post("/auth/register", json={"email": "rehash@example.com", "password": "s3cret"}).status_code == 200
+    assert client.post("/auth/token", data={"username": "rehash@example.com", "password": "wrong"}).status_code == 401
+    hasher.rounds += 1
+    try:
+        assert client.post("/auth/token", data={"username": "rehash@example.com", "password": "s3cret"}).status_code == 200
+    finally:
+        hasher.rounds -= 1
+    db = SessionLocal()
+    stored = db.query(models.User).filter(models.User.email == "rehash@example.com").first().hashed_password
+    db.close()
+    assert stored.startswith("$2b$05$")
+
+def test_password_hashing_backpressure():
+    from app.hashing import hasher
+    hasher.max_pending, limit = 0, hasher.max_pending
+    try:
+        res = client.post("/auth/register", json={"email": "busy@example.com", "password": "s3cret"})
+    finally:
+        hasher.max_pending = limit
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+
+def test_profile_images_are_content_addressed_and_collected(auth_headers):
+    from app.config import settings
+    headers = [auth_headers(email) for email in ["img1@example.com", "img2@example.com"]]
+    first = [client.post("/auth/profile/image", headers=h, files={"file": ("me.PNG", b"same-bytes")}).json() for h in headers]
+    assert first[0]["profile_image"] == first[1]["profile_image"]
+    path = first[0]["profile_image"]
+    assert path.startswith("media/") and path.endswith(".png")
+    on_disk = os.path.join(settings.media_root, path[len("media/"):])
+    served = client.get("/" + path)
+    assert served.content == b"same-bytes"
+    assert "immutable" in served.headers["cache-control"]
+    assert client.get("/" + path, headers={"If-None-Match": served.headers["etag"]}).status_code == 304
+
+    client.post("/auth/profile/image", headers=headers[0], files={"file": ("new.png", b"other-bytes")})
+    assert os.path.exists(on_disk)
+    client.post("/auth/profile/image", headers=headers[1], files={"file": ("new.png", b"other-bytes")})
+    assert not os.path.exists(on_disk)
+    assert client.get("/auth/me", headers=headers[1]).json()["profile_image"] != path
+
+def test_profile_image_size_limit(auth_headers):
+    from app.config import settings
+    headers = auth_headers("big@example.com")
+    limit, settings.media_max_upload_bytes = settings.media_max_upload_bytes, 1024
+    try:
+        res = client.post("/auth/profile/image", headers=headers, files={"file": ("big.png", b"x" * 70000)})
+    finally:
+        settings.media_max_upload_bytes = limit
+    assert res.status_code == 413
+    assert not [n for n in os.listdir(settings.media_root) if n.startswith(".upload-")]
+
+def test_oversized_uploads_are_cut_off_while_streaming(auth_headers, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "media_max_upload_bytes", 1024)
+    sent = []
+
+    async def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.png"\r\n\r\n'
+        for _ in range(100):
+            sent.append(1)
+            yield b"x" * 4096
+        yield b"\r\n--b--\r\n"
+
+    async def upload():
+        # No Content-Length: the body is sent chunked and read as it arrives.
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as async_client:
+            return await async_client.post("/auth/profile/image", headers=headers, content=body())
+
+    headers = {**auth_headers("stream@example.com"), "Content-Type": "multipart/form-data; boundary=b"}
+    assert asyncio.run(upload()).status_code == 413
+    assert len(sent) < 100
+
+def test_uploads_are_received_without_holding_a_connection(auth_headers, monkeypatch):
+    from app import cache, media
+    from app.config import settings
+    from app.db import async_engine, engine
+    pool = (async_engine.sync_engine if settings.database_mode == "async" else engine).pool
+    headers = auth_headers("slow-upload@example.com")
+    cache.identities.clear()
+    receive_form, checked_out = media.receive_form, []
+
+    async def receiving(request, max_bytes):
+        checked_out.append(pool.checkedout())
+        return await receive_form(request, max_bytes)
+
+    monkeypatch.setattr(media, "receive_form", receiving)
+    res = client.post("/auth/profile/image", headers=headers, files={"file": ("slow.png", b"slow image")})
+    assert res.status_code == 200
+    assert checked_out == [0]
+
+def test_failed_acquire_removes_the_spooled_file():
+    from app import media
+
+    class FailingSession:
+        def execute(self, *args):
+            raise RuntimeError("database is gone")
+
+    sha256, temp_path, size = media.spool(io.BytesIO(b"orphan"), 1024)
+    try:
+        media.acquire(FailingSession(), sha256, temp_path, "orphan.png", size, "image/png")
+    except RuntimeError:
+        pass
+    assert not os.path.exists(temp_path)
+
+def test_protected_routes_need_a_valid_access_token(auth_headers):
+    assert client.get("/auth/me").status_code == 401
+    assert client.get("/auth/me", headers={"Authorization": "Bearer nonsense"}).status_code == 401
+    _user("bearer@example.com")
+    refresh = utils.create_refresh_token(data={"sub": "bearer@example.com"})
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {refresh}"}).status_code == 401
+    headers = auth_headers("bearer@example.com")
+    assert client.get("/auth/me", headers=headers).json()["email"] == "bearer@example.com"
+    assert client.post("/auth/logout", json={"token": headers["Authorization"][7:]}).status_code == 200
+    assert client.get("/auth/me", headers=headers).json()["detail"] == "Token revoked"
+
+def test_identity_is_cached_until_the_user_changes(auth_headers, query_budget):
+    headers = auth_headers("cached@example.com")
+    me = client.get("/auth/me", headers=headers).json()
+    with query_budget(0):
+        assert client.get("/auth/me", headers=headers).json() == me
+
+    client.post("/auth/forgot-password", params={"email": "cached@example.com"})
+    db = SessionLocal()
+    code = db.query(models.User).filter(models.User.email == "cached@example.com").first().reset_code
+    db.close()
+    params = {"email": "cached@example.com", "code": code, "new_password": "n3w-secret"}
+    assert client.post("/auth/reset-password", params=params).status_code == 200
+    assert client.get("/auth/me", headers=headers).json()["detail"] == "Token revoked"
+    assert client.get("/auth/me", headers=auth_headers("cached@example.com")).status_code == 200
+
+def test_concurrent_refreshes_with_one_token_succeed_once():
+    _user("race@example.com")
+    token = utils.create_refresh_token(data={"sub": "race@example.com"})
+
+    async def refresh_twice():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as async_client:
+            return await asyncio.gather(*(async_client.post("/auth/refresh", json={"token": token}) for _ in range(2)))
+
+    assert sorted(res.status_code for res in asyncio.run(refresh_twice())) == [200, 401]
+
+def test_sync_sees_revocations_that_reuse_a_deleted_id():
+    replica = revocation.RevocationList(100, 0.01)
+    db = SessionLocal()
+    utils.revoke_token(db, "short-lived-jti", int(time.time()) + 60)
+    db.commit()
+    replica.sync(db)
+    db.query(models.BlacklistedToken).filter(models.BlacklistedToken.jti == "short-lived-jti").delete()
+    utils.revoke_token(db, "reused-id-jti", int(time.time()) + 60)
+    db.commit()
+    replica.sync(db)
+    assert "reused-id-jti" in replica
+    db.close()
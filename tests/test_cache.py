@@ -0,0 +1,84 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from sqlalchemy import update
+from app import models, versioning
+from app.cache import TTLCache
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def test_lru_and_ttl_eviction():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1, tags=["t"])
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+    cache.set("d", 4, tags=["t"])
+    cache.invalidate("t")
+    assert cache.get("d") is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_values_read_before_an_invalidation_are_not_stored():
+    cache = TTLCache(maxsize=2, ttl=10)
+    generation = cache.generation()
+    cache.invalidate("t")
+    cache.set("a", 1, tags=["t"], generation=generation)
+    assert cache.get("a") is None
+    cache.set("a", 1, tags=["u"], generation=generation)
+    assert cache.get("a") == 1
+    cache.set("b", 2, tags=["t"], generation=cache.generation())
+    assert cache.get("b") == 2
+    # Past maxsize the per-tag record is dropped and every older read refused.
+    generation = cache.generation()
+    cache.invalidate("v", "w")
+    cache.set("c", 3, tags=["x"], generation=generation)
+    assert cache.get("c") is None
+
+def test_catalog_reads_are_invalidated_by_writes(auth_headers):
+    product = client.post("/products/", json={"name": "Cached Plum", "price": 1.0, "stock": 4}).json()
+    assert client.get(f"/products/{product['id']}").json()["stock"] == 4
+    hits = client.get("/products/cache-stats").json()["hits"]
+    assert client.get(f"/products/{product['id']}").json()["stock"] == 4
+    assert client.get("/products/cache-stats").json()["hits"] == hits + 1
+
+    client.post("/orders/", json=[{"product_id": product["id"], "quantity": 1}], headers=auth_headers("buyer@example.com"))
+    assert client.get(f"/products/{product['id']}").json()["stock"] == 3
+    client.post(f"/products/{product['id']}/reviews", json={"user_id": 1, "rating": 4})
+    assert len(client.get(f"/products/{product['id']}").json()["reviews"]) == 1
+
+    listing = client.get("/products/", params={"q": "plum"}).json()
+    client.put(f"/products/{product['id']}", json={"name": "Cached Damson", "price": 1.0, "stock": 3})
+    assert listing != client.get("/products/", params={"q": "plum"}).json()
+    assert client.get("/products/", params={"q": "damson"}).json()[0]["id"] == product["id"]
+
+def test_catalog_reads_support_conditional_get():
+    first = client.get("/products/categories")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+    again = client.get("/products/categories", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and again.content == b""
+
+    client.post("/products/categories", json={"id": 0, "name": "Conditional"})
+    changed = client.get("/products/categories", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    listing = client.get("/products/summary")
+    client.post("/products/", json={"name": "Conditional Fig", "price": 2.0, "stock": 1})
+    assert client.get("/products/summary", headers={"If-None-Match": listing.headers["etag"]}).status_code == 200
+
+def test_another_workers_write_is_not_served_under_its_etag():
+    product = client.post("/products/", json={"name": "Remote Quince", "price": 1.0, "stock": 4}).json()
+    first = client.get(f"/products/{product['id']}")
+    # What another worker does: change the row and the version, but not this worker's cache.
+    with SessionLocal() as db:
+        db.execute(update(models.Product).where(models.Product.id == product["id"]).values(stock=9))
+        versioning.bump(db, "products")
+        db.commit()
+    again = client.get(f"/products/{product['id']}")
+    assert again.headers["etag"] != first.headers["etag"] and again.json()["stock"] == 9
@@ -1 +1,74 @@
-# placeholder for cart tests
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app import carts
+from app.config import settings
+
+client = TestClient(app)
+
+def _product(name, price, stock=10):
+    return client.post("/products/", json={"name": name, "description": "", "price": price, "stock": stock}).json()["id"]
+
+def test_cart_edits_and_promo_preview(auth_headers):
+    headers = auth_headers("cart@example.com")
+    apple, kiwi = _product("Cart Apple", 2.0), _product("Cart Kiwi", 0.5)
+    client.post("/promotions/", json={"code": "CART10", "discount_percent": 10}, headers=auth_headers("admin@example.com", admin=True))
+
+    client.post("/cart/items", json={"product_id": apple, "quantity": 2}, headers=headers)
+    client.post("/cart/items", json={"product_id": apple}, headers=headers)
+    cart = client.post("/cart/items", json={"product_id": kiwi, "quantity": 4}, headers=headers).json()
+    assert [(line["product_id"], line["quantity"]) for line in cart["items"]] == [(apple, 3), (kiwi, 4)]
+    assert cart["subtotal"] == cart["total"] == 8.0
+    assert client.get("/cart/", params={"promo_code": "CART10"}, headers=headers).json()["total"] == 7.2
+
+    assert client.put(f"/cart/items/{kiwi}", params={"quantity": 1}, headers=headers).json()["subtotal"] == 6.5
+    assert client.delete(f"/cart/items/{apple}", headers=headers).json()["items"][0]["product_id"] == kiwi
+    assert client.post("/cart/items", json={"product_id": 999999}, headers=headers).status_code == 404
+    assert client.get("/cart/").status_code == 401
+
+def test_cart_writes_are_batched_and_rehydrated(auth_headers, query_budget, monkeypatch):
+    headers = auth_headers("lazy@example.com")
+    pear = _product("Cart Pear", 1.0)
+    client.get("/cart/", headers=headers)
+    with query_budget(10) as log:
+        for _ in range(5):
+            client.post("/cart/items", json={"product_id": pear}, headers=headers)
+    assert not [shape for shape in log.shapes if "carts" in shape]
+    assert carts.flush() >= 1
+
+    monkeypatch.setattr(carts, "store", carts.CartStore(settings.cart_max_entries))
+    assert client.get("/cart/", headers=headers).json()["items"][0]["quantity"] == 5
+
+def test_checkout_turns_the_cart_into_an_order(auth_headers, monkeypatch):
+    headers = auth_headers("checkout@example.com")
+    fig, plum = _product("Cart Fig", 3.0, stock=2), _product("Cart Plum", 1.0)
+    assert client.post("/cart/checkout", headers=headers).status_code == 400
+    client.post("/cart/items", json={"product_id": fig, "quantity": 3}, headers=headers)
+    res = client.post("/cart/checkout", headers=headers)
+    assert res.status_code == 400 and res.json()["detail"][0]["reason"] == "insufficient_stock"
+
+    client.put(f"/cart/items/{fig}", params={"quantity": 2}, headers=headers)
+    client.post("/cart/items", json={"product_id": plum}, headers=headers)
+    order = client.post("/cart/checkout", headers=headers).json()
+    assert order["total"] == 7.0
+    assert sorted((item["product_id"], item["quantity"]) for item in order["items"]) == [(fig, 2), (plum, 1)]
+    assert client.get("/cart/", headers=headers).json()["items"] == []
+
+    carts.flush()
+    monkeypatch.setattr(carts, "store", carts.CartStore(settings.cart_max_entries))
+    assert client.get("/cart/", headers=headers).json()["items"] == []
+
+def test_concurrent_checkouts_place_one_order(auth_headers):
+    headers = auth_headers("double@example.com")
+    melon = _product("Cart Melon", 2.0, stock=50)
+    client.post("/cart/items", json={"product_id": melon, "quantity": 3}, headers=headers)
+
+    async def checkout_three_times():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as async_client:
+            return await asyncio.gather(*(async_client.post("/cart/checkout", headers=headers) for _ in range(3)))
+
+    codes = sorted(res.status_code for res in asyncio.run(checkout_three_times()))
+    assert codes[0] == 200 and 200 not in codes[1:]
+    assert client.get(f"/products/{melon}").json()["stock"] == 47
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app import models, slots
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def _generate(zone, capacity, headers):
+    spec = {"zone": zone, "start_date": str(date.today() + timedelta(days=1)), "days": 7, "first_hour": 9, "last_hour": 12, "window_minutes": 60, "capacity": capacity}
+    return client.post("/delivery/slots/generate", json=spec, headers=headers).json()
+
+def _orders(n):
+    db = SessionLocal()
+    orders = [models.Order(user_id=1) for _ in range(n)]
+    db.add_all(orders)
+    db.commit()
+    ids = [o.id for o in orders]
+    db.close()
+    return ids
+
+def test_generate_week_is_idempotent_and_listed_by_zone(auth_headers):
+    admin = auth_headers("slots-admin@example.com", admin=True)
+    assert _generate("north", 3, admin) == {"created": 21}
+    assert _generate("north", 3, admin) == {"created": 0}
+    assert _generate("north", 3, auth_headers("slots-shopper@example.com"))["detail"] == "Admins only"
+    windows = client.get("/delivery/slots", params={"zone": "north", "start": str(datetime.combine(date.today(), datetime.min.time())), "days": 8}).json()
+    assert len(windows) == 21 and all(w["remaining"] == 3 for w in windows)
+    assert windows[0]["starts_at"] < windows[1]["starts_at"]
+
+def test_claims_never_overbook_and_move_between_slots(auth_headers):
+    admin = auth_headers("slots-admin@example.com", admin=True)
+    _generate("east", 2, admin)
+    first, second = [w["id"] for w in client.get("/delivery/slots", params={"zone": "east"}).json()[:2]]
+    order_ids = _orders(6)
+
+    def claim(order_id):
+        db = SessionLocal()
+        try:
+            slots.claim(db, order_id, None, first)
+            db.commit()
+            return True
+        except slots.SlotUnavailable:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(claim, order_ids))
+    assert results.count(True) == 2
+    loser = order_ids[results.index(False)]
+    assert client.post(f"/orders/{loser}/slot", params={"slot_id": first}, headers=admin).status_code == 409
+
+    winner = order_ids[results.index(True)]
+    assert client.post(f"/orders/{winner}/slot", params={"slot_id": second}, headers=admin).status_code == 200
+    assert client.post(f"/orders/{loser}/slot", params={"slot_id": first}, headers=admin).status_code == 200
+    db = SessionLocal()
+    assert db.get(models.DeliverySlot, first).booked == 2
+    assert db.get(models.DeliverySlot, second).booked == 1
+    db.close()
+
+def test_concurrent_moves_release_the_old_slot_once(auth_headers):
+    _generate("west", 5, auth_headers("slots-admin@example.com", admin=True))
+    old, *targets = [w["id"] for w in client.get("/delivery/slots", params={"zone": "west"}).json()[:3]]
+    order_id, = _orders(1)
+    db = SessionLocal()
+    slots.claim(db, order_id, None, old)
+    db.commit()
+    db.close()
+
+    def move(slot_id):
+        db = SessionLocal()
+        try:
+            slots.claim(db, order_id, old, slot_id)
+            db.commit()
+            return True
+        except slots.SlotConflict:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert sorted(pool.map(move, targets)) == [False, True]
+    db = SessionLocal()
+    assert [db.get(models.DeliverySlot, slot_id).booked for slot_id in (old, *targets)].count(1) == 1
+    assert db.get(models.DeliverySlot, old).booked == 0
+    db.close()
+
+def test_cancelled_orders_cannot_book_a_slot(auth_headers):
+    admin = auth_headers("slots-admin@example.com", admin=True)
+    _generate("south", 2, admin)
+    slot_id = client.get("/delivery/slots", params={"zone": "south"}).json()[0]["id"]
+    order_id, = _orders(1)
+    assert client.post(f"/orders/{order_id}/slot", params={"slot_id": slot_id}, headers=admin).status_code == 200
+    assert client.post(f"/orders/{order_id}/cancel", headers=admin).status_code == 200
+    res = client.post(f"/orders/{order_id}/slot", params={"slot_id": slot_id}, headers=admin)
+    assert res.status_code == 409 and res.json()["detail"] == "Only placed orders can be given a slot"
+    db = SessionLocal()
+    assert db.get(models.DeliverySlot, slot_id).booked == 0
+    assert db.get(models.Order, order_id).delivery_slot_id is None
+    db.close()
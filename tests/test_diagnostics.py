@@ -0,0 +1,46 @@
+import logging
+from fastapi.testclient import TestClient
+from app.main import app
+from app import cache, diagnostics, models
+from app.config import settings
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def test_shapes_ignore_values():
+    assert diagnostics.shape("SELECT * FROM t WHERE id IN (?, ?, ?) AND name = 'x'") == diagnostics.shape("SELECT *  FROM t\nWHERE id IN (?) AND name = 'y'")
+
+def test_lazy_loads_are_attributed_to_their_relationship():
+    db = SessionLocal()
+    for _ in range(3):
+        order = models.Order(user_id=1)
+        db.add(order)
+        db.add(models.OrderItem(order=order, product_id=1, quantity=1))
+    db.commit()
+    db.close()
+    db = SessionLocal()
+    with diagnostics.capture() as log:
+        for order in db.query(models.Order).limit(3):
+            order.items
+    db.close()
+    (statement, count, relationship), = log.repeated(3)
+    assert count == 3 and relationship == "Order.items" and "FROM order_items" in statement
+
+def test_catalog_requests_stay_within_query_budget(query_budget, auth_headers):
+    for i in range(5):
+        product = client.post("/products/", json={"name": f"Budget Bean {i}", "price": 1.0, "stock": 1}).json()
+        client.post(f"/products/{product['id']}/reviews", json={"user_id": 1, "rating": 5})
+    cache.catalog.clear()
+    with query_budget(6):
+        assert client.get("/products/", params={"q": "budget bean"}).status_code == 200
+    admin = auth_headers("budget-admin@example.com", admin=True)
+    client.get("/auth/me", headers=admin)
+    with query_budget(3):
+        client.get(f"/orders/{1}", headers=admin)
+
+def test_slow_queries_are_logged_with_plan(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "slow_query_ms", 0)
+    cache.catalog.clear()
+    with caplog.at_level(logging.WARNING, logger="app.diagnostics"):
+        client.get("/products/categories", headers={"If-None-Match": "none"})
+    assert any("slow query" in r.message and "SCAN" in r.message for r in caplog.records)
@@ -0,0 +1,38 @@
+import json
+import re
+from fastapi.testclient import TestClient
+from app.main import app
+from app import metrics
+from app.config import settings
+
+client = TestClient(app)
+
+def _value(text, name, **labels):
+    wanted = metrics._labels(**labels) if labels else ""
+    for line in text.splitlines():
+        if line.startswith(name + wanted + " "):
+            return float(line.split()[-1])
+    return 0.0
+
+def test_metrics_are_recorded_per_route_template():
+    product = client.post("/products/", json={"name": "Metered Kiwi", "price": 1.0, "stock": 1}).json()
+    before = client.get("/metrics").text
+    client.get(f"/products/{product['id']}", headers={"If-None-Match": "none"})
+    client.get("/products/999999")
+    text = client.get("/metrics").text
+    route = {"method": "GET", "route": "/products/{product_id}"}
+    assert _value(text, "freshcart_http_requests_total", **route, status="404") == _value(before, "freshcart_http_requests_total", **route, status="404") + 1
+    assert _value(text, "freshcart_http_request_duration_seconds_count", **route) >= 2
+    assert _value(text, "freshcart_db_queries_total", **route) > _value(before, "freshcart_db_queries_total", **route)
+    assert re.search(r"^freshcart_catalog_cache_hits_total \d+$", text, re.M)
+
+def test_metrics_sum_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_dir", str(tmp_path))
+    other = {"routes": [{"method": "GET", "route": "/elsewhere", "buckets": [1] + [0] * len(metrics.BUCKETS), "sum": 0.001, "statuses": {"200": 1}, "queries": 3, "db_seconds": 0.0005}], "cache": {"hits": 7}}
+    (tmp_path / "1.json").write_text(json.dumps(other))
+    client.get("/metrics")
+    metrics.write_snapshot()
+    text = client.get("/metrics").text
+    assert _value(text, "freshcart_http_requests_total", method="GET", route="/elsewhere", status="200") == 1
+    assert _value(text, "freshcart_db_queries_total", method="GET", route="/elsewhere") == 3
+    assert _value(text, "freshcart_catalog_cache_hits_total") >= 7
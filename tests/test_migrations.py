@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine, inspect
+from app import migrations
+
+def test_upgrade_adds_columns_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO users (email) VALUES ('old@example.com')")
+        conn.exec_driver_sql("CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR, price FLOAT, category_id INTEGER)")
+        conn.exec_driver_sql("INSERT INTO products (name, category_id) VALUES ('Old Apple', 7)")
+        conn.exec_driver_sql("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, delivery_slot_id INTEGER)")
+        conn.exec_driver_sql("INSERT INTO orders (user_id, delivery_slot_id) VALUES (1, 1)")
+        conn.exec_driver_sql("CREATE TABLE delivery_slots (id INTEGER PRIMARY KEY, slot_time VARCHAR, available BOOLEAN, order_id INTEGER)")
+        conn.exec_driver_sql("INSERT INTO delivery_slots (slot_time, available, order_id) VALUES ('Mon 9-11', 0, 1)")
+        conn.exec_driver_sql("CREATE TABLE blacklisted_tokens (id INTEGER PRIMARY KEY, jti VARCHAR UNIQUE, created_at DATETIME)")
+        conn.exec_driver_sql("CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER, quantity INTEGER, price FLOAT)")
+        conn.exec_driver_sql("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (1, 1, 2, 1.0)")
+        conn.exec_driver_sql("CREATE TABLE promocodes (id INTEGER PRIMARY KEY, code VARCHAR UNIQUE, discount_percent INTEGER, active BOOLEAN)")
+        conn.exec_driver_sql("INSERT INTO promocodes (code, discount_percent, active) VALUES ('OLD10', 10, 1)")
+    migrations.upgrade(engine)
+    migrations.upgrade(engine)
+    assert "password_changed_at" in {c["name"] for c in inspect(engine).get_columns("users")}
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT email, password_changed_at FROM users").one() == ("old@example.com", None)
+        assert conn.exec_driver_sql("SELECT rating_count, rating_avg FROM products").one() == (0, 0)
+        assert conn.exec_driver_sql("SELECT min_subtotal, used_count, usage_limit FROM promocodes").one() == (0, 0, None)
+        assert conn.exec_driver_sql("SELECT category_id FROM order_items").scalar() == 7
+        assert conn.exec_driver_sql("SELECT delivery_slot_id FROM orders").scalar() is None
+        assert conn.exec_driver_sql("SELECT slot_time FROM delivery_slots_legacy").scalar() == "Mon 9-11"
+    assert "zone" in {c["name"] for c in inspect(engine).get_columns("delivery_slots")}
+    assert "ix_blacklisted_tokens_expires_at" in {i["name"] for i in inspect(engine).get_indexes("blacklisted_tokens")}
+    assert {"ix_products_rating_avg_id", "ix_products_sku"} <= {i["name"] for i in inspect(engine).get_indexes("products")}
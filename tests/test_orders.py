@@ -1,14 +1,95 @@
 from fastapi.testclient import TestClient
 from app.main import app
+from app import schemas
 
 client = TestClient(app)
 
-def test_create_order():
+def test_create_order(auth_headers):
     client.post("/products/", json={"name": "Orange", "description": "", "price": 2.0, "stock": 5})
-    response = client.post("/orders/", json=[{"product_id": 1, "quantity": 1}], params={"user_id": 1})
+    response = client.post("/orders/", json=[{"product_id": 1, "quantity": 1}], headers=auth_headers("buyer@example.com"))
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "placed"
 
-    track = client.get(f"/orders/{data['id']}/tracking")
+    track = client.get(f"/orders/{data['id']}/tracking", headers=auth_headers("buyer@example.com"))
     assert track.status_code == 200
+    assert client.get(f"/orders/{data['id']}/tracking").status_code == 401
+    assert client.get(f"/orders/{data['id']}", headers=auth_headers("snoop@example.com")).status_code == 404
+    assert client.post(f"/orders/{data['id']}/cancel", headers=auth_headers("snoop@example.com")).status_code == 404
+
+def test_order_reports_every_failed_item(auth_headers):
+    product = client.post("/products/", json={"name": "Pear", "description": "", "price": 1.0, "stock": 2}).json()
+    response = client.post("/orders/", json=[{"product_id": product["id"], "quantity": 3}, {"product_id": 999999, "quantity": 1}], headers=auth_headers("buyer@example.com"))
+    assert response.status_code == 400
+    reasons = {f["product_id"]: f["reason"] for f in response.json()["detail"]}
+    assert reasons == {product["id"]: "insufficient_stock", 999999: "not_found"}
+    res = client.get("/products/summary", params={"q": "pear"})
+    assert [p["stock"] for p in res.json() if p["id"] == product["id"]] == [2]
+
+def test_hot_sku_never_oversells():
+    from concurrent.futures import ThreadPoolExecutor
+    from app import models, reservations
+    from app.db import SessionLocal
+
+    product = client.post("/products/", json={"name": "Hot Sauce", "description": "", "price": 3.0, "stock": 10}).json()
+
+    def checkout(_):
+        db = SessionLocal()
+        try:
+            reservations.reserve_stock(db, [schemas.OrderItem(product_id=product["id"], quantity=1)])
+            db.commit()
+            return True
+        except reservations.StockReservationError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(checkout, range(40)))
+    assert results.count(True) == 10
+    db = SessionLocal()
+    assert db.get(models.Product, product["id"]).stock == 0
+    db.close()
+
+def test_order_history_pages_newest_first(query_budget, auth_headers):
+    headers = auth_headers("history@example.com")
+    product = client.post("/products/", json={"name": "History Fig", "description": "", "price": 2.5, "stock": 50}).json()
+    placed = [client.post("/orders/", json=[{"product_id": product["id"], "quantity": 1}], headers=headers).json()["id"] for _ in range(5)]
+    seen, cursor = [], None
+    while True:
+        with query_budget(3):
+            res = client.get("/orders/", params={"limit": 2, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        seen += res.json()
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [o["id"] for o in seen] == placed[::-1]
+    assert seen[0]["items"] == [{"product_id": product["id"], "quantity": 1, "price": 2.5}]
+    assert client.get("/orders/", params={"status": "shipped"}, headers=headers).json() == []
+    assert len(client.get("/orders/", params={"created_from": seen[0]["created_at"]}, headers=headers).json()) == 1
+
+def test_status_transitions_are_validated(auth_headers):
+    headers = auth_headers("buyer@example.com")
+    product = client.post("/products/", json={"name": "Wave Melon", "description": "", "price": 1.0, "stock": 20}).json()
+    ids = [client.post("/orders/", json=[{"product_id": product["id"], "quantity": 1}], headers=headers).json()["id"] for _ in range(4)]
+    changes = [
+        {"order_id": ids[0], "status": "shipped", "tracking_number": "TRK-1"},
+        {"order_id": ids[1], "status": "delivered"},
+        {"order_id": ids[2], "status": "cancelled"},
+        {"order_id": ids[2], "status": "shipped"},
+        {"order_id": 999999, "status": "shipped"},
+    ]
+    admin = auth_headers("orders-admin@example.com", admin=True)
+    assert client.post("/orders/status", json=changes, headers=headers).status_code == 403
+    outcomes = client.post("/orders/status", json=changes, headers=admin).json()
+    assert [o["outcome"] for o in outcomes] == ["updated", "invalid_transition", "updated", "duplicate", "not_found"]
+    assert client.get(f"/orders/{ids[0]}/tracking", headers=headers).json() == {"status": "shipped", "tracking_number": "TRK-1"}
+
+    assert client.post(f"/orders/{ids[0]}/cancel", headers=headers).status_code == 409
+    assert client.post(f"/orders/{ids[3]}/return", headers=headers).status_code == 409
+    assert client.post(f"/orders/{ids[3]}/cancel", headers=headers).status_code == 200
+    assert client.put(f"/orders/{ids[0]}/status", params={"status": "delivered"}, headers=headers).status_code == 403
+    assert client.put(f"/orders/{ids[0]}/status", params={"status": "delivered"}, headers=admin).status_code == 200
+    assert client.post(f"/orders/{ids[0]}/return", headers=headers).status_code == 200
+    assert client.get(f"/orders/{ids[0]}", headers=headers).json()["status"] == "cancelled"
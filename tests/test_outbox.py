@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app import models, outbox
+from app.config import settings
+from app.db import SessionLocal
+from app.mail import mailer
+
+client = TestClient(app)
+
+def _drain():
+    while asyncio.run(outbox.drain_once()):
+        pass
+
+def _message(topic):
+    db = SessionLocal()
+    message = db.query(models.OutboxMessage).filter(models.OutboxMessage.topic == topic).order_by(models.OutboxMessage.id.desc()).first()
+    db.close()
+    return message
+
+def test_reset_code_is_mailed_after_commit():
+    db = SessionLocal()
+    db.add(models.User(email="outbox@example.com", hashed_password="x"))
+    db.commit()
+    db.close()
+    assert client.post("/auth/forgot-password", params={"email": "outbox@example.com"}).status_code == 200
+    assert _message("auth.password_reset").status == "pending"
+    _drain()
+    sent = [m for m in mailer.outbox if m["To"] == "outbox@example.com" and "reset" in m["Subject"]]
+    db = SessionLocal()
+    code = db.query(models.User).filter(models.User.email == "outbox@example.com").first().reset_code
+    db.close()
+    assert code in sent[-1].get_content()
+    assert _message("auth.password_reset").status == "sent"
+    assert code not in _message("auth.password_reset").payload
+
+def test_failed_deliveries_back_off_then_dead_letter(monkeypatch):
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise ConnectionError("smtp down")
+
+    monkeypatch.setitem(outbox.handlers, "test.flaky", flaky)
+    monkeypatch.setattr(settings, "outbox_max_attempts", 3)
+    db = SessionLocal()
+    outbox.enqueue(db, "test.flaky", {"n": 1})
+    db.commit()
+    db.close()
+    for attempt in (1, 2):
+        _drain()
+        message = _message("test.flaky")
+        assert (message.status, message.attempts) == ("pending", attempt)
+        assert message.available_at > datetime.utcnow() and "smtp down" in message.last_error
+        db = SessionLocal()
+        db.get(models.OutboxMessage, message.id).available_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        db.close()
+    _drain()
+    assert _message("test.flaky").status == "sent" and len(calls) == 3
+
+    def broken(payload):
+        raise RuntimeError("bad address")
+
+    monkeypatch.setitem(outbox.handlers, "test.broken", broken)
+    monkeypatch.setattr(settings, "outbox_max_attempts", 1)
+    db = SessionLocal()
+    outbox.enqueue(db, "test.broken", {})
+    db.commit()
+    db.close()
+    _drain()
+    assert _message("test.broken").status == "dead"
+
+def test_order_events_are_queued_with_the_change(auth_headers):
+    product = client.post("/products/", json={"name": "Outbox Lime", "description": "", "price": 1.0, "stock": 5}).json()
+    headers = auth_headers("buyer@example.com")
+    order = client.post("/orders/", json=[{"product_id": product["id"], "quantity": 1}], headers=headers).json()
+    assert f'"order_id": {order["id"]}' in _message("order.placed").payload
+    client.post("/orders/status", json=[{"order_id": order["id"], "status": "shipped", "tracking_number": "TRK-9"}], headers=auth_headers("outbox-admin@example.com", admin=True))
+    assert '"tracking_number": "TRK-9"' in _message("order.status_changed").payload
+    client.post(f"/orders/{order['id']}/cancel", headers=headers)
+    assert '"status": "shipped"' in _message("order.status_changed").payload
+
+def test_sent_messages_are_purged_after_the_retention_period(monkeypatch):
+    monkeypatch.setitem(outbox.handlers, "test.purged", lambda payload: None)
+    db = SessionLocal()
+    for _ in range(2):
+        outbox.enqueue(db, "test.purged", {})
+    outbox.enqueue(db, "test.unsent", {})
+    db.commit()
+    db.close()
+    _drain()
+    db = SessionLocal()
+    old = db.query(models.OutboxMessage).filter(models.OutboxMessage.topic == "test.purged").first()
+    old.sent_at = datetime.utcnow() - timedelta(days=settings.outbox_retention_days + 1)
+    db.commit()
+    db.close()
+    assert outbox._purge_sent() == 1
+    db = SessionLocal()
+    assert db.query(models.OutboxMessage).filter(models.OutboxMessage.topic.in_(["test.purged", "test.unsent"])).count() == 2
+    db.close()
@@ -1,5 +1,11 @@
+import asyncio
+import json
+import httpx
 from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
 from app.main import app
+from app import catalog_io, models
+from app.db import SessionLocal
 
 client = TestClient(app)
 
@@ -23,3 +29,151 @@ def test_list_products():
     response = client.get("/products/")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
+
+def test_paginate_products():
+    import uuid
+    category = client.post("/products/categories", json={"id": 0, "name": f"paging-{uuid.uuid4().hex}"}).json()
+    for name, price in [("Kiwi", 3.0), ("Lime", 1.0), ("Mango", 2.0)]:
+        client.post("/products/", json={"name": name, "price": price, "stock": 1, "category_id": category["id"]})
+    for sort_by, expected in [("name", ["Kiwi", "Lime", "Mango"]), ("price", ["Lime", "Mango", "Kiwi"])]:
+        seen, cursor = [], None
+        while True:
+            params = {"category_id": category["id"], "sort_by": sort_by, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            res = client.get("/products/summary", params=params)
+            assert res.status_code == 200
+            assert all("reviews" not in p for p in res.json())
+            seen += [p["name"] for p in res.json()]
+            cursor = res.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == expected
+
+def test_invalid_cursor():
+    res = client.get("/products/", params={"cursor": "not-a-cursor"})
+    assert res.status_code == 400
+
+def test_full_text_search():
+    created = client.post("/products/", json={"name": "Quinoa Flakes", "description": "Organic wholegrain breakfast", "price": 4.0, "stock": 3}).json()
+    client.post("/products/", json={"name": "Wholegrain Quinoa", "description": "", "price": 5.0, "stock": 3})
+    for q in ["wholegrain", "quin", "qiunoa flakes", "uqinoa", "breakfst"]:
+        res = client.get("/products/", params={"q": q})
+        assert created["id"] in [p["id"] for p in res.json()], q
+    ranked = client.get("/products/", params={"q": "wholegrain"}).json()
+    assert ranked[0]["name"] == "Wholegrain Quinoa"
+
+    client.put(f"/products/{created['id']}", json={"name": "Millet Flakes", "description": "", "price": 4.0, "stock": 3})
+    assert created["id"] not in [p["id"] for p in client.get("/products/", params={"q": "breakfast"}).json()]
+    assert created["id"] in [p["id"] for p in client.get("/products/", params={"q": "millet"}).json()]
+    client.delete(f"/products/{created['id']}")
+    assert created["id"] not in [p["id"] for p in client.get("/products/", params={"q": "millet"}).json()]
+
+def test_rating_aggregates_and_sorting():
+    import uuid
+    from app import models, ratings
+    from app.db import SessionLocal
+    category = client.post("/products/categories", json={"id": 0, "name": f"rated-{uuid.uuid4().hex}"}).json()
+    ids = [client.post("/products/", json={"name": n, "price": 1.0, "stock": 1, "category_id": category["id"]}).json()["id"] for n in ["Fig", "Date", "Yuzu"]]
+    for product_id, stars in zip(ids, [[5, 4], [2], []]):
+        for rating in stars:
+            assert client.post(f"/products/{product_id}/reviews", json={"user_id": 1, "rating": rating}).status_code == 200
+    assert client.post(f"/products/{ids[0]}/reviews", json={"user_id": 1, "rating": 6}).status_code == 422
+
+    summary = client.get(f"/products/{ids[0]}/rating-summary").json()
+    assert summary["count"] == 2 and summary["average"] == 4.5
+    assert summary["histogram"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1}
+    ranked = client.get("/products/summary", params={"category_id": category["id"], "sort_by": "rating", "limit": 1})
+    second = client.get("/products/summary", params={"category_id": category["id"], "sort_by": "rating", "limit": 5, "cursor": ranked.headers["X-Next-Cursor"]})
+    assert [p["id"] for p in ranked.json() + second.json()] == ids
+
+    db = SessionLocal()
+    db.query(models.Product).filter(models.Product.id == ids[0]).update({"rating_count": 0, "rating_sum": 0, "rating_avg": 0})
+    db.commit()
+    ratings.rebuild(db)
+    db.commit()
+    rebuilt = ratings.summary(db, ids[0])
+    assert (rebuilt["count"], rebuilt["average"], rebuilt["histogram"][4], rebuilt["histogram"][5]) == (2, 4.5, 1, 1)
+    db.close()
+
+def test_bulk_import_and_export(monkeypatch):
+    feed = "sku,name,description,price,stock\nBULK-1,Bulk Rice,,2.5,10\nBULK-2,Bulk Oats,rolled,1.25,4\nBULK-3,,missing name,1,1\nBULK-4,Bulk Lentils,,cheap,1\n"
+    res = client.post("/products/import", files={"file": ("feed.csv", feed)})
+    assert res.status_code == 200
+    report = res.json()
+    assert (report["rows"], report["upserted"], report["failed"]) == (4, 2, 2)
+    assert [e["row"] for e in report["errors"]] == [4, 5]
+
+    update = '{"sku": "BULK-1", "name": "Bulk Basmati", "price": 3.0, "stock": 7}\n{"name": "No Sku", "price": 1, "stock": 1}\n'
+    report = client.post("/products/import", params={"format": "ndjson"}, files={"file": ("feed.ndjson", update)}).json()
+    assert (report["upserted"], report["failed"]) == (1, 1)
+    assert [p["name"] for p in client.get("/products/", params={"q": "basmati"}).json()] == ["Bulk Basmati"]
+
+    upsert = catalog_io._upsert
+    def rejecting(db, batch):
+        if any(values["sku"] == "BULK-6" for values in batch):
+            raise DBAPIError("INSERT", None, Exception("rejected"))
+        return upsert(db, batch)
+    monkeypatch.setattr(catalog_io, "_upsert", rejecting)
+    rejected = '{"sku": "BULK-5", "name": "Bulk Barley", "price": 1, "stock": 1}\n{"sku": "BULK-6", "name": "Bulk Spelt", "price": 1, "stock": 1}\n'
+    res = client.post("/products/import", params={"format": "ndjson"}, files={"file": ("feed.ndjson", rejected)})
+    assert res.status_code == 200
+    assert (res.json()["upserted"], res.json()["failed"]) == (1, 1)
+    assert res.json()["errors"] == [{"row": 2, "errors": [{"type": "database_error", "msg": "rejected"}]}]
+    monkeypatch.undo()
+
+    exported = client.get("/products/export", params={"format": "ndjson"})
+    assert exported.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in exported.text.splitlines()]
+    assert {"BULK-1", "BULK-2"} <= {row["sku"] for row in rows}
+    csv_lines = client.get("/products/export").text.splitlines()
+    assert csv_lines[0] == "id,sku,name,description,price,stock,category_id"
+    assert len(csv_lines) == len(rows) + 1
+
+def test_import_commits_rows_while_the_upload_arrives(monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "import_batch_size", 2)
+    committed_early = []
+
+    def stored(sku):
+        with SessionLocal() as db:
+            return db.query(models.Product).filter(models.Product.sku == sku).first() is not None
+
+    async def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="feed.ndjson"\r\n\r\n'
+        yield b'{"sku": "LIVE-1", "name": "Live Rye", "price": 1, "stock": 1}\n{"sku": "LIVE-2", "name": "Live Spelt", "price": 1, "stock": 1}\n'
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if stored("LIVE-2"):
+                committed_early.append(True)
+                break
+        yield b'{"sku": "LIVE-3", "name": "Live Emmer", "price": 1, "stock": 1}\n\r\n--b--\r\n'
+
+    async def upload(content, content_type="multipart/form-data; boundary=b"):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as async_client:
+            return await async_client.post("/products/import", params={"format": "ndjson"}, headers={"Content-Type": content_type}, content=content)
+
+    res = asyncio.run(upload(body()))
+    assert res.status_code == 200 and res.json()["upserted"] == 3
+    assert committed_early and stored("LIVE-3")
+    missing = asyncio.run(upload(b'--b\r\nContent-Disposition: form-data; name="other"\r\n\r\nx\r\n--b--\r\n'))
+    assert missing.status_code == 400 and missing.json()["detail"] == "file is required"
+    assert asyncio.run(upload(b"{}", "application/json")).status_code == 400
+
+def test_reviews_stream_in_chunks(monkeypatch):
+    from app import serialization
+    monkeypatch.setattr(serialization, "STREAM_CHUNK", 2)
+    product = client.post("/products/", json={"name": "Streamed Pear", "price": 1.0, "stock": 1}).json()
+    assert client.get(f"/products/{product['id']}/reviews").json() == []
+    for rating in [1, 2, 3, 4, 5]:
+        client.post(f"/products/{product['id']}/reviews", json={"user_id": 1, "rating": rating, "comment": f"r{rating}"})
+    reviews = client.get(f"/products/{product['id']}/reviews").json()
+    assert [r["rating"] for r in reviews] == [1, 2, 3, 4, 5]
+    assert reviews == client.get(f"/products/{product['id']}").json()["reviews"]
+
+def test_delete_product_drops_its_rating_histogram():
+    product = client.post("/products/", json={"name": "Short-lived Plum", "price": 1.0, "stock": 1}).json()
+    client.post(f"/products/{product['id']}/reviews", json={"user_id": 1, "rating": 3})
+    assert client.delete(f"/products/{product['id']}").status_code == 200
+    with SessionLocal() as db:
+        assert db.query(models.ProductRatingCount).filter_by(product_id=product["id"]).count() == 0
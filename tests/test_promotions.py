@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app import models, promotions
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def _promo(admin, **fields):
+    res = client.post("/promotions/", json={"discount_percent": 10, **fields}, headers=admin)
+    assert res.status_code == 200, res.text
+    return res.json()
+
+def test_promotion_rules_are_evaluated_in_memory(auth_headers, query_budget):
+    admin, headers = auth_headers("promo-admin@example.com", admin=True), auth_headers("promo-shopper@example.com")
+    assert client.post("/promotions/", json={"code": "NOPE", "discount_percent": 5}, headers=headers).status_code == 403
+    category = client.post("/products/categories", json={"id": 0, "name": "Promo Dairy"}).json()
+    milk = client.post("/products/", json={"name": "Promo Milk", "price": 2.0, "stock": 50, "category_id": category["id"]}).json()["id"]
+    bread = client.post("/products/", json={"name": "Promo Bread", "price": 3.0, "stock": 50}).json()["id"]
+    now = datetime.utcnow()
+    _promo(admin, code="DAIRY50", discount_percent=50, category_id=category["id"])
+    _promo(admin, code="BREAD", product_id=bread)
+    _promo(admin, code="BIG", min_subtotal=100)
+    _promo(admin, code="LATER", starts_at=(now + timedelta(days=1)).isoformat())
+    _promo(admin, code="OVER", ends_at=(now - timedelta(days=1)).isoformat())
+    client.post("/cart/items", json={"product_id": milk, "quantity": 2}, headers=headers)
+    client.post("/cart/items", json={"product_id": bread}, headers=headers)
+
+    client.get("/cart/", params={"promo_code": "DAIRY50"}, headers=headers)
+    with query_budget(1):
+        cart = client.get("/cart/", params={"promo_code": "DAIRY50"}, headers=headers).json()
+    assert (cart["subtotal"], cart["discount"], cart["total"]) == (7.0, 2.0, 5.0)
+    assert client.get("/cart/", params={"promo_code": "BREAD"}, headers=headers).json()["discount"] == 0.3
+    rejected = {code: client.get("/cart/", params={"promo_code": code}, headers=headers).json()["promo_rejected"] for code in ["BIG", "LATER", "OVER", "MISSING"]}
+    assert rejected == {"BIG": "below_minimum", "LATER": "not_started", "OVER": "expired", "MISSING": "unknown"}
+
+    promo = client.get("/promotions/", headers=admin).json()
+    big = next(p for p in promo if p["code"] == "BIG")
+    client.put(f"/promotions/{big['id']}", json={**big, "min_subtotal": 5}, headers=admin)
+    assert client.get("/cart/", params={"promo_code": "BIG"}, headers=headers).json()["discount"] == 0.7
+
+def test_usage_limits_are_counted_atomically(auth_headers):
+    admin = auth_headers("promo-admin@example.com", admin=True)
+    shoppers = [auth_headers(f"limited{i}@example.com") for i in range(2)]
+    product = client.post("/products/", json={"name": "Promo Tea", "price": 10.0, "stock": 100}).json()["id"]
+    _promo(admin, code="ONCE", per_user_limit=1)
+    order = lambda headers, code: client.post("/orders/", json=[{"product_id": product, "quantity": 1}], params={"promo_code": code}, headers=headers)
+    assert order(shoppers[0], "ONCE").json()["total"] == 9.0
+    res = order(shoppers[0], "ONCE")
+    assert res.status_code == 400 and res.json()["detail"]["reason"] == "user_limit_reached"
+    assert order(shoppers[1], "ONCE").status_code == 200
+
+    with SessionLocal() as db:
+        rule = promotions.Rule(db.get(models.PromoCode, _promo(admin, code="FEW", usage_limit=3)["id"]))
+
+    def redeem(user_id):
+        db = SessionLocal()
+        try:
+            promotions.redeem(db, rule, user_id)
+            db.commit()
+            return True
+        except promotions.PromotionError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(redeem, range(20))).count(True) == 3
+    assert order(shoppers[1], "FEW").json()["detail"]["reason"] == "exhausted"
@@ -0,0 +1,61 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app import related
+from app.config import settings
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def _build(full=False):
+    with SessionLocal() as db:
+        result = related.build(db, full=full, batch_size=3)
+        db.commit()
+    return result
+
+def _stored(product_ids):
+    with SessionLocal() as db:
+        return db.execute(related.related.select().where(related.related.c.product_id.in_(product_ids)).order_by("product_id", "rank")).all()
+
+def test_co_occurrence_counts_each_basket_once():
+    a, b, n, baskets = related.co_occurrence([1, 1, 1, 2, 2, 3], [10, 20, 10, 10, 20, 30], max_basket=50)
+    assert baskets == 3
+    assert list(zip(a.tolist(), b.tolist(), n.tolist())) == [(10, 10, 2), (10, 20, 2), (20, 10, 2), (20, 20, 2), (30, 30, 1)]
+    assert related.co_occurrence([1, 1, 2], [10, 20, 10], max_basket=1)[3] == 1
+
+def test_related_products_follow_new_orders(auth_headers, query_budget, monkeypatch):
+    monkeypatch.setattr(settings, "related_settle_seconds", 0)
+    headers = auth_headers("related@example.com")
+    milk, bread, butter, jam = (client.post("/products/", json={"name": f"Related {name}", "price": 1.0, "stock": 100}).json()["id"] for name in ("Milk", "Bread", "Butter", "Jam"))
+    def order(*product_ids):
+        return client.post("/orders/", json=[{"product_id": p, "quantity": 1} for p in product_ids], headers=headers).json()["id"]
+    for basket in [(milk, bread)] * 3 + [(milk, butter)] * 2 + [(bread, jam)]:
+        order(*basket)
+    client.post(f"/orders/{order(milk, jam)}/cancel", headers=headers)
+    _build()
+
+    with query_budget(2):
+        res = client.get(f"/products/{milk}/related")
+    assert [(p["id"], p["orders"]) for p in res.json()] == [(bread, 3), (butter, 2)]
+    assert abs(res.json()[0]["score"] - 3 / (5 * 4) ** 0.5) < 1e-9
+    # Bought together once only: below related_min_orders.
+    assert client.get(f"/products/{jam}/related").json() == []
+    assert client.get("/products/999999/related").status_code == 404
+    assert client.get(f"/products/{milk}/related", headers={"If-None-Match": res.headers["ETag"]}).status_code == 304
+
+    for _ in range(3):
+        order(milk, butter)
+    counted, _ = _build()
+    assert counted == 3
+    assert [p["id"] for p in client.get(f"/products/{milk}/related").json()] == [butter, bread]
+    assert [p["id"] for p in client.get(f"/products/{milk}/related", params={"limit": 1}).json()] == [butter]
+
+    incremental = _stored([milk, bread, butter, jam])
+    _build(full=True)
+    assert _stored([milk, bread, butter, jam]) == incremental
+
+    # Too recent to count yet: a lower id might still be committing.
+    monkeypatch.setattr(settings, "related_settle_seconds", 300)
+    order(milk, jam)
+    assert _build()[0] == 0
+    monkeypatch.setattr(settings, "related_settle_seconds", 0)
+    assert _build()[0] == 1
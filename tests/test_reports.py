@@ -0,0 +1,53 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app import rollups
+from app.db import SessionLocal
+
+client = TestClient(app)
+
+def _rollups(product_ids, category_id):
+    with SessionLocal() as db:
+        return (
+            db.execute(rollups.by_product.select().where(rollups.by_product.c.product_id.in_(product_ids)).order_by("product_id")).all(),
+            db.execute(rollups.monthly_by_product.select().where(rollups.monthly_by_product.c.product_id.in_(product_ids)).order_by("product_id")).all(),
+            db.execute(rollups.by_category.select().where(rollups.by_category.c.category_id == category_id)).all(),
+        )
+
+def test_rollups_follow_orders_and_match_a_rebuild(auth_headers, query_budget):
+    admin, headers = auth_headers("reports-admin@example.com", admin=True), auth_headers("reports-shopper@example.com")
+    category = client.post("/products/categories", json={"id": 0, "name": "Report Greens"}).json()
+    kale = client.post("/products/", json={"name": "Report Kale", "price": 4.0, "stock": 100, "category_id": category["id"]}).json()["id"]
+    leek = client.post("/products/", json={"name": "Report Leek", "price": 1.5, "stock": 100, "category_id": category["id"]}).json()["id"]
+    before = {p["product_id"]: p for p in client.get("/reports/sales/products", headers=admin).json()}
+    ids = [client.post("/orders/", json=[{"product_id": kale, "quantity": 2}, {"product_id": leek, "quantity": n}], headers=headers).json()["id"] for n in (1, 2, 3)]
+    client.post(f"/orders/{ids[0]}/cancel", headers=headers)
+    client.post("/orders/status", json=[{"order_id": ids[1], "status": "shipped"}], headers=admin)
+    client.post("/orders/status", json=[{"order_id": ids[1], "status": "delivered"}], headers=admin)
+    client.post(f"/orders/{ids[1]}/return", headers=headers)
+
+    with query_budget(2):
+        top = {p["product_id"]: p for p in client.get("/reports/sales/products", headers=admin).json()}
+    assert top[kale]["units"] - before.get(kale, {}).get("units", 0) == 2
+    assert top[leek]["revenue"] - before.get(leek, {}).get("revenue", 0) == 4.5
+    greens = [c for c in client.get("/reports/sales/categories", headers=admin).json() if c["category_id"] == category["id"]]
+    assert greens == [{"category_id": category["id"], "order_count": 1, "units": 5, "revenue": 12.5}]
+    assert client.get(f"/reports/sales/products/{kale}", headers=admin).json()[0]["order_count"] == 1
+    assert client.get("/reports/sales/daily", headers=headers).status_code == 403
+
+    # Other tests insert orders directly, so only this test's rows are compared.
+    incremental = _rollups([kale, leek], category["id"])
+    with SessionLocal() as db:
+        assert rollups.rebuild(db, batch_size=2) >= 2
+        db.commit()
+    assert _rollups([kale, leek], category["id"]) == incremental
+
+def test_cancelling_after_a_product_moves_category_subtracts_where_it_was_added(auth_headers):
+    admin, headers = auth_headers("reports-admin@example.com", admin=True), auth_headers("reports-mover@example.com")
+    fruit, veg = (client.post("/products/categories", json={"id": 0, "name": name}).json()["id"] for name in ("Report Fruit", "Report Veg"))
+    tomato = client.post("/products/", json={"name": "Report Tomato", "price": 2.0, "stock": 100, "category_id": fruit}).json()
+    order_id = client.post("/orders/", json=[{"product_id": tomato["id"], "quantity": 3}], headers=headers).json()["id"]
+    client.put(f"/products/{tomato['id']}", json={**tomato, "category_id": veg})
+    client.post(f"/orders/{order_id}/cancel", headers=headers)
+
+    moved = {c["category_id"]: c for c in client.get("/reports/sales/categories", headers=admin).json() if c["category_id"] in (fruit, veg)}
+    assert moved == {fruit: {"category_id": fruit, "order_count": 0, "units": 0, "revenue": 0}}